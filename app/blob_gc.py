@@ -0,0 +1,31 @@
+# app/blob_gc.py
+"""
+Maintenance for the content-addressed video store.
+Usage:
+  python -m app.blob_gc                    # delete unreferenced blobs older than BLOB_GC_MIN_AGE_SECONDS
+  python -m app.blob_gc --import-legacy    # first move app/static/compressed/<job_id>.mp4 copies in
+"""
+import argparse
+
+from app import db
+from app.services.blob_store import BLOB_GC_MIN_AGE_SECONDS, BlobStore
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import legacy videos and garbage-collect blobs")
+    parser.add_argument("--import-legacy", action="store_true", help="deduplicate app/static/compressed into the store")
+    parser.add_argument("--min-age", type=int, default=BLOB_GC_MIN_AGE_SECONDS, help="seconds before an orphan is removed")
+    args = parser.parse_args()
+
+    db.init_db()
+    store = BlobStore()
+    if args.import_legacy:
+        imported, saved = store.import_legacy()
+        print(f"✅ imported {imported} legacy videos, {saved / 1e6:.1f} MB deduplicated")
+    removed, freed = store.gc(args.min_age)
+    print(f"✅ gc removed {removed} files, {freed / 1e6:.1f} MB freed")
+    print(store.snapshot())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,43 +1,57 @@
 # app/db.py
-import sqlite3
 import os
+from typing import List, Optional, Tuple
+from app.storage import SQLiteDB, epoch_ms
+from app.migrations import JOBS_MIGRATIONS, migrate
 
 DB_PATH = os.getenv("DB_PATH", "jobs.db")
 
+_db = SQLiteDB(DB_PATH)
+
 def get_connection():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """This thread's pooled connection to jobs.db (do not close it)."""
+    return _db.connection()
 
 def init_db():
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS jobs (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id TEXT,
-        job_id TEXT UNIQUE,
-        prompt TEXT,
-        final_prompt TEXT,
-        status TEXT,
-        video_url TEXT,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        style TEXT
-    )
-    """)
-    conn.commit()
-    conn.close()
+    """Create/upgrade the jobs schema (versioned migrations, see app/migrations.py)."""
+    return migrate(_db, JOBS_MIGRATIONS)
 
 # ---------------- NEW FUNCTIONS ----------------
 
+# Statement text is kept constant so each pooled connection's statement cache reuses it.
+_INSERT_JOB = """
+    INSERT OR IGNORE INTO jobs
+        (user_id, job_id, prompt, final_prompt, status, video_url, created_at, created_ms, style, prompt_hash)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+# no-op updates are filtered in SQL too, so a repeated status never dirties a page
+_UPDATE_JOB_STATUS = """
+    UPDATE jobs
+    SET status = ?1, video_url = ?2
+    WHERE job_id = ?3 AND (status IS NOT ?1 OR video_url IS NOT ?2)
+"""
+
+# Keyset pagination on (created_ms, id), newest first; both variants walk idx_jobs_user_created.
+_SELECT_JOBS_FOR_USER = """
+    SELECT id, created_ms, user_id, job_id, prompt, final_prompt, status, video_url, created_at, style, prompt_hash
+    FROM jobs
+    WHERE user_id = ?
+    ORDER BY created_ms DESC, id DESC
+    LIMIT ?
+"""
+
+_SELECT_JOBS_FOR_USER_BEFORE = """
+    SELECT id, created_ms, user_id, job_id, prompt, final_prompt, status, video_url, created_at, style, prompt_hash
+    FROM jobs
+    WHERE user_id = ? AND (created_ms, id) < (?, ?)
+    ORDER BY created_ms DESC, id DESC
+    LIMIT ?
+"""
+
 def insert_job(user_id: str, rec):
     """Insert a new job into the DB (ignore if already exists)."""
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("""
-        INSERT OR IGNORE INTO jobs (user_id, job_id, prompt, final_prompt, status, video_url, created_at, style)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-    """, (
+    _db.execute(_INSERT_JOB, (
         user_id,
         rec.job_id,
         rec.prompt,
@@ -45,35 +59,360 @@ def insert_job(user_id: str, rec):
         rec.status,
         rec.video_path,
         rec.created_at,
+        epoch_ms(rec.created_at),
         rec.chosen_style or rec.style,   # support both fields
+        rec.prompt_hash or None,
     ))
-    conn.commit()
-    conn.close()
 
 def update_job_status(job_id: str, status: str, video_url: str = None):
     """Update status (and video URL if present) for a job."""
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("""
-        UPDATE jobs
-        SET status = ?, video_url = ?
-        WHERE job_id = ?
-    """, (status, video_url, job_id))
-    conn.commit()
-    conn.close()
-
-def get_jobs_for_user(user_id: str, limit: int = 10):
-    """Fetch recent jobs for a given user_id, newest first."""
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT job_id, prompt, final_prompt, status, video_url, created_at, style
-        FROM jobs
-        WHERE user_id = ?
-        ORDER BY datetime(created_at) DESC
-        LIMIT ?
-    """, (user_id, limit))
-    rows = cur.fetchall()
-    conn.close()
-    return rows
+    _db.execute(_UPDATE_JOB_STATUS, (status, video_url, job_id))
+
+def update_job_statuses(changes: List[Tuple[str, str, Optional[str]]]) -> int:
+    """Apply [(job_id, status, video_url)] in one transaction; returns rows actually changed."""
+    with _db.transaction() as conn:
+        cur = conn.executemany(_UPDATE_JOB_STATUS, [(status, url, job_id) for job_id, status, url in changes])
+    return cur.rowcount
+
+_SELECT_JOB = """
+    SELECT user_id, job_id, prompt, final_prompt, status, video_url, created_at, style, prompt_hash
+    FROM jobs
+    WHERE job_id = ?
+"""
+
+def get_job(job_id: str):
+    """One job row by job_id, or None."""
+    return _db.execute(_SELECT_JOB, (job_id,)).fetchone()
+
+def get_jobs_for_user(user_id: str, limit: int = 10, before: Optional[Tuple[int, int]] = None):
+    """Fetch recent jobs for a given user_id, newest first; before=(created_ms, id) continues a page."""
+    if before is None:
+        return _db.execute(_SELECT_JOBS_FOR_USER, (user_id, limit)).fetchall()
+    return _db.execute(_SELECT_JOBS_FOR_USER_BEFORE, (user_id, before[0], before[1], limit)).fetchall()
+
+# ---------------- Result cache ----------------
+
+_SELECT_CACHED_RESULT = """
+    SELECT prompt_hash, job_id, style, video_path, provider_output_url, size_bytes, created_ms, last_hit_ms, hits
+    FROM result_cache
+    WHERE prompt_hash = ?
+"""
+
+_UPSERT_CACHED_RESULT = """
+    INSERT INTO result_cache
+        (prompt_hash, job_id, style, video_path, provider_output_url, size_bytes, created_ms, last_hit_ms,
+         normalized_prompt)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(prompt_hash) DO UPDATE SET
+        job_id = excluded.job_id,
+        style = excluded.style,
+        video_path = excluded.video_path,
+        provider_output_url = COALESCE(excluded.provider_output_url, provider_output_url),
+        size_bytes = COALESCE(excluded.size_bytes, size_bytes),
+        last_hit_ms = excluded.last_hit_ms,
+        normalized_prompt = COALESCE(excluded.normalized_prompt, normalized_prompt)
+"""
+
+_TOUCH_CACHED_RESULT = "UPDATE result_cache SET last_hit_ms = ?, hits = hits + 1 WHERE prompt_hash = ?"
+
+def get_cached_result(prompt_hash: str):
+    """Cached final video for a prompt hash, or None."""
+    return _db.execute(_SELECT_CACHED_RESULT, (prompt_hash,)).fetchone()
+
+def put_cached_result(prompt_hash: str, job_id: str, style: str = None, video_path: str = None,
+                      provider_output_url: str = None, size_bytes: int = None, normalized_prompt: str = None):
+    """Insert or refresh the cached result for a prompt hash."""
+    now = epoch_ms()
+    _db.execute(_UPSERT_CACHED_RESULT,
+                (prompt_hash, job_id, style, video_path, provider_output_url, size_bytes, now, now,
+                 normalized_prompt))
+
+def get_cached_prompts():
+    """(prompt_hash, style, normalized_prompt) for every cached result that recorded its prompt."""
+    return _db.execute(
+        "SELECT prompt_hash, style, normalized_prompt FROM result_cache WHERE normalized_prompt IS NOT NULL"
+    ).fetchall()
+
+def touch_cached_result(prompt_hash: str):
+    """Record a cache hit (LRU position + hit counter)."""
+    _db.execute(_TOUCH_CACHED_RESULT, (epoch_ms(), prompt_hash))
+
+def delete_cached_result(prompt_hash: str):
+    _db.execute("DELETE FROM result_cache WHERE prompt_hash = ?", (prompt_hash,))
+
+def evict_cached_results(min_created_ms: int, max_entries: int, max_bytes: int) -> int:
+    """
+    Drop entries older than min_created_ms (TTL), then the least recently hit entries
+    beyond max_entries or beyond max_bytes of total video size. Returns rows removed.
+    """
+    with _db.transaction() as conn:
+        removed = conn.execute("DELETE FROM result_cache WHERE created_ms < ?", (min_created_ms,)).rowcount
+        removed += conn.execute("""
+            DELETE FROM result_cache WHERE prompt_hash IN (
+                SELECT prompt_hash FROM result_cache ORDER BY last_hit_ms DESC LIMIT -1 OFFSET ?
+            )
+        """, (max_entries,)).rowcount
+        removed += conn.execute("""
+            DELETE FROM result_cache WHERE prompt_hash IN (
+                SELECT prompt_hash FROM (
+                    SELECT prompt_hash,
+                           SUM(COALESCE(size_bytes, 0)) OVER (ORDER BY last_hit_ms DESC, prompt_hash) AS running
+                    FROM result_cache
+                ) WHERE running > ?
+            )
+        """, (max_bytes,)).rowcount
+    return removed
+
+def cached_result_totals():
+    """(entries, total size_bytes) currently in the result cache."""
+    row = _db.execute("SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM result_cache").fetchone()
+    return row[0], row[1]
+
+# ---------------- Optimized prompt cache ----------------
+
+_SELECT_OPTIMIZED_PROMPT = """
+    SELECT optimized_prompt FROM prompt_optimizations WHERE cache_key = ? AND created_ms >= ?
+"""
+
+_UPSERT_OPTIMIZED_PROMPT = """
+    INSERT INTO prompt_optimizations (cache_key, style, optimized_prompt, model, created_ms)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(cache_key) DO UPDATE SET
+        optimized_prompt = excluded.optimized_prompt,
+        model = excluded.model,
+        created_ms = excluded.created_ms
+"""
+
+def get_optimized_prompt(cache_key: str, min_created_ms: int = 0) -> Optional[str]:
+    """Stored LLM rewrite for a (normalized prompt, style) key, if newer than min_created_ms."""
+    row = _db.execute(_SELECT_OPTIMIZED_PROMPT, (cache_key, min_created_ms)).fetchone()
+    return row[0] if row else None
+
+def put_optimized_prompt(cache_key: str, style: str, optimized_prompt: str, model: str = None):
+    _db.execute(_UPSERT_OPTIMIZED_PROMPT, (cache_key, style, optimized_prompt, model, epoch_ms()))
+
+# ---------------- Video blobs ----------------
+
+_INSERT_BLOB = "INSERT OR IGNORE INTO blobs (digest, size_bytes, created_ms) VALUES (?, ?, ?)"
+
+_LINK_JOB_BLOB = """
+    INSERT INTO job_blobs (job_id, digest, created_ms) VALUES (?, ?, ?)
+    ON CONFLICT(job_id) DO UPDATE SET digest = excluded.digest
+"""
+
+_SELECT_JOB_BLOB = """
+    SELECT b.digest, b.size_bytes
+    FROM job_blobs j JOIN blobs b ON b.digest = j.digest
+    WHERE j.job_id = ?
+"""
+
+def link_job_blob(job_id: str, digest: str, size_bytes: int):
+    """Record the blob (if new) and point job_id at it, atomically."""
+    now = epoch_ms()
+    with _db.transaction(immediate=True) as conn:
+        conn.execute(_INSERT_BLOB, (digest, size_bytes, now))
+        conn.execute(_LINK_JOB_BLOB, (job_id, digest, now))
+
+def get_job_blob(job_id: str):
+    """(digest, size_bytes) row for a job's video, or None."""
+    return _db.execute(_SELECT_JOB_BLOB, (job_id,)).fetchone()
+
+_SELECT_PROMPT_BLOB = """
+    SELECT b.digest, b.size_bytes
+    FROM jobs j
+    JOIN job_blobs jb ON jb.job_id = j.job_id
+    JOIN blobs b ON b.digest = jb.digest
+    WHERE j.prompt_hash = ? AND j.job_id != ?
+    LIMIT 1
+"""
+
+def get_prompt_blob(prompt_hash: str, exclude_job_id: str = ""):
+    """(digest, size_bytes) of another job's video for the same prompt_hash, or None."""
+    return _db.execute(_SELECT_PROMPT_BLOB, (prompt_hash, exclude_job_id)).fetchone()
+
+def unlink_job_blob(job_id: str):
+    _db.execute("DELETE FROM job_blobs WHERE job_id = ?", (job_id,))
+
+def delete_unreferenced_blobs(max_created_ms: int):
+    """
+    Drop blob rows nothing points at (created before max_created_ms), together with the
+    renditions of sources no job uses any more; returns [(digest, size_bytes)].
+    """
+    with _db.transaction(immediate=True) as conn:
+        conn.execute("""
+            DELETE FROM blob_renditions
+            WHERE created_ms < ?
+              AND NOT EXISTS (SELECT 1 FROM job_blobs j WHERE j.digest = blob_renditions.source_digest)
+        """, (max_created_ms,))
+        rows = conn.execute("""
+            SELECT digest, size_bytes FROM blobs
+            WHERE created_ms < ?
+              AND NOT EXISTS (SELECT 1 FROM job_blobs j WHERE j.digest = blobs.digest)
+              AND NOT EXISTS (SELECT 1 FROM blob_renditions r WHERE r.digest = blobs.digest)
+        """, (max_created_ms,)).fetchall()
+        conn.executemany("DELETE FROM blobs WHERE digest = ?", [(r["digest"],) for r in rows])
+    return [(r["digest"], r["size_bytes"]) for r in rows]
+
+def blob_exists(digest: str) -> bool:
+    return _db.execute("SELECT 1 FROM blobs WHERE digest = ?", (digest,)).fetchone() is not None
+
+_LINK_RENDITION = """
+    INSERT INTO blob_renditions (source_digest, kind, digest, mime, width, height, created_ms)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(source_digest, kind) DO UPDATE SET
+        digest = excluded.digest, mime = excluded.mime, width = excluded.width, height = excluded.height
+"""
+
+_SELECT_JOB_RENDITIONS = """
+    SELECT r.kind, r.digest, r.mime, r.width, r.height, b.size_bytes
+    FROM job_blobs j
+    JOIN blob_renditions r ON r.source_digest = j.digest
+    JOIN blobs b ON b.digest = r.digest
+    WHERE j.job_id = ?
+    ORDER BY b.size_bytes
+"""
+
+def link_rendition(source_digest: str, kind: str, digest: str, size_bytes: int, mime: str,
+                   width: Optional[int], height: Optional[int]):
+    """Record a rendition blob (if new) of a stored video, atomically."""
+    now = epoch_ms()
+    with _db.transaction(immediate=True) as conn:
+        conn.execute(_INSERT_BLOB, (digest, size_bytes, now))
+        conn.execute(_LINK_RENDITION, (source_digest, kind, digest, mime, width, height, now))
+
+def get_renditions(source_digest: str):
+    """Rendition kinds already stored for a video blob."""
+    rows = _db.execute("SELECT kind FROM blob_renditions WHERE source_digest = ?", (source_digest,)).fetchall()
+    return {r[0] for r in rows}
+
+def get_job_renditions(job_id: str):
+    """(kind, digest, mime, width, height, size_bytes) rows for a job's video, smallest first."""
+    return _db.execute(_SELECT_JOB_RENDITIONS, (job_id,)).fetchall()
+
+def blob_totals():
+    """(blobs, total bytes stored, job links)."""
+    row = _db.execute("""
+        SELECT (SELECT COUNT(*) FROM blobs), (SELECT COALESCE(SUM(size_bytes), 0) FROM blobs),
+               (SELECT COUNT(*) FROM job_blobs)
+    """).fetchone()
+    return row[0], row[1], row[2]
+
+# ---------------- Inbound message ids ----------------
+
+_CLAIM_INBOUND = "INSERT OR IGNORE INTO inbound_messages (message_sid, response, created_ms) VALUES (?, NULL, ?)"
+
+def claim_inbound_message(message_sid: str, min_created_ms: int) -> Tuple[bool, Optional[str]]:
+    """
+    Record a MessageSid as being handled. Returns (True, None) for the first delivery, or
+    (False, stored response) for a repeat; the response is None while the first is in flight.
+    A row older than min_created_ms counts as expired and is claimed afresh.
+    """
+    now = epoch_ms()
+    with _db.transaction(immediate=True) as conn:
+        if conn.execute(_CLAIM_INBOUND, (message_sid, now)).rowcount:
+            return True, None
+        row = conn.execute("SELECT response, created_ms FROM inbound_messages WHERE message_sid = ?",
+                           (message_sid,)).fetchone()
+        if row["created_ms"] < min_created_ms:
+            conn.execute("UPDATE inbound_messages SET response = NULL, created_ms = ? WHERE message_sid = ?",
+                         (now, message_sid))
+            return True, None
+        return False, row["response"]
+
+def set_inbound_response(message_sid: str, response: str):
+    _db.execute("UPDATE inbound_messages SET response = ? WHERE message_sid = ?", (response, message_sid))
+
+def release_inbound_message(message_sid: str):
+    """Forget a claim whose handling failed, so Twilio's retry is processed."""
+    _db.execute("DELETE FROM inbound_messages WHERE message_sid = ?", (message_sid,))
+
+def purge_inbound_messages(max_created_ms: int) -> int:
+    return _db.execute("DELETE FROM inbound_messages WHERE created_ms < ?", (max_created_ms,)).rowcount
+
+# ---------------- Conversation sessions ----------------
+
+_SESSION_COLUMNS = "user_number, kind, state, prompt, style, job_id, expires_ms"
+
+_UPSERT_SESSION = """
+    INSERT INTO sessions (user_number, kind, state, prompt, style, job_id, updated_ms, expires_ms)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (user_number, kind) DO UPDATE SET
+        state = excluded.state, prompt = excluded.prompt, style = excluded.style,
+        job_id = excluded.job_id, updated_ms = excluded.updated_ms, expires_ms = excluded.expires_ms
+"""
+
+def get_sessions(user_number: str, now_ms: int) -> List:
+    """The user's unexpired sessions (at most one per kind)."""
+    return _db.execute(f"SELECT {_SESSION_COLUMNS} FROM sessions WHERE user_number = ? AND expires_ms > ?",
+                       (user_number, now_ms)).fetchall()
+
+def put_session(user_number: str, kind: str, state: str, prompt: Optional[str], style: Optional[str],
+                job_id: Optional[str], now_ms: int, expires_ms: int):
+    _db.execute(_UPSERT_SESSION, (user_number, kind, state, prompt, style, job_id, now_ms, expires_ms))
+
+def advance_session(user_number: str, kind: str, from_state: str, to_state: str, style: Optional[str],
+                    now_ms: int, expires_ms: int):
+    """
+    Move an unexpired session from from_state to to_state in one statement, so only one
+    caller (in any process) wins. Returns the updated row, or None if it wasn't in from_state.
+    """
+    with _db.transaction(immediate=True) as conn:
+        return conn.execute(f"""
+            UPDATE sessions SET state = ?, style = COALESCE(?, style), updated_ms = ?, expires_ms = ?
+            WHERE user_number = ? AND kind = ? AND state = ? AND expires_ms > ?
+            RETURNING {_SESSION_COLUMNS}
+        """, (to_state, style, now_ms, expires_ms, user_number, kind, from_state, now_ms)).fetchone()
+
+def take_session(user_number: str, kind: str, state: Optional[str], job_id: Optional[str], now_ms: int):
+    """Delete and return an unexpired session, if it (still) has the given state / job_id."""
+    with _db.transaction(immediate=True) as conn:
+        return conn.execute(f"""
+            DELETE FROM sessions
+            WHERE user_number = ? AND kind = ? AND expires_ms > ?
+              AND (?4 IS NULL OR state = ?4) AND (?5 IS NULL OR job_id = ?5)
+            RETURNING {_SESSION_COLUMNS}
+        """, (user_number, kind, now_ms, state, job_id)).fetchone()
+
+def purge_sessions(now_ms: int) -> int:
+    return _db.execute("DELETE FROM sessions WHERE expires_ms <= ?", (now_ms,)).rowcount
+
+# ---------------- Inactivity reminders ----------------
+
+_UPSERT_REMINDER = """
+    INSERT INTO reminders (user_number, due_ms, sent) VALUES (?, ?, ?)
+    ON CONFLICT (user_number) DO UPDATE SET due_ms = excluded.due_ms, sent = excluded.sent
+"""
+
+def write_reminders(upserts: List[Tuple[str, int, int]], deletes: List[str]):
+    """Batched write-behind: [(user_number, due_ms, sent)] to set, user numbers to drop."""
+    with _db.transaction(immediate=True) as conn:
+        if upserts:
+            conn.executemany(_UPSERT_REMINDER, upserts)
+        if deletes:
+            conn.executemany("DELETE FROM reminders WHERE user_number = ?", [(u,) for u in deletes])
+
+def claim_due_reminders(due: List[Tuple[str, int]], next_due_ms: int, max_sent: int) -> List[Tuple[str, int]]:
+    """
+    Claim reminders for sending: each (user_number, due_ms) that still has that due time
+    is pushed to next_due_ms with sent + 1, or deleted once it reaches max_sent. Another
+    process, a cancel or a reschedule makes the claim miss. Returns [(user_number, sent)].
+    """
+    claimed = []
+    with _db.transaction(immediate=True) as conn:
+        for user_number, due_ms in due:
+            row = conn.execute(
+                "UPDATE reminders SET due_ms = ?, sent = sent + 1 WHERE user_number = ? AND due_ms = ? RETURNING sent",
+                (next_due_ms, user_number, due_ms)).fetchone()
+            if row is None:
+                continue
+            if row["sent"] >= max_sent:
+                conn.execute("DELETE FROM reminders WHERE user_number = ?", (user_number,))
+            claimed.append((user_number, row["sent"]))
+    return claimed
+
+def load_reminders() -> List[Tuple[str, int]]:
+    """Every pending reminder as (user_number, due_ms), for the scheduler's startup."""
+    return [tuple(row) for row in _db.execute("SELECT user_number, due_ms FROM reminders")]
 
+def close():
+    _db.close_all()
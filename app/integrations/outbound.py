@@ -0,0 +1,168 @@
+# app/integrations/outbound.py
+
+import time
+import random
+import asyncio
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, Optional
+
+log = logging.getLogger("integrations.outbound")
+
+
+class DeliveryStats:
+    """Counters and recent send latencies for the outbound pool."""
+
+    def __init__(self, window: int = 512):
+        self._lock = threading.Lock()
+        self.queue_depth = 0        # accepted, waiting for a lane or a worker thread
+        self.max_queue_depth = 0
+        self.in_flight = 0          # currently executing on a worker thread
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self._latencies: Deque[float] = deque(maxlen=window)
+        self._latency_total = 0.0
+        self._latency_count = 0
+        self._latency_max = 0.0
+
+    def enqueued(self):
+        with self._lock:
+            self.queue_depth += 1
+            self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+
+    def started(self):
+        with self._lock:
+            self.queue_depth -= 1
+            self.in_flight += 1
+
+    def finished(self, latency: float, ok: bool):
+        with self._lock:
+            self.in_flight -= 1
+            self._latencies.append(latency)
+            self._latency_total += latency
+            self._latency_count += 1
+            self._latency_max = max(self._latency_max, latency)
+            if ok:
+                self.sent += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            samples = sorted(self._latencies)
+            n = self._latency_count
+
+            def pct(p: float) -> Optional[float]:
+                if not samples:
+                    return None
+                return round(samples[min(len(samples) - 1, int(p * len(samples)))] * 1000, 1)
+
+            return {
+                "queue_depth": self.queue_depth,
+                "max_queue_depth": self.max_queue_depth,
+                "in_flight": self.in_flight,
+                "sent": self.sent,
+                "failed": self.failed,
+                "retried": self.retried,
+                "latency_ms": {
+                    "avg": round(self._latency_total / n * 1000, 1) if n else None,
+                    "p50": pct(0.50),
+                    "p95": pct(0.95),
+                    "max": round(self._latency_max * 1000, 1),
+                },
+            }
+
+
+class DeliveryPool:
+    """
+    Bounded pool for blocking outbound calls (e.g. Twilio REST sends).
+
+    - Blocking calls run on a fixed-size thread pool so the event loop never waits on HTTPS.
+    - Calls for the same destination run one at a time, in submission order.
+    - Retryable failures (decided by `is_retryable`) are retried with exponential backoff + jitter;
+      the destination's lane stays held during the backoff so ordering is preserved.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 8,
+        max_retries: int = 3,
+        base_backoff: float = 0.5,
+        max_backoff: float = 8.0,
+        is_retryable: Optional[Callable[[BaseException], bool]] = None,
+        name: str = "outbound",
+    ):
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.is_retryable = is_retryable or (lambda exc: False)
+        self.name = name
+        self.stats = DeliveryStats()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lanes: Dict[str, asyncio.Lock] = {}
+        self._lane_users: Dict[str, int] = {}
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=self.name)
+        return self._executor
+
+    def _backoff(self, attempt: int) -> float:
+        cap = min(self.max_backoff, self.base_backoff * (2 ** attempt))
+        return random.uniform(cap / 2, cap)
+
+    async def submit(self, destination: str, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Run fn(*args, **kwargs) off-loop, ordered per destination. Returns fn's result or raises."""
+        lane = self._lanes.get(destination)
+        if lane is None:
+            lane = self._lanes[destination] = asyncio.Lock()
+        self._lane_users[destination] = self._lane_users.get(destination, 0) + 1
+        self.stats.enqueued()
+        try:
+            async with lane:
+                return await self._run_with_retry(fn, args, kwargs)
+        finally:
+            remaining = self._lane_users[destination] - 1
+            if remaining:
+                self._lane_users[destination] = remaining
+            else:
+                # drop idle lanes so the dict doesn't grow with every number we've ever messaged
+                del self._lane_users[destination]
+                self._lanes.pop(destination, None)
+
+    async def _run_with_retry(self, fn: Callable[..., Any], args: tuple, kwargs: dict) -> Any:
+        loop = asyncio.get_running_loop()
+        attempt = 0
+        while True:
+            def _call():
+                self.stats.started()
+                t0 = time.perf_counter()
+                ok = False
+                try:
+                    result = fn(*args, **kwargs)
+                    ok = True
+                    return result
+                finally:
+                    self.stats.finished(time.perf_counter() - t0, ok)
+
+            try:
+                return await loop.run_in_executor(self._get_executor(), _call)
+            except Exception as exc:
+                if attempt >= self.max_retries or not self.is_retryable(exc):
+                    self.stats.failed += 1
+                    raise
+                delay = self._backoff(attempt)
+                attempt += 1
+                self.stats.retried += 1
+                log.warning("%s: retryable send error (%s); retry %d/%d in %.2fs",
+                            self.name, exc, attempt, self.max_retries, delay)
+                # requeued for the next attempt
+                self.stats.enqueued()
+                await asyncio.sleep(delay)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
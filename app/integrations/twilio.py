@@ -1,13 +1,20 @@
 # app/integrations/twilio.py
 
 import os
+import hmac
 import logging
 from dotenv import load_dotenv
 from typing import Optional, Dict, Any
+from urllib.parse import parse_qsl
 from twilio.rest import Client
+from twilio.base.exceptions import TwilioRestException
 from twilio.request_validator import RequestValidator
 from twilio.twiml.messaging_response import MessagingResponse
 from starlette.requests import Request
+from requests.exceptions import ConnectionError as HTTPConnectionError, ConnectTimeout as HTTPConnectTimeout
+from urllib3.exceptions import MaxRetryError, NewConnectionError, ConnectTimeoutError
+
+from app.integrations.outbound import DeliveryPool
 
 log = logging.getLogger("integrations.twilio")
 
@@ -20,6 +27,8 @@ TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN", "")
 TWILIO_WHATSAPP_FROM = os.getenv("TWILIO_WHATSAPP_FROM", "whatsapp:+14155238886")
 TWILIO_STATUS_CALLBACK_URL = os.getenv("TWILIO_STATUS_CALLBACK_URL", "")
 TWILIO_WEBHOOK_URL = os.getenv("TWILIO_WEBHOOK_URL", "")
+TWILIO_SEND_WORKERS = int(os.getenv("TWILIO_SEND_WORKERS", "8"))
+TWILIO_SEND_MAX_RETRIES = int(os.getenv("TWILIO_SEND_MAX_RETRIES", "3"))
 
 _client: Optional[Client] = None
 
@@ -83,39 +92,107 @@ def send_media(to: str, media_url: str, caption: Optional[str] = None, **kwargs:
         raise
 
 
-# ---- Inbound webhook helpers ----
-async def parse_incoming(request: Request) -> Dict[str, str]:
+# ---- Async outbound delivery ----
+def _is_retryable(exc: BaseException) -> bool:
     """
-    Parse Twilio's inbound webhook (x-www-form-urlencoded).
-    Returns dict with: from, body, wa_id, sid, raw
+    Retry only sends Twilio can't have accepted: throttling (429) and failures to connect.
+    messages.create isn't idempotent, so a 5xx or a timeout/disconnect after the request
+    went out may already have delivered the message; those are logged, not resent.
     """
-    form = await request.form()
-    data = {k: str(v) for k, v in form.items()}
-    return {
-        "from": data.get("From", ""),       # e.g. 'whatsapp:+1...'
-        "body": (data.get("Body") or "").strip(),
-        "wa_id": data.get("WaId", ""),      # Numeric WA ID Twilio provides
-        "sid": data.get("MessageSid", ""),
-        "raw": data,
-    }
+    if isinstance(exc, TwilioRestException):
+        return exc.status == 429
+    if isinstance(exc, HTTPConnectTimeout):
+        return True
+    if isinstance(exc, HTTPConnectionError):
+        reason = exc.args[0] if exc.args else None
+        if isinstance(reason, MaxRetryError):
+            reason = reason.reason
+        return isinstance(reason, (NewConnectionError, ConnectTimeoutError))
+    return False
 
 
-async def validate_request(request: Request, expected_url: Optional[str] = None) -> bool:
+_delivery_pool = DeliveryPool(
+    max_workers=TWILIO_SEND_WORKERS,
+    max_retries=TWILIO_SEND_MAX_RETRIES,
+    is_retryable=_is_retryable,
+    name="twilio-send",
+)
+
+
+async def send_message_async(to: str, body: str, **kwargs: Any) -> str:
     """
-    Validate X-Twilio-Signature using Twilio's RequestValidator.
-    IMPORTANT: The URL used here must MATCH the URL configured in Twilio Console.
-    If behind a proxy, set TWILIO_WEBHOOK_URL to the public URL.
+    Non-blocking send_message: runs on the bounded delivery pool, ordered per recipient,
+    retried on 429 and connect failures. Returns the Message SID or raises after the last attempt.
     """
+    return await _delivery_pool.submit(_normalize_to(to), send_message, to, body, **kwargs)
+
+
+async def send_media_async(to: str, media_url: str, caption: Optional[str] = None, **kwargs: Any) -> str:
+    """Non-blocking send_media (see send_message_async)."""
+    return await _delivery_pool.submit(_normalize_to(to), send_media, to, media_url, caption, **kwargs)
+
+
+def delivery_stats() -> Dict[str, Any]:
+    """Queue depth, retry counters and send latency of the outbound pool."""
+    return _delivery_pool.stats.snapshot()
+
+
+def shutdown_delivery():
+    _delivery_pool.close()
+
+
+# ---- Inbound webhook helpers ----
+class InboundMessage:
+    """One decoded inbound WhatsApp message (see read_inbound)."""
+
+    __slots__ = ("sender", "body", "command", "wa_id", "sid", "params", "valid")
+
+    def __init__(self, params: Dict[str, str], valid: bool = True):
+        self.sender = params.get("From", "")            # e.g. 'whatsapp:+1...'
+        self.body = (params.get("Body") or "").strip()
+        self.command = self.body.lower()                # normalized text for command/style lookups
+        self.wa_id = params.get("WaId", "")             # Numeric WA ID Twilio provides
+        self.sid = params.get("MessageSid", "")
+        self.params = params
+        self.valid = valid
+
+
+_validator: Optional[RequestValidator] = None
+
+
+def _get_validator() -> RequestValidator:
+    global _validator
+    if _validator is None:
+        _validator = RequestValidator(TWILIO_AUTH_TOKEN)
+    return _validator
+
+
+async def _form_params(request: Request) -> Dict[str, str]:
+    """The webhook form as {name: str}, decoded once per request."""
+    params = getattr(request.state, "twilio_params", None)
+    if params is None:
+        if request.headers.get("content-type", "").startswith("application/x-www-form-urlencoded"):
+            # what Twilio sends; parse_qsl is several times cheaper than the multipart form parser
+            params = dict(parse_qsl((await request.body()).decode("utf-8", "replace"), keep_blank_values=True))
+        else:
+            form = await request.form()
+            params = {k: str(v) for k, v in form.items()}
+        request.state.twilio_params = params
+    return params
+
+
+def _signature_ok(request: Request, params: Dict[str, str], expected_url: Optional[str]) -> bool:
     if not TWILIO_AUTH_TOKEN:
-        log.debug("TWILIO_AUTH_TOKEN not set; skipping request validation.")
         return True
-
-    validator = RequestValidator(TWILIO_AUTH_TOKEN or "")
     signature = request.headers.get("X-Twilio-Signature", "")
     url_to_validate = (expected_url or TWILIO_WEBHOOK_URL or str(request.url))
-    form = await request.form()
-    params = {k: str(v) for k, v in form.items()}
     try:
+        validator = _get_validator()
+        # one HMAC over the URL as configured settles the usual case; RequestValidator.validate
+        # (two HMACs, with and without the port) only runs when that doesn't match
+        expected = validator.compute_signature(url_to_validate, params)
+        if hmac.compare_digest(expected.encode(), signature.encode()):
+            return True
         ok = validator.validate(url_to_validate, params, signature)
         if not ok:
             log.warning("Twilio signature validation failed for url=%s", url_to_validate)
@@ -125,6 +202,36 @@ async def validate_request(request: Request, expected_url: Optional[str] = None)
         return False
 
 
+async def read_inbound(request: Request, expected_url: Optional[str] = None) -> InboundMessage:
+    """
+    Decode Twilio's inbound webhook (x-www-form-urlencoded) once: the parsed message plus
+    whether its X-Twilio-Signature checks out (always True when TWILIO_AUTH_TOKEN is unset).
+    """
+    params = await _form_params(request)
+    return InboundMessage(params, _signature_ok(request, params, expected_url))
+
+
+async def parse_incoming(request: Request) -> Dict[str, str]:
+    """
+    Parse Twilio's inbound webhook (x-www-form-urlencoded).
+    Returns dict with: from, body, wa_id, sid, raw
+    """
+    msg = InboundMessage(await _form_params(request))
+    return {"from": msg.sender, "body": msg.body, "wa_id": msg.wa_id, "sid": msg.sid, "raw": msg.params}
+
+
+async def validate_request(request: Request, expected_url: Optional[str] = None) -> bool:
+    """
+    Validate X-Twilio-Signature using Twilio's RequestValidator.
+    IMPORTANT: The URL used here must MATCH the URL configured in Twilio Console.
+    If behind a proxy, set TWILIO_WEBHOOK_URL to the public URL.
+    """
+    if not TWILIO_AUTH_TOKEN:
+        log.debug("TWILIO_AUTH_TOKEN not set; skipping request validation.")
+        return True
+    return _signature_ok(request, await _form_params(request), expected_url)
+
+
 def ack_twiml(text: str) -> str:
     """
     Create a TwiML XML string for an immediate WhatsApp reply (ack).
@@ -133,3 +240,8 @@ def ack_twiml(text: str) -> str:
     resp = MessagingResponse()
     resp.message(text)
     return str(resp)
+
+
+def empty_twiml() -> str:
+    """TwiML that acknowledges the webhook without sending a reply."""
+    return str(MessagingResponse())
@@ -1,12 +1,17 @@
 # app/main.py
 
 import os
+import hmac
+import json
+import hashlib
+import time
 import asyncio
 import logging
 from datetime import datetime, timezone
-from typing import Optional, Tuple
-from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import HTMLResponse, StreamingResponse, Response
+from collections import deque
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from fastapi import FastAPI, Query, Request, HTTPException
+from fastapi.responses import HTMLResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from starlette.middleware.cors import CORSMiddleware
@@ -15,19 +20,36 @@ from contextlib import asynccontextmanager
 from app.services.prompts import compose_prompt, prompt_hash
 from app.services.jobs import JobStore, JobRecord
 from app.services.video_generator import VideoGenerator
-from app.services.prompt_optimizer import optimize_prompt
+from app.services.events import JobEventBus
+from app.services.idempotency import InboundDedup
+from app.services.sessions import AWAITING_FEEDBACK, AWAITING_STYLE, FEEDBACK, QUEUED, STYLE, SessionStore
+from app.providers.client import ProviderError
+from app.providers.base import TERMINAL_STATUSES
+from app.services.result_cache import ResultCache
+from app.services.blob_store import BlobStore
+from app.services.ingest import Downloader
+from app.services.media import MediaFile, StatCache, media_response
+from app.services.prompt_optimizer import optimize_prompt_async, optimizer_stats, shutdown_optimizer
 from app.services.feedback import save_feedback
-from app.workers.generation_worker import process_whatsapp_job
+from app.workers.generation_worker import process_whatsapp_job, notify_progress, notify_slow
+from app.workers.completion_scheduler import CompletionScheduler
+from app.workers.transcoder import Transcoder
 from app.workers.commands import handle_guide, handle_status, handle_history
-from app.services.requests import RequestQueue
-from app.workers.reminder_worker import schedule_reminder, cancel_reminder
+from app.services.requests import RequestQueue, RequestRecord
+from app.workers.request_dispatcher import RequestDispatcher
+from app import db, requests_db
+from app.storage import run_db, shutdown_db_executor
+from app.workers.reminder_worker import ReminderScheduler
 
 # Twilio helpers (send_message/send_media + webhook parsing)
 from app.integrations.twilio import (
-    parse_incoming,
+    InboundMessage,
+    read_inbound,
     ack_twiml,
-    validate_request,
-    send_message,
+    empty_twiml,
+    send_message_async,
+    delivery_stats,
+    shutdown_delivery,
 )
 
 
@@ -37,11 +59,18 @@ logging.basicConfig(level=logging.INFO)
 APP_ORIGIN = os.getenv("APP_ORIGIN", "*")
 PROVIDER_NAME = os.getenv("VIDEO_PROVIDER", "mock").lower()
 PUBLIC_BASE_URL = os.getenv("PUBLIC_BASE_URL", "").rstrip("/")
+PROVIDER_WEBHOOK_SECRET = os.getenv("PROVIDER_WEBHOOK_SECRET", "")   # unset: callbacks refused, polling only
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
-    asyncio.create_task(process_queue())
+    db.init_db()
+    requests_db.init_db()
+    events.bind(asyncio.get_running_loop())
+    transcoder.start()
+    completion.start()
+    dispatcher.start()
+    reminders.start()
     try:
         dev_number = os.getenv("TWILIO_TEST_TO")
         if dev_number:
@@ -55,11 +84,23 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         log.error(f"Failed to send intro message: {e}")
     yield
+    # Shutdown
+    await dispatcher.stop()
+    await reminders.stop()
+    await completion.stop()
+    await transcoder.stop()
+    await downloader.aclose()
+    await video_gen.provider.aclose()
+    await shutdown_optimizer()
+    shutdown_delivery()
+    shutdown_db_executor()
+    db.close()
+    requests_db.close()
 
 
 async def _send_intro(dev_number: str, intro_msg: str):
     try:
-        send_message(dev_number, intro_msg)   # Twilio send
+        await send_message_async(dev_number, intro_msg)   # Twilio send
         log.info(f"✅ Sent intro message to {dev_number}")
     except Exception as e:
         log.error(f"Intro message error: {e}")
@@ -89,8 +130,39 @@ STYLE_ALIASES = {
 
 # single job_store instance used by main & passed to worker
 job_store = JobStore()
-video_gen = VideoGenerator(PROVIDER_NAME, job_store=job_store)
+result_cache = ResultCache()
+blob_store = BlobStore()
+media_cache = StatCache()
+transcoder = Transcoder()   # bounded ffmpeg pool; user-facing encodes jump the queue
+downloader = Downloader()   # streams provider outputs to disk ahead of transcoding
+events = JobEventBus()      # job status changes, streamed to browsers by /events
+video_gen = VideoGenerator(PROVIDER_NAME, job_store=job_store, result_cache=result_cache, events=events)
 request_queue = RequestQueue()   # ✅ new queue for multiple requests
+inbound = InboundDedup()         # MessageSids already answered, for Twilio's retries
+sessions = SessionStore()        # per-user conversation state (style choice, owed feedback), in jobs.db
+reminders = ReminderScheduler(job_store)   # "got a new idea?" nudges for inactive users
+
+# one shared loop watches every in-flight job and hands finished ones to the delivery step
+completion = CompletionScheduler(
+    video_gen,
+    on_complete=lambda job_id, user_number, pj: process_whatsapp_job(
+        job_id, user_number, pj, video_gen, job_store, blob_store, transcoder, downloader, sessions),
+    on_progress=notify_progress,
+    on_slow=notify_slow,
+)
+
+# Most job ids accepted by one POST /status:batch
+STATUS_BATCH_MAX = int(os.getenv("STATUS_BATCH_MAX", "100"))
+
+# Server-Sent Events (/events): keep-alive comment interval, open-stream cap, client reconnect delay
+SSE_HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+SSE_MAX_CLIENTS = int(os.getenv("SSE_MAX_CLIENTS", "5000"))
+SSE_RETRY_MS = int(os.getenv("SSE_RETRY_MS", "3000"))
+
+# The WhatsApp webhook should answer Twilio within this; slower replies are counted and logged
+WEBHOOK_ACK_BUDGET_MS = int(os.getenv("WEBHOOK_ACK_BUDGET_MS", "250"))
+_webhook_stats: Dict[str, int] = {"handled": 0, "over_budget": 0}
+_webhook_latencies: deque = deque(maxlen=1024)
 
 # Minimum length for a prompt before showing warning
 MIN_PROMPT_LENGTH = 12  # characters
@@ -100,6 +172,26 @@ def healthz():
     return {"ok": True, "provider": PROVIDER_NAME}
 
 
+@app.get("/metrics")
+async def metrics():
+    return {
+        "delivery": delivery_stats(),
+        "completion": completion.snapshot(),
+        "dispatcher": dispatcher.snapshot(),
+        "webhook": {**_webhook_snapshot(), "dedup": inbound.snapshot()},
+        "sessions": sessions.snapshot(),
+        "reminders": reminders.snapshot(),
+        "result_cache": await run_db(result_cache.snapshot),
+        "job_store": job_store.snapshot(),
+        "prompt_optimizer": optimizer_stats(),
+        "blob_store": await run_db(blob_store.snapshot),
+        "transcoder": transcoder.snapshot(),
+        "ingest": downloader.snapshot(),
+        "provider": video_gen.provider.snapshot(),
+        "events": events.snapshot(),
+    }
+
+
 @app.get("/", response_class=HTMLResponse)
 def index(request: Request):
     return templates.TemplateResponse("index.html", {"request": request})
@@ -119,7 +211,7 @@ async def generate(payload: dict):
 
     # ✅ Step 1: enqueue the request instead of generating immediately
     
-    req_id = request_queue.enqueue("api-user", user_prompt, style=style)
+    req_id = await run_db(request_queue.enqueue, "api-user", user_prompt, style=style)
 
     return {
         "request_id": req_id,
@@ -133,88 +225,217 @@ async def generate(payload: dict):
 
 @app.get("/status/{job_id}")
 async def status(job_id: str):
-    pj = video_gen.fetch(job_id)
-    rec = job_store.get(job_id)
+    # fetch() updates the shared record and writes status changes through to the DB
+    try:
+        pj = await video_gen.fetch(job_id)
+    except ProviderError as e:
+        log.warning("Status check for job=%s fell back to the stored record: %s", job_id, e)
+        pj = None   # provider unreachable: answer from the stored record
+    rec, renditions = (await run_db(_status_records, [job_id]))[job_id]
     if not rec:
         raise HTTPException(404, "Job not found")
+    return _status_payload(job_id, rec, pj, renditions)
+
+
+@app.post("/status:batch")
+async def status_batch(payload: dict):
+    """Status for many jobs in one request: one provider round and one DB transaction for all of them."""
+    job_ids = payload.get("job_ids")
+    if not isinstance(job_ids, list) or not all(isinstance(j, str) for j in job_ids):
+        raise HTTPException(400, "job_ids must be a list of strings")
+    job_ids = list(dict.fromkeys(job_ids))
+    if len(job_ids) > STATUS_BATCH_MAX:
+        raise HTTPException(400, f"At most {STATUS_BATCH_MAX} job_ids per request")
+
+    # jobs the provider couldn't be asked about this round answer from their stored record
+    results = await video_gen.fetch_many(job_ids)
+    found = await run_db(_status_records, job_ids)
+    jobs, missing = [], []
+    for job_id in job_ids:
+        rec, renditions = found[job_id]
+        if rec is None:
+            missing.append(job_id)
+        else:
+            jobs.append(_status_payload(job_id, rec, results.get(job_id), renditions))
+    return {"jobs": jobs, "missing": missing}
+
 
-    rec.status = pj.status
-    if pj.status == "succeeded" and not rec.video_path:
-        rec.video_path = f"/video/{job_id}"
-        if pj.video_url:
-            rec.meta["provider_output_url"] = pj.video_url
+def _status_records(job_ids: List[str]) -> Dict[str, Tuple[Optional[JobRecord], list]]:
+    """Blocking: each job's record and, once it has succeeded, its renditions."""
+    out = {}
+    for job_id in job_ids:
+        rec = job_store.get(job_id)
+        renditions = blob_store.renditions(job_id) if rec and rec.status == "succeeded" else []
+        out[job_id] = (rec, renditions)
+    return out
 
-    # NEW: persist status update into DB
-    job_store.update_status_in_db(job_id, rec.status, rec.video_path)
 
-    if pj.error:
-        return {"job_id": job_id, "status": "failed", "error": pj.error}
+def _status_payload(job_id: str, rec: JobRecord, pj, renditions: list) -> dict:
+    error = pj.error if pj is not None else (rec.meta.get("error") if rec.status == "failed" else None)
+    if error:
+        return {"job_id": job_id, "status": "failed", "error": error}
 
     return {
         "job_id": job_id,
         "status": rec.status,
         "video_url": rec.video_path,
         "cached": rec.cached,
+        "poster_url": next((_rendition_url(job_id, r.kind) for r in renditions if r.kind == "poster"), None),
+        # smallest first; clients pick the first that suits their screen/connection
+        "renditions": [
+            {
+                "kind": r.kind,
+                "url": _rendition_url(job_id, r.kind),
+                "type": r.mime,
+                "width": r.width,
+                "height": r.height,
+                "bytes": r.size_bytes,
+            }
+            for r in renditions
+        ],
     }
 
 
-def _parse_range(range_header: Optional[str], file_size: int) -> Optional[Tuple[int, int]]:
-    if not range_header or "=" not in range_header:
-        return None
-    units, rng = range_header.split("=", 1)
-    if units.strip().lower() != "bytes":
-        return None
-    start_s, _, end_s = rng.partition("-")
+@app.get("/events/{job_id}")
+async def job_events(job_id: str):
+    """SSE stream of one job's status: the current state at once, then each change until it finishes."""
+    return await _event_stream([job_id])
+
+
+@app.get("/events")
+async def jobs_events(job_id: List[str] = Query(...)):
+    """One SSE stream multiplexing several jobs (?job_id=a&job_id=b), e.g. for dashboards."""
+    job_ids = list(dict.fromkeys(job_id))
+    if len(job_ids) > STATUS_BATCH_MAX:
+        raise HTTPException(400, f"At most {STATUS_BATCH_MAX} job_ids per stream")
+    return await _event_stream(job_ids)
+
+
+async def _event_stream(job_ids: List[str]) -> StreamingResponse:
+    if events.subscribers >= SSE_MAX_CLIENTS:
+        # clients fall back to polling /status
+        raise HTTPException(503, "Too many event streams")
+    # subscribe before reading the records, so a change in between is not missed
+    sub = events.subscribe(job_ids)
     try:
-        if start_s and end_s:
-            start, end = int(start_s), int(end_s)
-        elif start_s:
-            start, end = int(start_s), file_size - 1
-        else:
-            n = int(end_s)
-            start, end = file_size - n, file_size - 1
-        if start < 0 or end >= file_size or start > end:
-            return None
-        return (start, end)
+        found = await run_db(_status_records, job_ids)
+    except BaseException:
+        sub.close()
+        raise
+    if all(rec is None for rec, _ in found.values()):
+        sub.close()
+        raise HTTPException(404, "Job not found")
+
+    async def stream():
+        try:
+            yield f"retry: {SSE_RETRY_MS}\n\n"
+            watching = set()
+            for job_id in job_ids:
+                rec, renditions = found[job_id]
+                if rec is None:
+                    continue
+                yield _sse("status", _status_payload(job_id, rec, None, renditions))
+                if rec.status not in TERMINAL_STATUSES:
+                    watching.add(job_id)
+            while watching:
+                event = await sub.get(SSE_HEARTBEAT_SECONDS)
+                if event is None:
+                    yield ": ping\n\n"   # keeps proxies from closing an idle stream
+                    continue
+                job_id = event["job_id"]
+                if job_id not in watching:
+                    continue
+                if event["status"] == "succeeded":
+                    rec, renditions = (await run_db(_status_records, [job_id]))[job_id]
+                    if rec is not None:
+                        event = _status_payload(job_id, rec, None, renditions)
+                yield _sse("status", event)
+                if event["status"] in TERMINAL_STATUSES:
+                    watching.discard(job_id)
+        finally:
+            sub.close()
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+def _rendition_url(job_id: str, kind: str) -> str:
+    return f"/video/{job_id}" if kind == "whatsapp" else f"/video/{job_id}/{kind}"
+
+
+@app.get("/users/{user_id}/history")
+async def user_history(user_id: str, cursor: Optional[str] = None, limit: int = 10):
+    """Keyset-paginated job history, newest first; pass next_cursor back to get the next page."""
+    limit = max(1, min(limit, 100))
+    try:
+        recs, next_cursor = await run_db(job_store.get_history_page, user_id, limit, cursor)
     except ValueError:
-        return None
+        raise HTTPException(400, "Invalid cursor")
+    return {
+        "user_id": user_id,
+        "jobs": [
+            {
+                "job_id": r.job_id,
+                "status": r.status,
+                "prompt": r.prompt,
+                "style": r.chosen_style or r.style,
+                "video_url": r.video_path,
+                "created_at": r.created_at,
+            }
+            for r in recs
+        ],
+        "next_cursor": next_cursor,
+    }
 
 
-@app.get("/video/{job_id}")
-def video(job_id: str, request: Request):
-    compressed_path = f"app/static/compressed/{job_id}.mp4"
-    # Serve compressed video if available, else fallback to placeholder
-    path = compressed_path if os.path.exists(compressed_path) else "app/static/placeholder.mp4"
+PLACEHOLDER_VIDEO = "app/static/placeholder.mp4"
 
-    if not os.path.exists(path):
-        raise HTTPException(404, "Video missing")
 
-    file_size = os.path.getsize(path)
-    range_header = request.headers.get("range")
-    rng = _parse_range(range_header, file_size)
+def _video_file(job_id: str) -> Optional[MediaFile]:
+    """Blocking: resolve what /video/{job_id} serves (blob index, legacy copy, else placeholder)."""
+    ref = blob_store.resolve(job_id)
+    if ref is not None:
+        return media_cache.stat(ref.path, digest=ref.digest)
+    path = blob_store.legacy_path(job_id) or PLACEHOLDER_VIDEO
+    try:
+        return media_cache.stat(path)
+    except FileNotFoundError:
+        return None
 
-    def iterfile(start: int = 0, end: int = file_size - 1, chunk_size: int = 64 * 1024):
-        with open(path, "rb") as f:
-            f.seek(start)
-            bytes_left = end - start + 1
-            while bytes_left > 0:
-                chunk = f.read(min(chunk_size, bytes_left))
-                if not chunk:
-                    break
-                bytes_left -= len(chunk)
-                yield chunk
 
-    if rng:
-        start, end = rng
-        headers = {
-            "Content-Range": f"bytes {start}-{end}/{file_size}",
-            "Accept-Ranges": "bytes",
-            "Content-Length": str(end - start + 1),
-        }
-        return StreamingResponse(iterfile(start, end), status_code=206, headers=headers, media_type="video/mp4")
+@app.api_route("/video/{job_id}", methods=["GET", "HEAD"])
+async def video(job_id: str, request: Request):
+    media = media_cache.lookup(job_id)
+    if media is None:
+        media = await run_db(_video_file, job_id)
+        if media is None:
+            raise HTTPException(404, "Video missing")
+        media_cache.store(job_id, media)
+    return media_response(media, request.headers)
 
-    headers = {"Accept-Ranges": "bytes", "Content-Length": str(file_size)}
-    return StreamingResponse(iterfile(), headers=headers, media_type="video/mp4")
+
+def _rendition_file(job_id: str, kind: str) -> Optional[MediaFile]:
+    """Blocking: the stored preview/poster/... of a job's video."""
+    for r in blob_store.renditions(job_id):
+        if r.kind == kind:
+            return media_cache.stat(r.path, digest=r.digest, content_type=r.mime)
+    return None
+
+
+@app.api_route("/video/{job_id}/{kind}", methods=["GET", "HEAD"])
+async def video_rendition(job_id: str, kind: str, request: Request):
+    key = f"{job_id}/{kind}"
+    media = media_cache.lookup(key)
+    if media is None:
+        media = await run_db(_rendition_file, job_id, kind)
+        if media is None:
+            raise HTTPException(404, "Rendition missing")
+        media_cache.store(key, media)
+    return media_response(media, request.headers)
 
 
 @app.post("/optimize_prompt")
@@ -225,73 +446,163 @@ async def optimize(payload: dict):
     if not user_prompt:
         raise HTTPException(400, "Prompt is required")
 
-    optimized = optimize_prompt(user_prompt, style)
+    optimized = await optimize_prompt_async(user_prompt, style)
     return {"optimized_prompt": optimized}
 
 
+def _provider_callback_ok(request: Request, body: bytes) -> bool:
+    """X-Webhook-Signature: sha256=<hex HMAC of the body>, or ?token=<secret> for providers that can't sign."""
+    if not PROVIDER_WEBHOOK_SECRET:
+        return False
+    secret = PROVIDER_WEBHOOK_SECRET.encode()
+    signature = request.headers.get("X-Webhook-Signature", "").removeprefix("sha256=")
+    if signature:
+        expected = hmac.new(secret, body, hashlib.sha256).hexdigest()
+        return hmac.compare_digest(expected.encode(), signature.encode())
+    return hmac.compare_digest(secret, request.query_params.get("token", "").encode())
+
+
+@app.post("/webhook/provider")
+async def provider_webhook(request: Request):
+    """
+    Provider completion callback: re-fetches the job's status from the provider and skips
+    the remaining polls for it. Only the job id is taken from the (authenticated) body.
+    """
+    body = await request.body()
+    if not _provider_callback_ok(request, body):
+        raise HTTPException(403, "Invalid signature")
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        raise HTTPException(400, "Invalid JSON")
+    if not isinstance(payload, dict):
+        raise HTTPException(400, "Expected a JSON object")
+    try:
+        pj = await video_gen.apply_callback(payload)
+    except ProviderError as e:
+        raise HTTPException(503, f"Provider unavailable: {e}")   # the provider retries the callback
+    if pj is None:
+        raise HTTPException(404, "Unknown job")
+    completed = completion.notify(pj)
+    return {"job_id": pj.job_id, "status": pj.status, "completed": completed}
+
+
 # ---------------------------
 # WhatsApp webhook endpoint
 # ---------------------------
 @app.post("/webhook/whatsapp")
 async def whatsapp_webhook(request: Request):
-    # optional signature validation (will skip if no TWILIO_AUTH_TOKEN is set)
-    valid = await validate_request(request)
-    if not valid:
+    """Twilio inbound messages. Everything slow happens after the reply (see process_request)."""
+    t0 = time.perf_counter()
+    try:
+        return await _whatsapp_reply(request)
+    finally:
+        elapsed = time.perf_counter() - t0
+        _webhook_latencies.append(elapsed)
+        _webhook_stats["handled"] += 1
+        if elapsed * 1000 > WEBHOOK_ACK_BUDGET_MS:
+            _webhook_stats["over_budget"] += 1
+            log.warning("WhatsApp webhook took %.0f ms (budget %d ms)", elapsed * 1000, WEBHOOK_ACK_BUDGET_MS)
+
+
+def _webhook_snapshot() -> dict:
+    samples = sorted(_webhook_latencies)
+
+    def pct(p: float) -> Optional[float]:
+        if not samples:
+            return None
+        return round(samples[min(len(samples) - 1, int(p * len(samples)))] * 1000, 1)
+
+    return {**_webhook_stats, "budget_ms": WEBHOOK_ACK_BUDGET_MS,
+            "latency_ms": {"p50": pct(0.50), "p95": pct(0.95), "p99": pct(0.99)}}
+
+
+async def _whatsapp_reply(request: Request) -> Response:
+    # form parsed and signature checked once (validation is skipped if no TWILIO_AUTH_TOKEN is set)
+    msg = await read_inbound(request)
+    if not msg.valid:
         # for dev/demo we continue but log so you can enable/disable validation
         log.warning("Invalid Twilio signature – continuing anyway (dev demo mode)")
 
-    data = await parse_incoming(request)  # from app/integrations/twilio.py
-    user_number = data["from"]
-    user_msg = (data["body"] or "").strip()
+    # Twilio retries slow webhooks with the same MessageSid: answer repeats with the first reply
+    sid = msg.sid
+    first, reply = await inbound.begin(sid)
+    if not first:
+        log.info("Duplicate delivery of MessageSid=%s from %s suppressed", sid, msg.sender)
+        return Response(reply or empty_twiml(), media_type="application/xml")
+    try:
+        response = await _handle_message(msg)
+    except Exception:
+        await inbound.release(sid)
+        raise
+    await inbound.finish(sid, response.body.decode())
+    return response
+
+
+def _twiml(text: str) -> Response:
+    return Response(ack_twiml(text), media_type="application/xml")
+
+
+# --- Commands: normalized message text -> handler returning the reply text ---
+async def _cmd_guide(msg: InboundMessage) -> str:
+    return handle_guide()
+
+
+async def _cmd_status(msg: InboundMessage) -> str:
+    return await handle_status(msg.sender, job_store, video_gen, sessions)
+
+
+async def _cmd_history(msg: InboundMessage) -> str:
+    return await run_db(handle_history, msg.sender, job_store, more=msg.command.endswith("more"))
+
+
+WHATSAPP_COMMANDS: Dict[str, Callable[[InboundMessage], Awaitable[str]]] = {
+    "/help": _cmd_guide, "help": _cmd_guide, "/guide": _cmd_guide, "guide": _cmd_guide,
+    "/status": _cmd_status, "status": _cmd_status,
+    "/history": _cmd_history, "history": _cmd_history,
+    "/history more": _cmd_history, "history more": _cmd_history,
+}
+
+# feedback reactions (every skin tone) -> liked
+FEEDBACK_REACTIONS: Dict[str, bool] = {
+    **{up: True for up in ("👍", "👍🏻", "👍🏼", "👍🏽", "👍🏾", "👍🏿")},
+    **{down: False for down in ("👎", "👎🏻", "👎🏼", "👎🏽", "👎🏾", "👎🏿")},
+}
+
+
+async def _handle_message(msg: InboundMessage) -> Response:
+    user_number = msg.sender
 
     # Cancel any pending inactivity reminder since user is active again
-    cancel_reminder(user_number)
+    reminders.cancel(user_number)
 
-    log.info("WhatsApp incoming from %s: %s", user_number, user_msg)
+    log.info("WhatsApp incoming from %s: %s", user_number, msg.body)
 
     # If empty message
-    if not user_msg:
-        return Response(ack_twiml("❌ Please send a valid prompt."), media_type="application/xml")
-
-    # Normalize command text
-    msg = user_msg.lower().strip()
-
-    # --- Help/Guide ---
-    if msg in ("/help", "help", "/guide", "guide"):
-        guide_text = handle_guide()
-        return Response(ack_twiml(guide_text), media_type="application/xml")
-
-    # --- Status command (last job) ---
-    if msg in ("/status", "status"):
-        status_text = handle_status(user_number, job_store, video_gen)
-        return Response(ack_twiml(status_text), media_type="application/xml")
-
-    # --- History command (recent N jobs) ---
-    if msg in ("/history", "history"):
-        history_text = handle_history(user_number, job_store)
-        return Response(ack_twiml(history_text), media_type="application/xml")
-    
+    if not msg.body:
+        return _twiml("❌ Please send a valid prompt.")
+
+    # --- Commands (/guide, /status, /history) ---
+    command = WHATSAPP_COMMANDS.get(msg.command)
+    if command is not None:
+        return _twiml(await command(msg))
+
+    # one message at a time per user in this process; other processes are kept out by the
+    # conditional session updates
+    async with sessions.lock(user_number):
+        return await _handle_conversation(msg)
+
+
+async def _handle_conversation(msg: InboundMessage) -> Response:
+    user_number = msg.sender
+    state = await run_db(sessions.get, user_number)
+
     # --- Check if user is choosing a style ---
-    pending = job_store.get_pending_prompt(user_number)
-    if pending and pending.awaiting_style:
-        chosen = STYLE_ALIASES.get(msg)
+    pending = state.get(STYLE)
+    if pending and pending.state == AWAITING_STYLE:
+        chosen = STYLE_ALIASES.get(msg.command)
         if not chosen:
-            return Response(ack_twiml("⚠️ Please choose a valid style: anime(✨), cartoon(🎭), or cyberpunk(🤖)."),
-                            media_type="application/xml")
-
-         # Update record with chosen style
-        pending.awaiting_style = False
-        pending.chosen_style = chosen
-
-        # --- ✅ NEW: Cache check before submitting a new job ---
-        h = prompt_hash(pending.prompt, chosen)
-        cached = job_store.get_by_hash(h)
-        if cached and cached.status == "succeeded":
-            # Use existing video from cache
-            if cached.video_path:
-                video_url = f"{PUBLIC_BASE_URL}{cached.video_path}" if PUBLIC_BASE_URL else cached.video_path
-                cache_msg = f"✅ Video fetched from cache!\n\n🔗 {video_url}"
-                return Response(ack_twiml(cache_msg), media_type="application/xml")
+            return _twiml("⚠️ Please choose a valid style: anime(✨), cartoon(🎭), or cyberpunk(🤖).")
 
         # --- Prompt length check ---
         warning_text = ""
@@ -302,61 +613,40 @@ async def whatsapp_webhook(request: Request):
                 "Don't worry — prompt optimizing is on us. ✅\n\n"
             )
 
-        # --- Optimize the prompt ---
-        try:
-            final_prompt = optimize_prompt(pending.prompt, chosen)
-        except Exception:
-            final_prompt = pending.prompt
+        # Record the request durably and answer now; the dispatcher checks the cache,
+        # optimizes, submits and persists it, then follows up (_process_whatsapp_request).
+        if not await run_db(_queue_styled_prompt, user_number, chosen):
+            # another worker already took this prompt (the same reply handled twice)
+            return _twiml("⏳ Your video request is queued — it'll start in a moment!")
 
-        # --- Construct acknowledgement message ---
         ack_text = (
             f"{warning_text}"
-            f"✅ Got it! Generating a video for: optimized prompt for [ {final_prompt} in {chosen} style ]"
-        )
-        response_xml = ack_twiml(ack_text)
-
-        created_at = datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
-        job = video_gen.submit(final_prompt, style=chosen)
-        rec = JobRecord(
-            job_id=job.job_id,
-            status=job.status,
-            video_path=None,
-            provider=PROVIDER_NAME,
-            prompt_hash=prompt_hash(pending.prompt, chosen),
-            prompt=pending.prompt,
-            final_prompt=final_prompt,
-            created_at=created_at,
-            style=chosen,         # <--- persist the chosen style here
-            chosen_style=chosen,  # <--- keep chosen_style for in-memory record
+            f"✅ Got it! Generating your {chosen}-style video for: {pending.prompt}\n"
+            "I'll send the optimized prompt in a moment and the video when it's ready."
         )
-        job_store.put(rec, user_id=user_number)
-        job_store.store_user_job(user_number, job.job_id)
-
-        asyncio.create_task(process_whatsapp_job(job.job_id, user_number, video_gen, job_store))
-        return Response(response_xml, media_type="application/xml")
+        return _twiml(ack_text)
     
-    # --- Feedback flow ---
-    last_job = job_store.get_last_job_for_user(user_number)
-    if last_job and last_job.feedback_pending:
-        if msg in ("👍", "👍🏻", "👍🏼", "👍🏽", "👍🏾", "👍🏿"):  # thumbs up variants
-            save_feedback(last_job.job_id, last_job.prompt or "(unknown)", True)
-            job_store.mark_feedback_received(last_job.job_id, True)
-            schedule_reminder(user_number, job_store)
-            return Response(ack_twiml("🙏 Thanks for your positive feedback!"), media_type="application/xml")
-
-        elif msg in ("👎", "👎🏻", "👎🏼", "👎🏽", "👎🏾", "👎🏿"):  # thumbs down variants
-            save_feedback(last_job.job_id, last_job.prompt or "(unknown)", False)
-            job_store.mark_feedback_received(last_job.job_id, False)
-            schedule_reminder(user_number, job_store)
-            return Response(ack_twiml("🙏 Thanks for your feedback! We'll keep improving."), media_type="application/xml")
+    if pending and pending.state == QUEUED and msg.command in STYLE_ALIASES:
+        # a repeated style choice (e.g. sent twice) isn't a new prompt
+        return _twiml("⏳ Your video request is queued — it'll start in a moment!")
 
-        else:
-            return Response(ack_twiml("⚠️ Please reply with 👍 or 👎 to give feedback before generating a new video."), media_type="application/xml")
-        
+    # --- Feedback flow ---
+    owed = state.get(FEEDBACK)
+    if owed and owed.state == AWAITING_FEEDBACK:
+        liked = FEEDBACK_REACTIONS.get(msg.command)
+        if liked is None:
+            return _twiml("⚠️ Please reply with 👍 or 👎 to give feedback before generating a new video.")
+        # only the process that removes the session records the feedback
+        if await run_db(sessions.take, user_number, FEEDBACK, job_id=owed.job_id):
+            save_feedback(owed.job_id, owed.prompt or "(unknown)", liked)
+            await run_db(job_store.mark_feedback_received, owed.job_id, liked)
+        reminders.schedule(user_number)
+        return _twiml("🙏 Thanks for your positive feedback!" if liked
+                      else "🙏 Thanks for your feedback! We'll keep improving.")
 
     # --- Otherwise treat as new prompt: ask for style first ---
-    # Save prompt temporarily, mark as awaiting style
-    job_store.set_pending_prompt(user_number, user_msg)
+    # Save prompt in the user's session, awaiting a style
+    await run_db(sessions.start, user_number, STYLE, AWAITING_STYLE, prompt=msg.body)
 
     style_prompt = (
         "Nice prompt you got there buddy.\n\n"
@@ -365,40 +655,123 @@ async def whatsapp_webhook(request: Request):
         "• Cartoon (🎭)\n"
         "• Cyberpunk (🤖)"
     )
-    return Response(ack_twiml(style_prompt), media_type="application/xml")
+    return _twiml(style_prompt)
 
-async def process_queue():
-    while True:
-        req = request_queue.dequeue()
-        if not req:
-            await asyncio.sleep(2)
-            continue
+
+def _queue_styled_prompt(user_number: str, style: str) -> bool:
+    """Blocking: claim the user's awaiting prompt for this style and queue it; False if already claimed."""
+    pending = sessions.advance(user_number, STYLE, AWAITING_STYLE, QUEUED, style=style)
+    if pending is None:
+        return False
+    try:
+        request_queue.enqueue(user_number, pending.prompt, style=style, channel="whatsapp")
+    except Exception:
+        sessions.start(user_number, STYLE, AWAITING_STYLE, prompt=pending.prompt)   # let them choose again
+        raise
+    return True
+
+
+def _record_request(req: RequestRecord, job) -> Optional[str]:
+    """
+    Blocking part of a queued submission (DB writes); runs off the event loop.
+    Returns the new job_id, or None when the result cache already had this prompt.
+    """
+    h = prompt_hash(req.prompt, req.style)
+    request_queue.mark_processing(req.id, job.job_id)
+    if getattr(job, "cached", False):
+        log.info("Request %s served from result cache (job=%s)", req.id, job.job_id)
+        return None
+
+    final_prompt = compose_prompt(req.prompt, req.style)
+
+    rec = JobRecord(
+        job_id=job.job_id,
+        status=job.status,
+        video_path=None,
+        provider=getattr(job, "provider", None) or PROVIDER_NAME,
+        prompt_hash=h,
+        prompt=req.prompt,
+        final_prompt=final_prompt,
+        created_at=datetime.now(timezone.utc).isoformat().replace("+00:00", "Z"),
+        style=req.style,
+        chosen_style=req.style,
+    )
+    job_store.put(rec, user_id=req.user_id)
+    return job.job_id
+
+
+async def process_request(req: RequestRecord):
+    if req.channel == "whatsapp":
+        await _process_whatsapp_request(req)
+        return
+    job = await video_gen.submit(req.prompt, style=req.style)
+    job_id = await run_db(_record_request, req, job)
+    if job_id:
+        completion.track(job_id, req.user_id)
+    await run_db(request_queue.mark_done, req.id, True)
+
+
+def _record_whatsapp_request(req: RequestRecord, job, h: str, final_prompt: str):
+    """Blocking: persist a WhatsApp job and tie the queued request to it."""
+    rec = JobRecord(
+        job_id=job.job_id,
+        status=job.status,
+        video_path=None,
+        provider=getattr(job, "provider", None) or PROVIDER_NAME,
+        prompt_hash=h,
+        prompt=req.prompt,
+        final_prompt=final_prompt,
+        created_at=datetime.now(timezone.utc).isoformat().replace("+00:00", "Z"),
+        style=req.style,
+        chosen_style=req.style,
+    )
+    job_store.put(rec, user_id=req.user_id)
+    job_store.store_user_job(req.user_id, job.job_id)
+    request_queue.mark_processing(req.id, job.job_id)
+
+
+async def _process_whatsapp_request(req: RequestRecord):
+    """The slow half of the style-selection webhook: cache → optimize → submit → persist → follow up."""
+    user_number, chosen = req.user_id, req.style
+    try:
+        cached = await run_db(result_cache.lookup, req.prompt, chosen)
+        if cached and cached.video_path:
+            video_url = f"{PUBLIC_BASE_URL}{cached.video_path}" if PUBLIC_BASE_URL else cached.video_path
+            await run_db(request_queue.mark_processing, req.id, cached.job_id)
+            await _follow_up(user_number, f"✅ Video fetched from cache!\n\n🔗 {video_url}")
+            await run_db(request_queue.mark_done, req.id, True)
+            return
 
         try:
-            final_prompt = compose_prompt(req.prompt, req.style)
-            job = video_gen.submit(final_prompt, style=req.style)
-            request_queue.mark_processing(req.id, job.job_id)
-
-            rec = JobRecord(
-                job_id=job.job_id,
-                status=job.status,
-                video_path=None,
-                provider=PROVIDER_NAME,
-                prompt_hash=prompt_hash(req.prompt, req.style),
-                prompt=req.prompt,
-                final_prompt=final_prompt,
-                created_at=datetime.now(timezone.utc).isoformat().replace("+00:00", "Z"),
-                style=req.style,
-                chosen_style=req.style,
-            )
-            job_store.put(rec, user_id=req.user_id)
+            final_prompt = await optimize_prompt_async(req.prompt, chosen)
+        except Exception:
+            final_prompt = req.prompt
+
+        h = prompt_hash(req.prompt, chosen)
+        # cache already checked above; don't count a second miss
+        job = await video_gen.submit(final_prompt, style=chosen, cache_key=h, use_cache=False)
+        await run_db(_record_whatsapp_request, req, job, h, final_prompt)
+    except Exception:
+        await _follow_up(user_number, "❌ Sorry, we couldn't start your video. Please send your prompt again.")
+        raise
+    finally:
+        # no longer "queued": /status now finds the job (or there is none to find)
+        await run_db(sessions.take, user_number, STYLE, QUEUED)
+
+    completion.track(job.job_id, user_number)
+    await _follow_up(user_number, f"🎬 Optimized prompt: [ {final_prompt} in {chosen} style ]\n"
+                                  "I'll send the video as soon as it's ready.")
+    await run_db(request_queue.mark_done, req.id, True)
+
+
+async def _follow_up(user_number: str, text: str):
+    try:
+        await send_message_async(user_number, text)
+    except Exception as e:
+        log.warning("Follow-up to %s failed: %s", user_number, e)
 
-            asyncio.create_task(process_whatsapp_job(job.job_id, req.user_id, video_gen, job_store))
-            request_queue.mark_done(req.id, success=True)
 
-        except Exception as e:
-            log.error(f"Queue processing failed for request {req.id}: {e}")
-            request_queue.mark_done(req.id, success=False)
+dispatcher = RequestDispatcher(request_queue, process_request)
 
 
 @app.post("/feedback")
@@ -414,11 +787,11 @@ async def feedback(payload: dict):
     res = save_feedback(job_id, prompt, bool(liked))
 
     # Look up the job to get the user’s number
-    rec = job_store.get(job_id)
+    rec = await run_db(job_store.get, job_id)
     if rec and rec.user_number:
         try:
             msg = "🙏 Thanks for your feedback! It helps us improve."
-            send_message(rec.user_number, msg)
+            await send_message_async(rec.user_number, msg)
         except Exception as e:
             raise HTTPException(500, f"Feedback saved but failed to notify user: {str(e)}")
 
@@ -1,23 +1,19 @@
-import sqlite3
+# app/migrate_db.py
+"""
+Apply pending schema migrations to jobs.db and requests.db (the app also does this at startup).
+Usage:
+  python -m app.migrate_db
+"""
+from app import db, requests_db
+from app.migrations import JOBS_MIGRATIONS, REQUESTS_MIGRATIONS
 
-DB_PATH = "jobs.db"
 
-conn = sqlite3.connect(DB_PATH)
-cur = conn.cursor()
+def main():
+    jobs_version = db.init_db()
+    print(f"✅ {db.DB_PATH}: schema version {jobs_version}/{JOBS_MIGRATIONS[-1][0]}")
+    req_version = requests_db.init_db()
+    print(f"✅ {requests_db.REQ_DB_PATH}: schema version {req_version}/{REQUESTS_MIGRATIONS[-1][0]}")
 
-# Add style column if not exists
-try:
-    cur.execute("ALTER TABLE jobs ADD COLUMN style TEXT;")
-    print("✅ Added 'style' column")
-except sqlite3.OperationalError as e:
-    print(f"Skipped 'style': {e}")
 
-# Add final_prompt column if not exists
-try:
-    cur.execute("ALTER TABLE jobs ADD COLUMN final_prompt TEXT;")
-    print("✅ Added 'final_prompt' column")
-except sqlite3.OperationalError as e:
-    print(f"Skipped 'final_prompt': {e}")
-
-conn.commit()
-conn.close()
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+# app/migrations.py
+"""
+Versioned schema migrations for jobs.db and requests.db.
+
+Each database records the last applied step in PRAGMA user_version. migrate()
+applies the pending steps in order, each inside its own write transaction, and
+is called from init_db() at startup (or by `python -m app.migrate_db`). Steps are
+written to be safe on files created before versioning existed.
+"""
+
+import logging
+import sqlite3
+from typing import Callable, List, Tuple, Union
+
+from app.storage import SQLiteDB
+
+log = logging.getLogger("app.migrations")
+
+Step = Union[str, Callable[[sqlite3.Connection], None]]
+Migration = Tuple[int, str, List[Step]]
+
+# Epoch milliseconds from a stored TEXT timestamp (ISO-8601 with/without 'Z', or CURRENT_TIMESTAMP).
+_MS_FROM_CREATED_AT = "CAST(ROUND((julianday(created_at) - 2440587.5) * 86400000) AS INTEGER)"
+
+
+def add_columns(table: str, *columns: Tuple[str, str]) -> Callable[[sqlite3.Connection], None]:
+    """ALTER TABLE ADD COLUMN for each (name, decl) the table doesn't have yet."""
+    def step(conn: sqlite3.Connection):
+        existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+        for name, decl in columns:
+            if name not in existing:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {decl}")
+    return step
+
+
+JOBS_MIGRATIONS: List[Migration] = [
+    (1, "jobs table", [
+        """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT,
+            job_id TEXT UNIQUE,
+            prompt TEXT,
+            status TEXT,
+            video_url TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+    ]),
+    (2, "style and final_prompt columns", [
+        add_columns("jobs", ("style", "TEXT"), ("final_prompt", "TEXT")),
+    ]),
+    (3, "prompt_hash and sortable created_ms", [
+        add_columns("jobs", ("prompt_hash", "TEXT"), ("created_ms", "INTEGER")),
+        f"UPDATE jobs SET created_ms = {_MS_FROM_CREATED_AT} WHERE created_ms IS NULL",
+    ]),
+    (4, "history and cache indexes", [
+        "CREATE INDEX IF NOT EXISTS idx_jobs_user_created ON jobs (user_id, created_ms)",
+        "CREATE INDEX IF NOT EXISTS idx_jobs_prompt_hash ON jobs (prompt_hash)",
+        # job_id is already indexed by its UNIQUE constraint
+    ]),
+    (5, "persistent result cache", [
+        """
+        CREATE TABLE IF NOT EXISTS result_cache (
+            prompt_hash TEXT PRIMARY KEY,
+            job_id TEXT NOT NULL,
+            style TEXT,
+            video_path TEXT,
+            provider_output_url TEXT,
+            size_bytes INTEGER,
+            created_ms INTEGER NOT NULL,
+            last_hit_ms INTEGER NOT NULL,
+            hits INTEGER NOT NULL DEFAULT 0
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_result_cache_last_hit ON result_cache (last_hit_ms)",
+    ]),
+    (6, "normalized prompt for near-duplicate lookup", [
+        add_columns("result_cache", ("normalized_prompt", "TEXT")),
+    ]),
+    (7, "optimized prompt cache", [
+        """
+        CREATE TABLE IF NOT EXISTS prompt_optimizations (
+            cache_key TEXT PRIMARY KEY,
+            style TEXT,
+            optimized_prompt TEXT NOT NULL,
+            model TEXT,
+            created_ms INTEGER NOT NULL
+        )
+        """,
+    ]),
+    (8, "content-addressed video blobs", [
+        """
+        CREATE TABLE IF NOT EXISTS blobs (
+            digest TEXT PRIMARY KEY,
+            size_bytes INTEGER NOT NULL,
+            created_ms INTEGER NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS job_blobs (
+            job_id TEXT PRIMARY KEY,
+            digest TEXT NOT NULL,
+            created_ms INTEGER NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_job_blobs_digest ON job_blobs (digest)",
+    ]),
+    (9, "renditions of stored videos", [
+        """
+        CREATE TABLE IF NOT EXISTS blob_renditions (
+            source_digest TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            digest TEXT NOT NULL,
+            mime TEXT NOT NULL,
+            width INTEGER,
+            height INTEGER,
+            created_ms INTEGER NOT NULL,
+            PRIMARY KEY (source_digest, kind)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_blob_renditions_digest ON blob_renditions (digest)",
+    ]),
+    (10, "inbound message ids (webhook idempotency)", [
+        """
+        CREATE TABLE IF NOT EXISTS inbound_messages (
+            message_sid TEXT PRIMARY KEY,
+            response TEXT,
+            created_ms INTEGER NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_inbound_messages_created ON inbound_messages (created_ms)",
+    ]),
+    (11, "conversation sessions", [
+        # one row per (user, kind): 'style' = prompt awaiting/queued with a style, 'feedback' = 👍/👎 owed
+        """
+        CREATE TABLE IF NOT EXISTS sessions (
+            user_number TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            state TEXT NOT NULL,
+            prompt TEXT,
+            style TEXT,
+            job_id TEXT,
+            updated_ms INTEGER NOT NULL,
+            expires_ms INTEGER NOT NULL,
+            PRIMARY KEY (user_number, kind)
+        ) WITHOUT ROWID
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions (expires_ms)",
+    ]),
+    (12, "inactivity reminders", [
+        # next reminder per user; sent = reminders already sent since the user was last active
+        """
+        CREATE TABLE IF NOT EXISTS reminders (
+            user_number TEXT PRIMARY KEY,
+            due_ms INTEGER NOT NULL,
+            sent INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+        """,
+    ]),
+]
+
+REQUESTS_MIGRATIONS: List[Migration] = [
+    (1, "requests table", [
+        """
+        CREATE TABLE IF NOT EXISTS requests (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT,
+            job_id TEXT,
+            prompt TEXT,
+            status TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+    ]),
+    (2, "style and claim columns", [
+        add_columns("requests", ("style", "TEXT"), ("claimed_by", "TEXT"), ("claimed_at", "TIMESTAMP")),
+    ]),
+    (3, "sortable created_ms", [
+        add_columns("requests", ("created_ms", "INTEGER")),
+        f"UPDATE requests SET created_ms = {_MS_FROM_CREATED_AT} WHERE created_ms IS NULL",
+    ]),
+    (4, "dequeue and job lookup indexes", [
+        "CREATE INDEX IF NOT EXISTS idx_requests_status_created ON requests (status, created_ms, id)",
+        "CREATE INDEX IF NOT EXISTS idx_requests_job_id ON requests (job_id)",
+    ]),
+    (5, "request channel", [
+        # 'api' (/generate) or 'whatsapp' (style chosen in the webhook, optimized in the background)
+        add_columns("requests", ("channel", "TEXT NOT NULL DEFAULT 'api'")),
+    ]),
+]
+
+
+def current_version(db: SQLiteDB) -> int:
+    return db.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(db: SQLiteDB, migrations: List[Migration]) -> int:
+    """Apply pending migrations in order; returns the resulting schema version."""
+    version = current_version(db)
+    for number, name, steps in migrations:
+        if number <= version:
+            continue
+        with db.transaction(immediate=True) as conn:
+            # re-check under the write lock: another process may have migrated meanwhile
+            if conn.execute("PRAGMA user_version").fetchone()[0] >= number:
+                continue
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+            conn.execute(f"PRAGMA user_version = {number}")
+        log.info("Applied migration %s #%d: %s", db.path, number, name)
+        version = number
+    return version
@@ -1,16 +1,69 @@
+import asyncio
+import logging
 from abc import ABC, abstractmethod
-from typing import Optional, Dict
+from typing import Any, Optional, Dict, List
+
+log = logging.getLogger("provider.base")
+
+TERMINAL_STATUSES = ("succeeded", "failed", "not_found")
 
 class VideoJob:
     def __init__(self, job_id: str, status: str = "queued",
-                 video_url: Optional[str] = None, error: Optional[str] = None):
+                 video_url: Optional[str] = None, error: Optional[str] = None,
+                 provider: Optional[str] = None):
         self.job_id = job_id
         self.status = status
         self.video_url = video_url
         self.error = error
+        self.provider = provider   # backend that owns the job, when a router picked one
+
+    @property
+    def is_terminal(self) -> bool:
+        return self.status in TERMINAL_STATUSES
 
 class BaseProvider(ABC):
+    """
+    Async provider protocol. submit/fetch must not block the event loop; fetch raises
+    ProviderError (app.providers.client) when the provider can't be asked right now, so a
+    transient outage is retried later instead of failing the job.
+    """
+
+    # Typical seconds from submit to a finished video; used to pace status checks.
+    expected_seconds: float = 30.0
+
     @abstractmethod
-    def submit(self, prompt: str, options: Dict) -> VideoJob: ...
+    async def submit(self, prompt: str, options: Dict) -> VideoJob: ...
     @abstractmethod
-    def fetch(self, job_id: str) -> VideoJob: ...
+    async def fetch(self, job_id: str) -> VideoJob: ...
+
+    async def fetch_many(self, job_ids: List[str]) -> Dict[str, VideoJob]:
+        """
+        Status for several jobs at once, fetched concurrently. Jobs whose fetch failed are
+        left out of the result. Providers with a bulk endpoint should override this.
+        """
+        results = await asyncio.gather(*(self.fetch(job_id) for job_id in job_ids), return_exceptions=True)
+        out = {}
+        for job_id, res in zip(job_ids, results):
+            if isinstance(res, Exception):
+                log.debug("Could not fetch job=%s: %s", job_id, res)
+                continue   # not polled this round; the scheduler counts it as a fetch error
+            if isinstance(res, BaseException):
+                raise res
+            out[job_id] = res
+        return out
+
+    def callback_job_id(self, payload: Dict) -> Optional[str]:
+        """
+        The job a provider webhook payload is about (None if it isn't one of ours). Nothing
+        else in the body is trusted: the caller re-fetches the status from the provider.
+        """
+        job_id = payload.get("job_id") or payload.get("id")
+        if not isinstance(job_id, (str, int)) or isinstance(job_id, bool) or not job_id:
+            return None
+        return str(job_id)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"provider": type(self).__name__}
+
+    async def aclose(self):
+        """Release pooled connections (called at shutdown)."""
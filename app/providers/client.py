@@ -0,0 +1,218 @@
+# app/providers/client.py
+"""
+Shared HTTP plumbing for remote video providers: one pooled keep-alive httpx client per
+provider, per-call timeouts, retries with exponential backoff and jitter, and a circuit
+breaker that fails calls fast while the provider is down instead of queueing them up.
+"""
+
+import os
+import time
+import random
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+import httpx
+
+log = logging.getLogger("provider.client")
+
+# ---- Configuration (from env) ----
+PROVIDER_TIMEOUT_SECONDS = float(os.getenv("PROVIDER_TIMEOUT_SECONDS", "15"))          # per call
+PROVIDER_CONNECT_TIMEOUT_SECONDS = float(os.getenv("PROVIDER_CONNECT_TIMEOUT_SECONDS", "5"))
+PROVIDER_RETRIES = int(os.getenv("PROVIDER_RETRIES", "2"))
+PROVIDER_MAX_CONNECTIONS = int(os.getenv("PROVIDER_MAX_CONNECTIONS", "20"))
+PROVIDER_BREAKER_FAILURES = int(os.getenv("PROVIDER_BREAKER_FAILURES", "5"))            # consecutive failed attempts
+PROVIDER_BREAKER_RESET_SECONDS = float(os.getenv("PROVIDER_BREAKER_RESET_SECONDS", "30"))
+
+_RETRY_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+_BACKOFF_BASE = 0.2
+_BACKOFF_MAX = 5.0
+
+
+class ProviderError(RuntimeError):
+    """A provider call failed for a transient reason (network, timeout, 5xx, circuit open)."""
+
+
+class CircuitOpen(ProviderError):
+    pass
+
+
+class CircuitBreaker:
+    """
+    closed -> open after `failures` consecutive failed attempts; open -> half-open after
+    `reset_after` seconds, letting one trial call through; its outcome closes or re-opens.
+    """
+
+    def __init__(self, failures: int = PROVIDER_BREAKER_FAILURES,
+                 reset_after: float = PROVIDER_BREAKER_RESET_SECONDS):
+        self.failures = failures
+        self.reset_after = reset_after
+        self.state = "closed"
+        self._consecutive = 0
+        self._opened_at = 0.0
+        self._trial_at: Optional[float] = None   # when the half-open trial call went out
+        self.stats: Dict[str, int] = {"opened": 0, "rejected": 0}
+
+    def allow(self) -> bool:
+        if self.state == "closed":
+            return True
+        now = time.monotonic()
+        if self.state == "open" and now - self._opened_at >= self.reset_after:
+            self.state = "half_open"
+            self._trial_at = None
+        # a trial that never reported back (cancelled caller) is replaced after reset_after
+        if self.state == "half_open" and (self._trial_at is None or now - self._trial_at >= self.reset_after):
+            self._trial_at = now
+            return True
+        self.stats["rejected"] += 1
+        return False
+
+    def record(self, ok: bool):
+        if ok:
+            if self.state != "closed":
+                log.info("Provider circuit closed")
+            self.state = "closed"
+            self._consecutive = 0
+            return
+        self._consecutive += 1
+        if self.state == "half_open" or self._consecutive >= self.failures:
+            if self.state != "open":
+                self.stats["opened"] += 1
+                log.warning("Provider circuit open for %.0fs after %d failures", self.reset_after, self._consecutive)
+            self.state = "open"
+            self._opened_at = time.monotonic()
+
+    def retry_in(self) -> float:
+        if self.state != "open":
+            return 0.0
+        return max(0.0, self.reset_after - (time.monotonic() - self._opened_at))
+
+
+class ProviderClient:
+    """Pooled async HTTP for one provider; request() retries transient failures behind a breaker."""
+
+    def __init__(
+        self,
+        base_url: str = "",
+        headers: Optional[Dict[str, str]] = None,
+        timeout: float = PROVIDER_TIMEOUT_SECONDS,
+        connect_timeout: float = PROVIDER_CONNECT_TIMEOUT_SECONDS,
+        retries: int = PROVIDER_RETRIES,
+        max_connections: int = PROVIDER_MAX_CONNECTIONS,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        self.base_url = base_url
+        self.headers = headers or {}
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.retries = retries
+        self.max_connections = max_connections
+        self.breaker = breaker or CircuitBreaker()
+        self._client: Optional[httpx.AsyncClient] = None
+        # callers queue here rather than in httpx's pool, whose wait counts against the timeout
+        self._slots = asyncio.Semaphore(max_connections)
+        self._waiting = 0
+        self._latencies: Deque[float] = deque(maxlen=512)
+        self.stats: Dict[str, int] = {"calls": 0, "retries": 0, "failed": 0, "timeouts": 0}
+
+    def _get_client(self) -> httpx.AsyncClient:
+        # created lazily so it binds to the running loop
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers=self.headers,
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections),
+                timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout),
+            )
+        return self._client
+
+    async def request(self, method: str, url: str, idempotent: bool = True,
+                      timeout: Optional[float] = None, **kwargs) -> httpx.Response:
+        """
+        Send one call and return a 2xx/4xx response; raises ProviderError when the provider
+        could not be reached, kept failing, or the circuit is open. Non-idempotent calls
+        (submits) are only retried when the request provably never reached the server
+        (connect errors) or the server refused it outright (429/503), so a job is never
+        created twice.
+        """
+        if timeout is not None:
+            kwargs["timeout"] = httpx.Timeout(timeout, connect=min(timeout, self.connect_timeout))
+
+        self.stats["calls"] += 1
+        for attempt in range(self.retries + 1):
+            self._waiting += 1
+            try:
+                await self._slots.acquire()
+            finally:
+                self._waiting -= 1
+            # checked once a connection is free, so calls queued behind an outage fail fast too;
+            # retries stop as soon as other calls' failures have opened the circuit
+            if not (self.breaker.allow() if attempt == 0 else self.breaker.state != "open"):
+                self._slots.release()
+                raise CircuitOpen(f"provider circuit open (retry in {self.breaker.retry_in():.0f}s)")
+            t0 = time.perf_counter()
+            try:
+                resp = await self._get_client().request(method, url, **kwargs)
+            except httpx.TransportError as e:
+                self._slots.release()
+                if isinstance(e, httpx.TimeoutException):
+                    self.stats["timeouts"] += 1
+                self.breaker.record(False)
+                retryable = idempotent or isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout))
+                error, delay = f"{type(e).__name__}: {e}", None
+            except BaseException:
+                self._slots.release()
+                raise
+            else:
+                self._slots.release()
+                self._latencies.append(time.perf_counter() - t0)
+                if resp.status_code not in _RETRY_STATUSES:
+                    self.breaker.record(resp.status_code < 500)
+                    return resp
+                self.breaker.record(False)
+                retryable = idempotent or resp.status_code in (429, 503)
+                error = f"HTTP {resp.status_code}"
+                delay = _retry_after(resp)
+
+            if not retryable or attempt == self.retries:
+                break
+            self.stats["retries"] += 1
+            backoff = min(_BACKOFF_MAX, _BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.0)
+            if delay is not None:
+                backoff = min(_BACKOFF_MAX, delay)
+            log.info("%s %s failed (%s); retry %d in %.2fs", method, url, error, attempt + 1, backoff)
+            await asyncio.sleep(backoff)
+
+        self.stats["failed"] += 1
+        raise ProviderError(f"{method} {url}: {error}")
+
+    def snapshot(self) -> Dict[str, Any]:
+        samples = sorted(self._latencies)
+
+        def pct(p: float) -> Optional[float]:
+            if not samples:
+                return None
+            return round(samples[min(len(samples) - 1, int(p * len(samples)))] * 1000, 1)
+
+        return {
+            **self.stats,
+            "waiting": self._waiting,
+            "circuit": self.breaker.state,
+            **{f"circuit_{k}": v for k, v in self.breaker.stats.items()},
+            "call_ms": {"p50": pct(0.50), "p95": pct(0.95)},
+        }
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+def _retry_after(resp: httpx.Response) -> Optional[float]:
+    value = resp.headers.get("retry-after", "")
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
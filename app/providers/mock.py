@@ -1,21 +1,86 @@
-import time, threading
+import os, time, random, asyncio, threading
+from typing import Any, Dict, List, Optional
 from .base import BaseProvider, VideoJob
+from .client import ProviderError
+
+MOCK_LATENCY_SECONDS = float(os.getenv("MOCK_LATENCY_SECONDS", "2"))
 
 class MockProvider(BaseProvider):
-    def __init__(self):
-        self._jobs = {}
+    """
+    Local fake provider. Jobs finish `latency` seconds (± jitter) after submit; status is
+    derived from the clock on fetch, so thousands of in-flight jobs cost no threads.
+    Each API call can also be given a response time (lognormal around call_latency, spread
+    call_sigma) and a call_error_rate of ProviderErrors, to exercise routing and hedging.
+    """
+
+    def __init__(self, latency: Optional[float] = None, jitter: float = 0.0, failure_rate: float = 0.0,
+                 call_latency: float = 0.0, call_sigma: float = 0.0, call_error_rate: float = 0.0):
+        self.latency = MOCK_LATENCY_SECONDS if latency is None else latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.call_latency = call_latency
+        self.call_sigma = call_sigma
+        self.call_error_rate = call_error_rate
+        self.expected_seconds = self.latency
+        self.submit_calls = 0
+        self.fetch_calls = 0
+        self._jobs: Dict[str, VideoJob] = {}
+        self._ready_at: Dict[str, float] = {}
+        self._last_id = 0
+        self._id_lock = threading.Lock()
+
+    def _next_id(self) -> str:
+        # millisecond timestamp ids, bumped when several jobs land in the same millisecond
+        with self._id_lock:
+            self._last_id = max(int(time.time() * 1000), self._last_id + 1)
+            return str(self._last_id)
+
+    async def _call(self):
+        """Simulated API round trip."""
+        if self.call_latency:
+            delay = self.call_latency
+            if self.call_sigma:
+                delay *= random.lognormvariate(0.0, self.call_sigma)
+            await asyncio.sleep(delay)
+        if self.call_error_rate and random.random() < self.call_error_rate:
+            raise ProviderError("mock call failed")
 
-    def submit(self, prompt: str, options: dict) -> VideoJob:
-        job_id = str(int(time.time() * 1000))
+    async def submit(self, prompt: str, options: dict) -> VideoJob:
+        self.submit_calls += 1
+        await self._call()
+        job_id = self._next_id()
         job = VideoJob(job_id, status="processing")
         self._jobs[job_id] = job
+        self._ready_at[job_id] = time.monotonic() + max(0.0, self.latency + random.uniform(-self.jitter, self.jitter))
+        return job
+
+    async def fetch(self, job_id: str) -> VideoJob:
+        await self._call()
+        return self._status(job_id)
 
-        def _worker():
-            time.sleep(2)  # simulate generation latency
-            job.status = "succeeded"  # video served via /video/{job_id}
+    async def fetch_many(self, job_ids: List[str]) -> Dict[str, VideoJob]:
+        await self._call()   # one round trip, like a bulk status endpoint
+        return {job_id: self._status(job_id) for job_id in job_ids}
 
-        threading.Thread(target=_worker, daemon=True).start()
+    def _status(self, job_id: str) -> VideoJob:
+        self.fetch_calls += 1
+        job = self._jobs.get(job_id)
+        if not job:
+            return VideoJob(job_id, status="not_found", error="Unknown job")
+        if job.status == "processing" and time.monotonic() >= self._ready_at[job_id]:
+            if self.failure_rate and random.random() < self.failure_rate:
+                job.status, job.error = "failed", "mock_failure"
+            else:
+                job.status = "succeeded"  # video served via /video/{job_id}
         return job
 
-    def fetch(self, job_id: str) -> VideoJob:
-        return self._jobs.get(job_id) or VideoJob(job_id, status="not_found", error="Unknown job")
+    def snapshot(self) -> Dict[str, Any]:
+        return {"provider": "MockProvider", "jobs": len(self._jobs), "submit_calls": self.submit_calls,
+                "fetch_calls": self.fetch_calls}
+
+    def complete(self, job_id: str, status: str = "succeeded") -> Optional[VideoJob]:
+        """Finish a job immediately (stands in for a provider webhook in tests/benchmarks)."""
+        job = self._jobs.get(job_id)
+        if job:
+            job.status = status
+        return job
@@ -1,27 +1,39 @@
 # app/providers/modelslab.py
 
+import os
 import time
 import logging
-import requests
-from typing import Dict, Optional
+from typing import Any, Dict, Optional
 from .base import BaseProvider, VideoJob
+from .client import ProviderClient
+
+# Public URL of POST /webhook/provider; when set, ModelsLab pushes completions instead of us polling.
+MODELSLAB_WEBHOOK_URL = os.getenv("MODELSLAB_WEBHOOK_URL", "")
+MODELSLAB_API_URL = os.getenv("MODELSLAB_API_URL", "https://api.modelslab.com/v1/video").rstrip("/")
+MODELSLAB_SUBMIT_TIMEOUT_SECONDS = float(os.getenv("MODELSLAB_SUBMIT_TIMEOUT_SECONDS", "30"))
+MODELSLAB_FETCH_TIMEOUT_SECONDS = float(os.getenv("MODELSLAB_FETCH_TIMEOUT_SECONDS", "10"))
 
 class ModelsLabProvider(BaseProvider):
     """
     Adapter that exposes a BaseProvider interface over the Stable Diffusion
-    (ModelsLab) API directly using `requests`.
+    (ModelsLab) API, through one pooled keep-alive ProviderClient (timeouts,
+    retries, circuit breaker).
 
     For the demo, we still always return 'processing' first and let the frontend
     show the static placeholder.mp4. Real API responses are cached internally.
     """
 
-    def __init__(self, api_key: Optional[str] = None):
-        self.api_key = api_key or "DEMO_KEY"  # replace with real key if available
-        self.api_url = "https://api.modelslab.com/v1/video"  # example endpoint
+    expected_seconds = 60.0
+
+    def __init__(self, api_key: Optional[str] = None, api_url: Optional[str] = None,
+                 client: Optional[ProviderClient] = None):
+        self.api_key = api_key or os.getenv("MODELSLAB_API_KEY") or "DEMO_KEY"
+        self.api_url = (api_url or MODELSLAB_API_URL).rstrip("/")
+        self.client = client or ProviderClient(headers={"Authorization": f"Bearer {self.api_key}"})
         self._jobs: Dict[str, Dict] = {}  # job_id -> {"fetch_url":..., "output_url":..., "status":...}
         self.log = logging.getLogger("provider.modelslab")
 
-    def submit(self, prompt: str, options: Dict) -> VideoJob:
+    async def submit(self, prompt: str, options: Dict) -> VideoJob:
         overrides = self._style_overrides(options.get("style")) if options else {}
 
         try:
@@ -29,21 +41,24 @@ class ModelsLabProvider(BaseProvider):
                 "prompt": prompt,
                 **overrides
             }
-            headers = {"Authorization": f"Bearer {self.api_key}"}
+            if MODELSLAB_WEBHOOK_URL:
+                payload["webhook"] = MODELSLAB_WEBHOOK_URL
 
-            resp = requests.post(self.api_url + "/text2video", json=payload, headers=headers)
+            # not idempotent: only retried when the request never reached ModelsLab
+            resp = await self.client.request("POST", self.api_url + "/text2video", json=payload,
+                                             idempotent=False, timeout=MODELSLAB_SUBMIT_TIMEOUT_SECONDS)
             resp.raise_for_status()
             resp_json = resp.json()
 
         except Exception as e:
-            self.log.exception("Error submitting job to ModelsLab")
+            self.log.warning("Error submitting job to ModelsLab: %s", e)
             return VideoJob(job_id="n/a", status="failed", error=str(e))
 
         if resp_json.get("status") == "error":
             return VideoJob(job_id="n/a", status="failed", error=resp_json.get("message"))
 
         # Ensure job_id
-        job_id = resp_json.get("id") or str(int(time.time() * 1000))
+        job_id = str(resp_json.get("id") or int(time.time() * 1000))
         self._jobs[job_id] = {
             "fetch_url": resp_json.get("fetch_url"),
             "output_url": resp_json.get("output_url"),
@@ -52,7 +67,7 @@ class ModelsLabProvider(BaseProvider):
 
         return VideoJob(job_id=job_id, status="processing")
 
-    def fetch(self, job_id: str) -> VideoJob:
+    async def fetch(self, job_id: str) -> VideoJob:
         data = self._jobs.get(job_id)
         if not data:
             return VideoJob(job_id, status="not_found", error="Unknown job")
@@ -66,15 +81,15 @@ class ModelsLabProvider(BaseProvider):
             data["status"] = "succeeded"
             return VideoJob(job_id, status="succeeded", video_url=data.get("output_url"))
 
-        # Poll provider
+        # Poll provider; ProviderError (network, 5xx, circuit open) propagates so the
+        # caller retries later instead of failing the job
         if fetch_url:
+            resp = await self.client.request("GET", fetch_url, timeout=MODELSLAB_FETCH_TIMEOUT_SECONDS)
             try:
-                headers = {"Authorization": f"Bearer {self.api_key}"}
-                resp = requests.get(fetch_url, headers=headers)
                 resp.raise_for_status()
                 resp_json = resp.json()
             except Exception as e:
-                self.log.exception("Error fetching job result")
+                self.log.warning("Error fetching job result for %s: %s", job_id, e)
                 return VideoJob(job_id, status="failed", error=str(e))
 
             status = resp_json.get("status")
@@ -90,6 +105,19 @@ class ModelsLabProvider(BaseProvider):
 
         return VideoJob(job_id, status="processing")
 
+    def snapshot(self) -> Dict[str, Any]:
+        return {"provider": "ModelsLabProvider", "jobs": len(self._jobs), **self.client.snapshot()}
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    def callback_job_id(self, payload: Dict) -> Optional[str]:
+        """The id in a ModelsLab webhook body ({"id", "status", ...}) if it's a job we submitted."""
+        job_id = payload.get("id") or payload.get("job_id")
+        if not isinstance(job_id, (str, int)) or str(job_id) not in self._jobs:
+            return None
+        return str(job_id)
+
     def _style_overrides(self, style: Optional[str]) -> Dict:
         """Optional gentle tuning based on 'style' selection."""
         if not style:
@@ -0,0 +1,349 @@
+# app/providers/router.py
+"""
+ProviderRouter: a BaseProvider that spreads submissions over several backends.
+
+Each backend has a weight and a quota of concurrent jobs. A submission goes to a
+backend drawn at random in proportion to weight x health, where health is measured
+from recent submit latency and error rate. Backends over quota are skipped while others
+have room, and a backend that keeps failing is ejected for a cooldown (a CircuitBreaker).
+Hedging is optional: if the chosen backend has not answered by its own latency
+percentile, a second backend is asked too, the first good answer wins and the other
+call is cancelled. A failed submission fails over to the next backend. Status calls go
+to whichever backend owns the job.
+"""
+
+import os
+import time
+import random
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from .base import BaseProvider, VideoJob
+from .client import CircuitBreaker
+
+log = logging.getLogger("provider.router")
+
+# ---- Configuration (from env) ----
+ROUTER_HEDGE = os.getenv("ROUTER_HEDGE", "false").lower() in ("1", "true", "yes")
+ROUTER_HEDGE_PERCENTILE = float(os.getenv("ROUTER_HEDGE_PERCENTILE", "0.95"))
+ROUTER_HEDGE_MIN_SECONDS = float(os.getenv("ROUTER_HEDGE_MIN_SECONDS", "0.2"))
+ROUTER_EJECT_FAILURES = int(os.getenv("ROUTER_EJECT_FAILURES", "3"))
+ROUTER_EJECT_SECONDS = float(os.getenv("ROUTER_EJECT_SECONDS", "30"))
+ROUTER_MAX_TRACKED = int(os.getenv("ROUTER_MAX_TRACKED", "100000"))   # job -> backend entries kept
+
+_EWMA_ALPHA = 0.2
+_MIN_SAMPLES = 20   # latency samples needed before hedging off a backend's percentile
+
+
+class Backend:
+    """One routed provider with its live stats."""
+
+    def __init__(self, name: str, provider: BaseProvider, weight: float = 1.0,
+                 max_concurrency: Optional[int] = None):
+        self.name = name
+        self.provider = provider
+        self.weight = weight
+        self.max_concurrency = max_concurrency   # jobs in flight at the provider; None = unlimited
+        self.active = 0
+        self.latency: Optional[float] = None     # EWMA submit seconds
+        self.error_rate = 0.0                    # EWMA of failed submits
+        self.breaker = CircuitBreaker(ROUTER_EJECT_FAILURES, ROUTER_EJECT_SECONDS)
+        self._samples: Deque[float] = deque(maxlen=256)
+        self.stats: Dict[str, int] = {"routed": 0, "succeeded": 0, "failed": 0, "failovers": 0,
+                                      "hedged": 0, "hedge_wins": 0, "cancelled": 0, "over_quota": 0}
+
+    @property
+    def has_room(self) -> bool:
+        return self.max_concurrency is None or self.active < self.max_concurrency
+
+    def score(self, default_latency: float) -> float:
+        latency = self.latency if self.latency is not None else default_latency
+        return self.weight * (1.0 - self.error_rate) ** 2 / max(latency, 0.01)
+
+    def record(self, seconds: float, ok: bool):
+        self.breaker.record(ok)
+        self.error_rate += _EWMA_ALPHA * ((0.0 if ok else 1.0) - self.error_rate)
+        if ok:
+            self.observe(seconds)
+
+    def observe(self, seconds: float):
+        self._samples.append(seconds)
+        self.latency = seconds if self.latency is None else self.latency + _EWMA_ALPHA * (seconds - self.latency)
+
+    def percentile(self, p: float) -> Optional[float]:
+        if len(self._samples) < _MIN_SAMPLES:
+            return None
+        samples = sorted(self._samples)
+        return samples[min(len(samples) - 1, int(p * len(samples)))]
+
+    def snapshot(self, default_latency: float) -> Dict[str, Any]:
+        p50, p95 = self.percentile(0.50), self.percentile(0.95)
+        return {
+            **self.stats,
+            "weight": self.weight,
+            "max_concurrency": self.max_concurrency,
+            "active": self.active,
+            "score": round(self.score(default_latency), 3),
+            "latency_ms": round(self.latency * 1000, 1) if self.latency is not None else None,
+            "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            "error_rate": round(self.error_rate, 3),
+            "state": self.breaker.state,
+        }
+
+
+class ProviderRouter(BaseProvider):
+    def __init__(self, hedge: bool = ROUTER_HEDGE, hedge_percentile: float = ROUTER_HEDGE_PERCENTILE,
+                 hedge_min_seconds: float = ROUTER_HEDGE_MIN_SECONDS, max_tracked: int = ROUTER_MAX_TRACKED):
+        self.backends: Dict[str, Backend] = {}
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_seconds = hedge_min_seconds
+        self.max_tracked = max_tracked
+        # public job id -> (backend name, the backend's own id); ids are only rewritten on a clash
+        self._owner: "OrderedDict[str, Tuple[str, str]]" = OrderedDict()
+        self._public: Dict[Tuple[str, str], str] = {}
+        self._running: set = set()   # public ids holding a backend's concurrency slot
+        self.stats: Dict[str, int] = {"submits": 0, "failed": 0, "hedges": 0, "failovers": 0, "unroutable": 0}
+
+    def add(self, name: str, provider: BaseProvider, weight: float = 1.0,
+            max_concurrency: Optional[int] = None) -> "ProviderRouter":
+        self.backends[name] = Backend(name, provider, weight, max_concurrency)
+        self.expected_seconds = max(b.provider.expected_seconds for b in self.backends.values())
+        return self
+
+    # ---- Routing ----
+    def _default_latency(self) -> float:
+        known = [b.latency for b in self.backends.values() if b.latency is not None]
+        return sorted(known)[len(known) // 2] if known else 1.0
+
+    def _ranked(self, exclude: Tuple[str, ...] = ()) -> List[Backend]:
+        """
+        Backends in the order to try them: any ejected one whose cooldown is over goes first
+        (its breaker grants one trial request, whose outcome re-admits or re-ejects it), then
+        the healthy ones in a weighted draw, then the rest by score.
+        """
+        default = self._default_latency()
+        candidates = [b for b in self.backends.values() if b.name not in exclude]
+        trial = [b for b in candidates if b.breaker.state != "closed" and b.breaker.allow()]
+        healthy = [b for b in candidates if b.breaker.state == "closed"]
+        if not healthy and not trial:
+            # everyone ejected: try them anyway rather than refuse the user
+            healthy = candidates
+        with_room = [b for b in healthy if b.has_room] or healthy
+        ranked = []
+        pool = list(with_room)
+        while pool:
+            scores = [b.score(default) for b in pool]
+            pick = random.choices(pool, weights=scores)[0] if sum(scores) > 0 else pool[0]
+            ranked.append(pick)
+            pool.remove(pick)
+        ranked += sorted((b for b in healthy if b not in with_room), key=lambda b: -b.score(default))
+        return trial + ranked
+
+    async def submit(self, prompt: str, options: Dict) -> VideoJob:
+        self.stats["submits"] += 1
+        tried: Tuple[str, ...] = ()
+        last: Optional[VideoJob] = None
+        while True:
+            ranked = self._ranked(tried)
+            if not ranked:
+                break
+            primary = ranked[0]
+            if not primary.has_room:
+                primary.stats["over_quota"] += 1
+            hedge = ranked[1] if self.hedge and len(ranked) > 1 else None
+            backend, job, asked = await self._submit_hedged(primary, hedge, prompt, options)
+            if job.status != "failed":
+                return self._adopt(backend, job)
+            last = job
+            tried += asked
+            if len(tried) < len(self.backends):
+                self.stats["failovers"] += 1
+                primary.stats["failovers"] += 1
+                log.info("Submit to %s failed (%s); failing over", primary.name, job.error)
+        self.stats["failed"] += 1
+        if last is None:
+            self.stats["unroutable"] += 1
+            return VideoJob(job_id="n/a", status="failed", error="no provider configured")
+        return last
+
+    async def _submit_hedged(self, primary: Backend, hedge: Optional[Backend], prompt: str,
+                             options: Dict) -> Tuple[Backend, VideoJob, Tuple[str, ...]]:
+        """The first good answer from primary (and hedge, if primary is slow), and who was asked."""
+        first = asyncio.ensure_future(self._submit_one(primary, prompt, options))
+        delay = primary.percentile(self.hedge_percentile) if hedge else None
+        if delay is None:
+            return primary, await first, (primary.name,)
+        try:
+            done, _ = await asyncio.wait({first}, timeout=max(delay, self.hedge_min_seconds))
+        except asyncio.CancelledError:
+            first.cancel()
+            raise
+        if done:
+            return primary, first.result(), (primary.name,)
+
+        self.stats["hedges"] += 1
+        hedge.stats["hedged"] += 1
+        second = asyncio.ensure_future(self._submit_one(hedge, prompt, options))
+        racers = {first: primary, second: hedge}
+        pending = set(racers)
+        result: Optional[Tuple[Backend, VideoJob]] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    job = task.result()
+                    if result is None or (result[1].status == "failed" and job.status != "failed"):
+                        result = (racers[task], job)
+                if result[1].status != "failed":
+                    break
+        finally:
+            for task in pending:
+                # the loser may still have created a job upstream; it is simply never polled
+                task.cancel()
+                racers[task].stats["cancelled"] += 1
+        if result[0] is hedge:
+            hedge.stats["hedge_wins"] += 1
+        return result[0], result[1], (primary.name, hedge.name)
+
+    async def _submit_one(self, backend: Backend, prompt: str, options: Dict) -> VideoJob:
+        backend.stats["routed"] += 1
+        t0 = time.perf_counter()
+        try:
+            job = await backend.provider.submit(prompt, options)
+        except asyncio.CancelledError:
+            # a hedge loser: at least this slow, which the percentile should still see
+            backend.observe(time.perf_counter() - t0)
+            raise
+        except Exception as e:
+            log.debug("Submit to %s raised %r", backend.name, e)
+            job = VideoJob(job_id="n/a", status="failed", error=str(e))
+        ok = job.status != "failed"
+        backend.record(time.perf_counter() - t0, ok)
+        backend.stats["succeeded" if ok else "failed"] += 1
+        return job
+
+    def _adopt(self, backend: Backend, job: VideoJob) -> VideoJob:
+        public = job.job_id
+        if public in self._owner and self._owner[public] != (backend.name, job.job_id):
+            public = f"{backend.name}-{job.job_id}"
+        self._owner[public] = (backend.name, job.job_id)
+        self._public[(backend.name, job.job_id)] = public
+        while len(self._owner) > self.max_tracked:
+            old, key = self._owner.popitem(last=False)
+            self._public.pop(key, None)
+            if old in self._running:
+                self._running.discard(old)
+                self.backends[key[0]].active -= 1
+        if public not in self._running:
+            self._running.add(public)
+            backend.active += 1
+        return VideoJob(public, job.status, job.video_url, job.error, provider=backend.name)
+
+    def _settle(self, backend: Backend, native_id: str, pj: VideoJob) -> VideoJob:
+        """Rename a backend's job to its public id; release its quota slot once finished."""
+        public = self._public.get((backend.name, native_id), native_id)
+        if pj.is_terminal and public in self._running:
+            self._running.discard(public)
+            backend.active -= 1
+        return VideoJob(public, pj.status, pj.video_url, pj.error, provider=backend.name)
+
+    # ---- Status ----
+    async def fetch(self, job_id: str) -> VideoJob:
+        owner = self._owner.get(job_id)
+        if owner is None:
+            # not routed by this process (e.g. before a restart): ask each backend
+            for backend in self.backends.values():
+                pj = await backend.provider.fetch(job_id)
+                if pj.status != "not_found":
+                    return VideoJob(job_id, pj.status, pj.video_url, pj.error, provider=backend.name)
+            return VideoJob(job_id, status="not_found", error="Unknown job")
+        backend = self.backends[owner[0]]
+        return self._settle(backend, owner[1], await backend.provider.fetch(owner[1]))
+
+    async def fetch_many(self, job_ids: List[str]) -> Dict[str, VideoJob]:
+        groups: Dict[str, List[str]] = {}
+        unowned = []
+        for job_id in job_ids:
+            owner = self._owner.get(job_id)
+            if owner is None:
+                unowned.append(job_id)
+            else:
+                groups.setdefault(owner[0], []).append(owner[1])
+
+        async def one(name: str, native_ids: List[str]) -> Dict[str, VideoJob]:
+            backend = self.backends[name]
+            try:
+                results = await backend.provider.fetch_many(native_ids)
+            except Exception as e:
+                log.warning("Status poll of %s failed: %r", name, e)
+                return {}
+            out = {}
+            for native_id, pj in results.items():
+                pj = self._settle(backend, native_id, pj)
+                out[pj.job_id] = pj
+            return out
+
+        out: Dict[str, VideoJob] = {}
+        for part in await asyncio.gather(*(one(n, ids) for n, ids in groups.items())):
+            out.update(part)
+        if unowned:
+            out.update(await super().fetch_many(unowned))
+        return out
+
+    def callback_job_id(self, payload: Dict) -> Optional[str]:
+        """Public id of the routed job a webhook is about; its status comes from fetch()."""
+        for backend in self.backends.values():
+            native = backend.provider.callback_job_id(payload)
+            if native is None:
+                continue
+            public = self._public.get((backend.name, native))
+            if public is not None:
+                return public
+            if len(self.backends) == 1:
+                return native
+        return None
+
+    # ---- Lifecycle / metrics ----
+    def snapshot(self) -> Dict[str, Any]:
+        default = self._default_latency()
+        return {
+            "provider": "ProviderRouter",
+            **self.stats,
+            "hedging": self.hedge,
+            "tracked": len(self._owner),
+            "running": len(self._running),
+            "backends": {name: {**b.snapshot(default), "provider": b.provider.snapshot()}
+                         for name, b in self.backends.items()},
+        }
+
+    async def aclose(self):
+        for backend in self.backends.values():
+            await backend.provider.aclose()
+
+
+def build_provider(spec: str) -> BaseProvider:
+    """
+    "mock" / "modelslab" -> that provider; a comma list such as "modelslab:3:20,mock:1"
+    (name[:weight[:max_concurrency]]) -> a ProviderRouter over them.
+    """
+    from .mock import MockProvider
+    from .modelslab import ModelsLabProvider
+
+    kinds = {"mock": MockProvider, "modelslab": ModelsLabProvider}
+    entries = [e.strip() for e in spec.split(",") if e.strip()]
+    if len(entries) == 1 and ":" not in entries[0]:
+        return kinds.get(entries[0], MockProvider)()
+
+    router = ProviderRouter()
+    for entry in entries:
+        name, *rest = entry.split(":")
+        if name not in kinds:
+            raise ValueError(f"Unknown video provider {name!r} in {spec!r}")
+        weight = float(rest[0]) if rest and rest[0] else 1.0
+        quota = int(rest[1]) if len(rest) > 1 and rest[1] else None
+        router.add(name, kinds[name](), weight, quota)
+    return router
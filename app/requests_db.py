@@ -1,73 +1,94 @@
-import sqlite3
 import os
+from app.storage import SQLiteDB, epoch_ms
+from app.migrations import REQUESTS_MIGRATIONS, migrate
 
 # Separate database file just for queued requests
 REQ_DB_PATH = os.getenv("REQ_DB_PATH", "requests.db")
 
+_db = SQLiteDB(REQ_DB_PATH)
+
 def get_connection():
-    conn = sqlite3.connect(REQ_DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """This thread's pooled connection to requests.db (do not close it)."""
+    return _db.connection()
 
 def init_db():
-    """Initialize the requests queue table."""
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS requests (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id TEXT,
-        job_id TEXT,
-        prompt TEXT,
-        status TEXT,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    )
-    """)
-    conn.commit()
-    conn.close()
+    """Create/upgrade the requests queue schema (versioned migrations, see app/migrations.py)."""
+    return migrate(_db, REQUESTS_MIGRATIONS)
 
 # ---------------- Queue operations ----------------
 
-def insert_request(user_id: str, prompt: str) -> int:
+def insert_request(user_id: str, prompt: str, style: str = None, channel: str = "api") -> int:
     """Add a new request to the queue with status=queued."""
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("""
-        INSERT INTO requests (user_id, prompt, status)
-        VALUES (?, ?, 'queued')
-    """, (user_id, prompt))
-    conn.commit()
-    req_id = cur.lastrowid
-    conn.close()
-    return req_id
+    cur = _db.execute("""
+        INSERT INTO requests (user_id, prompt, style, channel, status, created_ms)
+        VALUES (?, ?, ?, ?, 'queued', ?)
+    """, (user_id, prompt, style, channel, epoch_ms()))
+    return cur.lastrowid
 
 def get_next_request():
     """Fetch the oldest queued request (FIFO)."""
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("""
+    return _db.execute("""
         SELECT * FROM requests
         WHERE status = 'queued'
-        ORDER BY created_at ASC
+        ORDER BY created_ms ASC, id ASC
         LIMIT 1
-    """)
-    row = cur.fetchone()
-    conn.close()
-    return row
+    """).fetchone()
+
+def claim_requests(worker_id: str, limit: int = 1):
+    """
+    Atomically claim up to `limit` of the oldest queued requests for one worker (FIFO).
+    BEGIN IMMEDIATE takes the write lock before the SELECT, so concurrent workers or
+    processes never claim the same row.
+    """
+    with _db.transaction(immediate=True) as conn:
+        rows = conn.execute("""
+            SELECT * FROM requests
+            WHERE status = 'queued'
+            ORDER BY created_ms ASC, id ASC
+            LIMIT ?
+        """, (limit,)).fetchall()
+        if rows:
+            ids = [row["id"] for row in rows]
+            conn.execute(
+                f"UPDATE requests SET status = 'claimed', claimed_by = ?, claimed_at = CURRENT_TIMESTAMP "
+                f"WHERE id IN ({','.join('?' * len(ids))})",
+                (worker_id, *ids),
+            )
+    return rows
+
+def requeue_stale_claims(max_age_seconds: int) -> int:
+    """Put claimed-but-never-submitted requests back in the queue (their worker died)."""
+    cur = _db.execute("""
+        UPDATE requests
+        SET status = 'queued', claimed_by = NULL, claimed_at = NULL
+        WHERE status = 'claimed' AND claimed_at < datetime('now', ?)
+    """, (f"-{int(max_age_seconds)} seconds",))
+    return cur.rowcount
+
+def touch_claims(worker_id: str, req_ids) -> int:
+    """Refresh claimed_at on a live worker's claims so requeue_stale_claims leaves them alone."""
+    ids = list(req_ids)
+    if not ids:
+        return 0
+    cur = _db.execute(
+        f"UPDATE requests SET claimed_at = CURRENT_TIMESTAMP "
+        f"WHERE status = 'claimed' AND claimed_by = ? AND id IN ({','.join('?' * len(ids))})",
+        (worker_id, *ids),
+    )
+    return cur.rowcount
 
 def update_request_status(req_id: int, status: str, job_id: str = None):
     """Update the request status (and attach job_id if provided)."""
-    conn = get_connection()
-    cur = conn.cursor()
     if job_id:
-        cur.execute(
+        _db.execute(
             "UPDATE requests SET status = ?, job_id = ? WHERE id = ?",
             (status, job_id, req_id),
         )
     else:
-        cur.execute(
+        _db.execute(
             "UPDATE requests SET status = ? WHERE id = ?",
             (status, req_id),
         )
-    conn.commit()
-    conn.close()
+
+def close():
+    _db.close_all()
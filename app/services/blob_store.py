@@ -0,0 +1,233 @@
+# app/services/blob_store.py
+
+import os
+import time
+import shutil
+import hashlib
+import logging
+import tempfile
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app import db
+
+log = logging.getLogger("services.blob_store")
+
+# ---- Configuration (from env) ----
+BLOB_STORE_DIR = os.getenv("BLOB_STORE_DIR", "app/static/blobs")
+LEGACY_VIDEO_DIR = "app/static/compressed"                             # pre-blob-store per-job copies
+BLOB_GC_MIN_AGE_SECONDS = int(os.getenv("BLOB_GC_MIN_AGE_SECONDS", "3600"))
+
+_HASH_CHUNK = 1024 * 1024
+
+# file extension per stored media type (videos are .mp4; renditions may be images)
+EXTENSIONS = {"video/mp4": ".mp4", "image/jpeg": ".jpg", "image/webp": ".webp"}
+
+
+@dataclass
+class BlobRef:
+    digest: str
+    size_bytes: int
+    path: str
+
+
+@dataclass
+class Rendition:
+    kind: str            # "whatsapp", "preview", "poster", ...
+    mime: str
+    width: Optional[int]
+    height: Optional[int]
+    size_bytes: int
+    digest: str
+    path: str
+
+
+def file_digest(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class BlobStore:
+    """
+    Content-addressed storage for finished videos: each distinct file is kept once under
+    <root>/<aa>/<sha256>.mp4 and jobs point at it through the job_blobs index in jobs.db.
+    Identical outputs (and repeats of a prompt_hash) cost an index row instead of a copy;
+    Renditions (previews, posters) are blobs too, keyed by the video they were made from
+    in blob_renditions, so every job sharing a video shares its renditions.
+    gc() removes blobs nothing points at any more.
+    """
+
+    def __init__(self, root: str = BLOB_STORE_DIR):
+        self.root = root
+        self.tmp_dir = os.path.join(root, "tmp")
+        self.stats: Dict[str, int] = {"stored": 0, "deduplicated": 0, "aliased": 0, "bytes_saved": 0, "renditions": 0}
+
+    def blob_path(self, digest: str, mime: str = "video/mp4") -> str:
+        return os.path.join(self.root, digest[:2], f"{digest}{EXTENSIONS[mime]}")
+
+    def scratch_path(self, name: str) -> str:
+        """A path on the blob filesystem to write an output to before ingest() (rename, not copy)."""
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        return os.path.join(self.tmp_dir, name)
+
+    def _place(self, src_path: str, dest: str, move: bool):
+        """Atomically put src at dest (rename when moving on the same filesystem)."""
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        if move:
+            try:
+                os.replace(src_path, dest)
+                return
+            except OSError:
+                pass   # different filesystem: fall back to copy + rename
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(dest), suffix=".part")
+        os.close(fd)
+        try:
+            shutil.copyfile(src_path, tmp)
+            os.replace(tmp, dest)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    def ingest(self, job_id: str, src_path: str, move: bool = True) -> BlobRef:
+        """
+        Store src_path (if its content is new) and point job_id at it (blocking: IO + DB).
+        move=True consumes src_path either way.
+        """
+        return self._store(src_path, "video/mp4", move,
+                           lambda digest, size: db.link_job_blob(job_id, digest, size))
+
+    def ingest_rendition(self, source_digest: str, kind: str, src_path: str, mime: str,
+                         width: Optional[int] = None, height: Optional[int] = None) -> BlobRef:
+        """Store a rendition of the video source_digest (blocking; consumes src_path)."""
+        ref = self._store(src_path, mime, True,
+                          lambda digest, size: db.link_rendition(source_digest, kind, digest, size, mime, width, height))
+        self.stats["renditions"] += 1
+        return ref
+
+    def _store(self, src_path: str, mime: str, move: bool, link: Callable[[str, int], None]) -> BlobRef:
+        digest = file_digest(src_path)
+        size = os.path.getsize(src_path)
+        dest = self.blob_path(digest, mime)
+
+        placed = False
+        if not os.path.exists(dest):
+            self._place(src_path, dest, move)
+            placed = True
+        link(digest, size)
+        if not os.path.exists(dest):
+            # a concurrent gc() removed the file between our check and the index write
+            self._place(src_path, dest, move)
+            placed = True
+
+        if placed:
+            self.stats["stored"] += 1
+        else:
+            self.stats["deduplicated"] += 1
+            self.stats["bytes_saved"] += size
+            if move and os.path.exists(src_path):
+                os.remove(src_path)
+        return BlobRef(digest, size, dest)
+
+    def alias_prompt(self, job_id: str, prompt_hash: str) -> Optional[BlobRef]:
+        """Cache hit: point job_id at the video an earlier job with the same prompt_hash stored (no copy)."""
+        if not prompt_hash:
+            return None
+        row = db.get_prompt_blob(prompt_hash, job_id)
+        if row is None or not os.path.exists(self.blob_path(row["digest"])):
+            return None
+        db.link_job_blob(job_id, row["digest"], row["size_bytes"])
+        self.stats["aliased"] += 1
+        self.stats["bytes_saved"] += row["size_bytes"]
+        return BlobRef(row["digest"], row["size_bytes"], self.blob_path(row["digest"]))
+
+    def resolve(self, job_id: str) -> Optional[BlobRef]:
+        """The blob behind a job's video, if indexed and present on disk."""
+        row = db.get_job_blob(job_id)
+        if row is None:
+            return None
+        path = self.blob_path(row["digest"])
+        if not os.path.exists(path):
+            log.warning("Blob %s for job=%s is indexed but missing on disk", row["digest"], job_id)
+            return None
+        return BlobRef(row["digest"], row["size_bytes"], path)
+
+    def renditions(self, job_id: str) -> List[Rendition]:
+        """Renditions of a job's video that are present on disk, smallest first."""
+        found = []
+        for row in db.get_job_renditions(job_id):
+            path = self.blob_path(row["digest"], row["mime"])
+            if os.path.exists(path):
+                found.append(Rendition(row["kind"], row["mime"], row["width"], row["height"],
+                                       row["size_bytes"], row["digest"], path))
+        return found
+
+    def path_for_job(self, job_id: str) -> Optional[str]:
+        """File to serve for /video/{job_id}: the indexed blob, else a legacy per-job copy."""
+        ref = self.resolve(job_id)
+        if ref is not None:
+            return ref.path
+        return self.legacy_path(job_id)
+
+    def legacy_path(self, job_id: str) -> Optional[str]:
+        legacy = os.path.join(LEGACY_VIDEO_DIR, f"{job_id}.mp4")
+        return legacy if os.path.exists(legacy) else None
+
+    def unlink(self, job_id: str):
+        db.unlink_job_blob(job_id)
+
+    def gc(self, min_age_seconds: int = BLOB_GC_MIN_AGE_SECONDS) -> Tuple[int, int]:
+        """
+        Delete blobs no job references (and stray files the index doesn't know) older than
+        min_age_seconds. Returns (files removed, bytes freed).
+        """
+        cutoff = time.time() - min_age_seconds
+        removed, freed = 0, 0
+        for digest, size in db.delete_unreferenced_blobs(int(cutoff * 1000)):
+            if db.blob_exists(digest):
+                continue   # re-ingested since the sweep
+            for mime in EXTENSIONS:
+                try:
+                    os.remove(self.blob_path(digest, mime))
+                    removed += 1
+                    freed += size
+                except FileNotFoundError:
+                    pass
+
+        if not os.path.isdir(self.root):
+            return removed, freed
+        for dirpath, _, files in os.walk(self.root):
+            for name in files:
+                path = os.path.join(dirpath, name)
+                digest = name.split(".", 1)[0]
+                orphan = dirpath == self.tmp_dir or name.endswith(".part") or not db.blob_exists(digest)
+                try:
+                    if orphan and os.path.getmtime(path) < cutoff:
+                        freed += os.path.getsize(path)
+                        os.remove(path)
+                        removed += 1
+                except FileNotFoundError:
+                    pass
+        return removed, freed
+
+    def import_legacy(self, legacy_dir: str = LEGACY_VIDEO_DIR) -> Tuple[int, int]:
+        """Move per-job copies (<job_id>.mp4) into the store. Returns (files imported, bytes saved)."""
+        imported, saved_before = 0, self.stats["bytes_saved"]
+        if not os.path.isdir(legacy_dir):
+            return 0, 0
+        for name in sorted(os.listdir(legacy_dir)):
+            if not name.endswith(".mp4"):
+                continue
+            self.ingest(name[:-4], os.path.join(legacy_dir, name), move=True)
+            imported += 1
+        return imported, self.stats["bytes_saved"] - saved_before
+
+    def snapshot(self) -> Dict[str, Any]:
+        try:
+            blobs, total_bytes, links = db.blob_totals()
+        except Exception:
+            blobs, total_bytes, links = None, None, None
+        return {**self.stats, "blobs": blobs, "bytes": total_bytes, "jobs": links}
@@ -0,0 +1,105 @@
+# app/services/events.py
+"""
+In-process job event bus: VideoGenerator publishes a small status event whenever a
+job's status changes, and /events/{job_id} (Server-Sent Events) streams them to
+browsers instead of having each one poll /status. publish() may be called from any
+thread (status merges run on the DB executor); delivery always happens on the loop.
+"""
+
+import os
+import asyncio
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+log = logging.getLogger("services.events")
+
+# ---- Configuration (from env) ----
+EVENT_QUEUE_SIZE = int(os.getenv("EVENT_QUEUE_SIZE", "16"))   # per subscriber; oldest dropped when full
+
+
+class Subscription:
+    """One watcher's queue of events for a set of job ids; close() when done."""
+
+    def __init__(self, bus: "JobEventBus", job_ids: List[str], maxsize: int):
+        self.bus = bus
+        self.job_ids = job_ids
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize)
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Next event, or None if none arrived within timeout."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.bus._unsubscribe(self)
+
+
+class JobEventBus:
+    def __init__(self, queue_size: int = EVENT_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subs: Dict[str, Set[Subscription]] = {}
+        self._count = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.stats: Dict[str, int] = {"published": 0, "delivered": 0, "dropped": 0, "subscribed": 0}
+
+    def bind(self, loop: asyncio.AbstractEventLoop):
+        """Attach to the app's event loop (at startup); events published before that are discarded."""
+        self._loop = loop
+
+    @property
+    def subscribers(self) -> int:
+        return self._count
+
+    def subscribe(self, job_ids: Iterable[str]) -> Subscription:
+        """Must be called on the loop."""
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+        sub = Subscription(self, list(job_ids), self.queue_size)
+        for job_id in sub.job_ids:
+            self._subs.setdefault(job_id, set()).add(sub)
+        self._count += 1
+        self.stats["subscribed"] += 1
+        return sub
+
+    def _unsubscribe(self, sub: Subscription):
+        removed = False
+        for job_id in sub.job_ids:
+            subs = self._subs.get(job_id)
+            if subs and sub in subs:
+                subs.discard(sub)
+                removed = True
+                if not subs:
+                    del self._subs[job_id]
+        if removed:
+            self._count -= 1
+
+    def publish(self, job_id: str, event: Dict[str, Any]):
+        """Thread-safe; cheap no-op when nobody is watching the job."""
+        if job_id not in self._subs or self._loop is None:
+            return
+        self.stats["published"] += 1
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            self._deliver(job_id, event)
+            return
+        try:
+            self._loop.call_soon_threadsafe(self._deliver, job_id, event)
+        except RuntimeError:
+            log.debug("Event loop closed; dropping event for job=%s", job_id)
+
+    def _deliver(self, job_id: str, event: Dict[str, Any]):
+        for sub in list(self._subs.get(job_id, ())):
+            if sub.queue.full():
+                # a slow reader only needs the latest state
+                sub.queue.get_nowait()
+                self.stats["dropped"] += 1
+            sub.queue.put_nowait(event)
+            self.stats["delivered"] += 1
+
+    def snapshot(self) -> Dict[str, int]:
+        return {**self.stats, "subscribers": self._count, "watched_jobs": len(self._subs)}
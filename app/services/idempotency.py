@@ -0,0 +1,137 @@
+# app/services/idempotency.py
+"""
+Inbound message idempotency. Twilio retries a webhook it thinks failed (e.g. a slow
+reply), with the same MessageSid. The first delivery of a sid claims it in the
+inbound_messages table and later stores its TwiML reply there; any repeat gets that reply
+back instead of being handled again (which could submit a second, billed generation).
+Recent sids are also kept in a bounded in-memory LRU so most repeats skip the database,
+and a repeat arriving while the first delivery is still running in this process waits
+for its reply. Entries expire after INBOUND_SEEN_TTL_SECONDS.
+"""
+
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from app import db
+from app.storage import epoch_ms, run_db
+
+log = logging.getLogger("services.idempotency")
+
+# ---- Configuration (from env) ----
+INBOUND_SEEN_TTL_SECONDS = int(os.getenv("INBOUND_SEEN_TTL_SECONDS", str(24 * 3600)))
+INBOUND_SEEN_MAX_ENTRIES = int(os.getenv("INBOUND_SEEN_MAX_ENTRIES", "50000"))   # in-memory LRU
+INBOUND_DUPLICATE_WAIT_SECONDS = float(os.getenv("INBOUND_DUPLICATE_WAIT_SECONDS", "10"))
+INBOUND_PURGE_EVERY = 1000   # claims between purges of expired rows
+
+
+class InboundDedup:
+    def __init__(self, ttl_seconds: int = INBOUND_SEEN_TTL_SECONDS, max_entries: int = INBOUND_SEEN_MAX_ENTRIES,
+                 wait_seconds: float = INBOUND_DUPLICATE_WAIT_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.wait_seconds = wait_seconds
+        self._seen: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()   # sid -> (reply, monotonic time)
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self._claims = 0
+        self.stats: Dict[str, int] = {"handled": 0, "duplicates": 0, "memory_hits": 0, "db_hits": 0,
+                                      "waited": 0, "in_flight_elsewhere": 0, "released": 0, "purged": 0,
+                                      "unkeyed": 0}
+
+    async def begin(self, sid: str) -> Tuple[bool, Optional[str]]:
+        """
+        (True, None): first delivery, handle it and call finish() or release().
+        (False, reply): a repeat; send reply, which is None if the first delivery hasn't
+        produced one yet (still running in another process, or slower than wait_seconds).
+        """
+        if not sid:
+            self.stats["unkeyed"] += 1
+            return True, None
+
+        hit = self._seen.get(sid)
+        if hit is not None and time.monotonic() - hit[1] < self.ttl_seconds:
+            self._seen.move_to_end(sid)
+            self.stats["duplicates"] += 1
+            self.stats["memory_hits"] += 1
+            return False, hit[0]
+
+        first = self._in_flight.get(sid)
+        if first is not None:
+            try:
+                reply = await asyncio.wait_for(asyncio.shield(first), self.wait_seconds)
+            except asyncio.TimeoutError:
+                reply = ""
+            if reply is None:
+                return await self.begin(sid)   # the first delivery failed and was released
+            self.stats["duplicates"] += 1
+            self.stats["waited"] += 1
+            return False, reply or None
+
+        # claim before anyone else can, in this process...
+        self._in_flight[sid] = asyncio.get_running_loop().create_future()
+        try:
+            claimed, reply = await run_db(self._claim, sid)
+        except Exception:
+            self._settle(sid, None)
+            raise
+        if claimed:
+            self.stats["handled"] += 1
+            return True, None
+
+        # ...and across processes
+        self._settle(sid, reply)
+        self.stats["duplicates"] += 1
+        if reply is None:
+            self.stats["in_flight_elsewhere"] += 1
+        else:
+            self.stats["db_hits"] += 1
+            self._remember(sid, reply)
+        return False, reply
+
+    def _claim(self, sid: str) -> Tuple[bool, Optional[str]]:
+        """Blocking: claim the sid in the database, purging expired rows now and then."""
+        cutoff = epoch_ms() - self.ttl_seconds * 1000
+        self._claims += 1
+        if self._claims % INBOUND_PURGE_EVERY == 0:
+            self.stats["purged"] += db.purge_inbound_messages(cutoff)
+        return db.claim_inbound_message(sid, cutoff)
+
+    async def finish(self, sid: str, reply: str):
+        """Store the first delivery's reply for repeats to get."""
+        if not sid:
+            return
+        self._remember(sid, reply)
+        self._settle(sid, reply)
+        try:
+            await run_db(db.set_inbound_response, sid, reply)
+        except Exception:
+            log.exception("Could not store reply for MessageSid=%s", sid)
+
+    async def release(self, sid: str):
+        """Handling failed: forget the claim so Twilio's retry is handled normally."""
+        if not sid:
+            return
+        self.stats["released"] += 1
+        try:
+            await run_db(db.release_inbound_message, sid)
+        except Exception:
+            log.exception("Could not release MessageSid=%s", sid)
+        finally:
+            self._settle(sid, None)   # a repeat waiting on this delivery now handles it itself
+
+    def _settle(self, sid: str, reply: Optional[str]):
+        first = self._in_flight.pop(sid, None)
+        if first is not None and not first.done():
+            first.set_result(reply)
+
+    def _remember(self, sid: str, reply: str):
+        self._seen[sid] = (reply, time.monotonic())
+        self._seen.move_to_end(sid)
+        while len(self._seen) > self.max_entries:
+            self._seen.popitem(last=False)
+
+    def snapshot(self) -> Dict[str, int]:
+        return {**self.stats, "cached": len(self._seen), "in_flight": len(self._in_flight)}
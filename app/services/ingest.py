@@ -0,0 +1,279 @@
+# app/services/ingest.py
+"""
+Provider-output ingest: stream a finished video from the provider's URL to local disk
+with one pooled HTTP client, so it can go straight into transcoding. Downloads are
+chunked (never held in memory), resume with Range requests after a dropped connection,
+are checked against the size/digest the server announced (or the caller expects), and
+are limited in number, in size and by free disk space.
+"""
+
+import os
+import time
+import base64
+import shutil
+import asyncio
+import hashlib
+import logging
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, BinaryIO, Deque, Dict, Optional
+
+import httpx
+
+log = logging.getLogger("services.ingest")
+
+# ---- Configuration (from env) ----
+INGEST_MAX_CONCURRENCY = int(os.getenv("INGEST_MAX_CONCURRENCY", "4"))
+INGEST_MAX_BYTES = int(os.getenv("INGEST_MAX_MB", "500")) * 1000 * 1000
+INGEST_MIN_FREE_BYTES = int(os.getenv("INGEST_MIN_FREE_MB", "1024")) * 1000 * 1000
+INGEST_TIMEOUT_SECONDS = float(os.getenv("INGEST_TIMEOUT_SECONDS", "30"))        # per read / connect
+INGEST_DEADLINE_SECONDS = float(os.getenv("INGEST_DEADLINE_SECONDS", "600"))     # whole download
+INGEST_RETRIES = int(os.getenv("INGEST_RETRIES", "4"))
+
+_CHUNK = 1024 * 1024
+_DISK_CHECK_EVERY = 64 * 1024 * 1024     # re-check free space this often when the size is unknown
+_RETRY_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+
+
+class IngestError(RuntimeError):
+    pass
+
+
+class _Retry(Exception):
+    """A transient failure: resume from what is already on disk."""
+
+
+@dataclass
+class Download:
+    path: str
+    size_bytes: int
+    sha256: str
+    resumes: int      # times the transfer continued with a Range request
+    seconds: float
+
+
+def _announced_sha256(headers: httpx.Headers) -> Optional[str]:
+    """Hex sha-256 of the full file from Repr-Digest (RFC 9530) or Digest (RFC 3230), if sent."""
+    for name in ("repr-digest", "digest"):
+        value = headers.get(name)
+        if not value:
+            continue
+        for item in value.split(","):
+            algo, _, encoded = item.strip().partition("=")
+            if algo.strip().lower() != "sha-256":
+                continue
+            try:
+                return base64.b64decode(encoded.strip().strip(":")).hex()
+            except ValueError:
+                return None
+    return None
+
+
+def _total_size(resp: httpx.Response) -> Optional[int]:
+    if resp.status_code == 206:
+        total = resp.headers.get("content-range", "").rpartition("/")[2]
+        return int(total) if total.isdigit() else None
+    length = resp.headers.get("content-length")
+    return int(length) if length and length.isdigit() else None
+
+
+class Downloader:
+    """Bounded, resumable, verified streaming downloads over one pooled httpx client."""
+
+    def __init__(
+        self,
+        max_concurrency: int = INGEST_MAX_CONCURRENCY,
+        max_bytes: int = INGEST_MAX_BYTES,
+        min_free_bytes: int = INGEST_MIN_FREE_BYTES,
+        timeout: float = INGEST_TIMEOUT_SECONDS,
+        deadline: float = INGEST_DEADLINE_SECONDS,
+        retries: int = INGEST_RETRIES,
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_bytes = max_bytes
+        self.min_free_bytes = min_free_bytes
+        self.timeout = timeout
+        self.deadline = deadline
+        self.retries = retries
+        self._client: Optional[httpx.AsyncClient] = None
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._waiting = 0
+        self._active = 0
+        self._latencies: Deque[float] = deque(maxlen=512)
+        self.stats: Dict[str, int] = {
+            "downloads": 0, "bytes": 0, "resumes": 0, "restarts": 0, "failed": 0,
+            "checksum_mismatches": 0, "too_large": 0, "disk_full": 0,
+        }
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=self.max_concurrency * 2,
+                                    max_keepalive_connections=self.max_concurrency),
+                timeout=httpx.Timeout(self.timeout),
+                follow_redirects=True,
+            )
+        return self._client
+
+    async def download(self, url: str, dest: str, expected_sha256: Optional[str] = None,
+                       expected_size: Optional[int] = None) -> Download:
+        """Stream url to dest; raises IngestError (and removes dest) when it cannot be fetched intact."""
+        self._waiting += 1
+        async with self._slots:
+            self._waiting -= 1
+            self._active += 1
+            t0 = time.perf_counter()
+            try:
+                result = await asyncio.wait_for(
+                    self._download(url, dest, expected_sha256, expected_size, t0), self.deadline)
+            except asyncio.TimeoutError:
+                self.stats["failed"] += 1
+                self._discard(dest)
+                raise IngestError(f"download did not finish within {self.deadline:g}s")
+            except BaseException:
+                self.stats["failed"] += 1
+                self._discard(dest)
+                raise
+            finally:
+                self._active -= 1
+        self.stats["downloads"] += 1
+        self.stats["bytes"] += result.size_bytes
+        self._latencies.append(result.seconds)
+        return result
+
+    async def _download(self, url: str, dest: str, expected_sha256: Optional[str],
+                        expected_size: Optional[int], t0: float) -> Download:
+        os.makedirs(os.path.dirname(dest) or ".", exist_ok=True)
+        with open(dest, "wb") as f:
+            st = _Transfer(f, expected_size)
+            for attempt in range(self.retries + 1):
+                headers = {}
+                if st.received:
+                    headers["Range"] = f"bytes={st.received}-"
+                    if st.validator:
+                        headers["If-Range"] = st.validator
+                try:
+                    await self._transfer(url, headers, st)
+                    break
+                except _Retry as e:
+                    if attempt == self.retries:
+                        raise IngestError(f"giving up after {attempt + 1} attempts: {e}")
+                    log.info("Download of %s interrupted at %d bytes (%s); resuming", url, st.received, e)
+                    await asyncio.sleep(min(0.25 * 2 ** attempt, 5.0))
+                    if st.received:
+                        st.resumes += 1
+                        self.stats["resumes"] += 1
+
+        digest = st.hasher.hexdigest()
+        if st.size is not None and st.received != st.size:
+            raise IngestError(f"size mismatch: got {st.received} bytes, expected {st.size}")
+        for want in (expected_sha256, st.sha256):
+            if want and want.lower() != digest:
+                self.stats["checksum_mismatches"] += 1
+                raise IngestError(f"sha256 mismatch: got {digest}, expected {want}")
+        return Download(dest, st.received, digest, st.resumes, time.perf_counter() - t0)
+
+    async def _transfer(self, url: str, headers: Dict[str, str], st: "_Transfer"):
+        """One GET, appending to st; raises _Retry if it should be resumed."""
+        try:
+            async with self._get_client().stream("GET", url, headers=headers) as resp:
+                if resp.status_code in _RETRY_STATUSES:
+                    raise _Retry(f"HTTP {resp.status_code}")
+                if resp.status_code == 416 and st.received and st.received == st.size:
+                    return   # we already have every byte
+                if resp.status_code not in (200, 206):
+                    raise IngestError(f"HTTP {resp.status_code} from provider")
+                if resp.status_code == 206 and not resp.headers.get("content-range", "").startswith(f"bytes {st.received}-"):
+                    raise IngestError(f"unexpected Content-Range {resp.headers.get('content-range')!r}")
+                if resp.status_code == 200 and st.received:
+                    # range ignored, or the file changed (If-Range): start over
+                    self.stats["restarts"] += 1
+                    st.reset()
+
+                if not st.received:
+                    st.validator = resp.headers.get("etag") or resp.headers.get("last-modified")
+                    st.sha256 = _announced_sha256(resp.headers)
+                total = _total_size(resp)
+                if total is not None:
+                    if st.size is not None and total != st.size:
+                        raise IngestError(f"size changed from {st.size} to {total} bytes")
+                    st.size = total
+                self._check_limits(st.f.name, st.received, st.size)
+
+                next_disk_check = st.received + _DISK_CHECK_EVERY
+                async for chunk in resp.aiter_bytes(_CHUNK):
+                    if st.received + len(chunk) > self.max_bytes:
+                        self.stats["too_large"] += 1
+                        raise IngestError(f"larger than {self.max_bytes} bytes")
+                    await asyncio.to_thread(st.append, chunk)
+                    if st.size is None and st.received >= next_disk_check:
+                        self._check_limits(st.f.name, st.received, None)
+                        next_disk_check = st.received + _DISK_CHECK_EVERY
+        except httpx.TransportError as e:
+            # connect errors, timeouts, connections dropped mid-body: resume from st.received
+            raise _Retry(f"{type(e).__name__}: {e}") from e
+
+        if st.size is not None and st.received < st.size:
+            raise _Retry(f"body ended at {st.received} of {st.size} bytes")
+
+    def _check_limits(self, path: str, received: int, total: Optional[int]):
+        if total is not None and total > self.max_bytes:
+            self.stats["too_large"] += 1
+            raise IngestError(f"provider file is {total} bytes (limit {self.max_bytes})")
+        remaining = (total - received) if total is not None else _DISK_CHECK_EVERY
+        free = shutil.disk_usage(os.path.dirname(path) or ".").free
+        if free - remaining < self.min_free_bytes:
+            self.stats["disk_full"] += 1
+            raise IngestError(f"not enough disk space ({free} bytes free, need {remaining} + {self.min_free_bytes} reserve)")
+
+    @staticmethod
+    def _discard(path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def snapshot(self) -> Dict[str, Any]:
+        samples = sorted(self._latencies)
+
+        def pct(p: float) -> Optional[float]:
+            if not samples:
+                return None
+            return round(samples[min(len(samples) - 1, int(p * len(samples)))] * 1000, 1)
+
+        return {
+            **self.stats,
+            "active": self._active,
+            "waiting": self._waiting,
+            "max_concurrency": self.max_concurrency,
+            "download_ms": {"p50": pct(0.50), "p95": pct(0.95)},
+        }
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+class _Transfer:
+    """What is on disk so far for one download, carried across resumed requests."""
+
+    def __init__(self, f: BinaryIO, size: Optional[int]):
+        self.f = f
+        self.size = size                       # expected total, once known
+        self.received = 0
+        self.hasher = hashlib.sha256()
+        self.sha256: Optional[str] = None      # announced by the server
+        self.validator: Optional[str] = None   # ETag / Last-Modified, so a resume can't splice two versions
+        self.resumes = 0
+
+    def append(self, chunk: bytes):
+        self.f.write(chunk)
+        self.hasher.update(chunk)
+        self.received += len(chunk)
+
+    def reset(self):
+        self.f.seek(0)
+        self.f.truncate()
+        self.hasher = hashlib.sha256()
+        self.received = 0
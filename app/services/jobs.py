@@ -1,11 +1,46 @@
 # app/services/jobs.py:
 
-from typing import Dict, Optional, List
-from dataclasses import dataclass, field
+import os
+import sys
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, List, Tuple
+from dataclasses import dataclass
 import datetime
 from app import db  # <-- import db so we can persist
+from app.providers.base import TERMINAL_STATUSES
 
-@dataclass
+log = logging.getLogger("services.jobs")
+
+# ---- Configuration (from env) ----
+JOB_STORE_MAX_ENTRIES = int(os.getenv("JOB_STORE_MAX_ENTRIES", "10000"))   # records kept in memory
+JOB_STORE_TTL_SECONDS = int(os.getenv("JOB_STORE_TTL_SECONDS", "3600"))    # idle finished jobs dropped after
+JOB_STORE_MAX_USERS = int(os.getenv("JOB_STORE_MAX_USERS", "10000"))
+JOB_STORE_USER_JOBS = int(os.getenv("JOB_STORE_USER_JOBS", "10"))          # recent job ids kept per user
+JOB_STORE_SWEEP_EVERY = int(os.getenv("JOB_STORE_SWEEP_EVERY", "256"))     # inserts between TTL sweeps
+HISTORY_CACHE_USERS = int(os.getenv("HISTORY_CACHE_USERS", "1024"))        # users whose first page is cached
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "10"))
+
+
+def encode_cursor(created_ms: int, row_id: int) -> str:
+    """Opaque-ish history cursor: the (created_ms, id) of the last row on the page."""
+    return f"{created_ms}.{row_id}"
+
+
+def decode_cursor(cursor: str) -> Tuple[int, int]:
+    """Inverse of encode_cursor; raises ValueError on anything malformed."""
+    created_ms, _, row_id = cursor.partition(".")
+    return int(created_ms), int(row_id)
+
+
+def _intern(value: Optional[str]) -> Optional[str]:
+    """Share one copy of the small, endlessly repeated strings (status, style, provider)."""
+    return sys.intern(value) if value else value
+
+
+@dataclass(slots=True)
 class JobRecord:
     job_id: str
     status: str
@@ -17,128 +52,282 @@ class JobRecord:
     prompt: Optional[str] = None
     final_prompt: Optional[str] = None
     created_at: Optional[str] = None
+    user_number: Optional[str] = None
 
     cached: bool = False
-    meta: Dict[str, str] = field(default_factory=dict)
+    _meta: Optional[Dict[str, str]] = None   # allocated on first use; most jobs never need it
 
-    # Feedback fields
-    feedback_pending: bool = False
+    # Feedback (whether it's still owed lives in the session store)
     feedback: Optional[bool] = None  # True=👍, False=👎, None=not given yet
 
-    # New fields for style selection flow
-    awaiting_style: bool = False
+    # Style selection flow
     chosen_style: Optional[str] = None
     style: Optional[str] = None
 
+    def __post_init__(self):
+        self.status = _intern(self.status)
+        self.provider = _intern(self.provider)
+        self.style = _intern(self.style)
+        self.chosen_style = _intern(self.chosen_style)
+
+    @property
+    def meta(self) -> Dict[str, str]:
+        if self._meta is None:
+            self._meta = {}
+        return self._meta
+
+    @property
+    def evictable(self) -> bool:
+        """Finished, so the DB copy is enough."""
+        return self.status in TERMINAL_STATUSES
+
+    @classmethod
+    def from_row(cls, row) -> "JobRecord":
+        keys = row.keys()
+        return cls(
+            job_id=row["job_id"],
+            status=row["status"],
+            video_path=row["video_url"],
+            provider="sqlite",
+            prompt_hash=(row["prompt_hash"] if "prompt_hash" in keys else None) or "",
+            prompt=row["prompt"],
+            final_prompt=row["final_prompt"],
+            created_at=row["created_at"],
+            user_number=row["user_id"] if "user_id" in keys else None,
+            style=row["style"],
+        )
+
 
 class JobStore:
-    def __init__(self):
-        self._by_id: Dict[str, JobRecord] = {}
-        self._by_hash: Dict[str, JobRecord] = {}
-        self._by_user: Dict[str, List[str]] = {}
+    """
+    In-memory job records in front of jobs.db, bounded by count and idle time.
+    Beyond max_entries, finished jobs that aren't waiting on the user are evicted least
+    recently used first; anything untouched for ttl_seconds goes regardless. get() falls
+    back to the DB on a miss. Per-user recent job ids are capped too.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = JOB_STORE_MAX_ENTRIES,
+        ttl_seconds: int = JOB_STORE_TTL_SECONDS,
+        max_users: int = JOB_STORE_MAX_USERS,
+        user_jobs: int = JOB_STORE_USER_JOBS,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_users = max_users
+        self.user_jobs = user_jobs
+        self._by_id: "OrderedDict[str, JobRecord]" = OrderedDict()
+        self._seen: Dict[str, float] = {}   # job_id -> last access (monotonic)
+        self._by_user: "OrderedDict[str, List[str]]" = OrderedDict()
+        # user -> first history page [((created_ms, id), record)], one row past HISTORY_PAGE_SIZE
+        self._history: "OrderedDict[str, List[Tuple[Tuple[int, int], JobRecord]]]" = OrderedDict()
+        self._history_gen = 0   # bumped on invalidation so a racing load doesn't cache stale rows
+        self._history_cursors: "OrderedDict[str, str]" = OrderedDict()   # WhatsApp "/history more"
+        self._lock = threading.RLock()
+        self._inserts = 0
+        self.stats: Dict[str, int] = {"evicted": 0, "db_hits": 0, "db_misses": 0,
+                                      "history_hits": 0, "history_misses": 0}
+
+    def _remember(self, rec: JobRecord):
+        with self._lock:
+            self._by_id[rec.job_id] = rec
+            self._by_id.move_to_end(rec.job_id)
+            self._seen[rec.job_id] = time.monotonic()
+            self._inserts += 1
+            if len(self._by_id) > self.max_entries or self._inserts % JOB_STORE_SWEEP_EVERY == 0:
+                self._evict()
+
+    def _evict(self):
+        """Drop idle finished jobs past the TTL, then LRU finished jobs beyond max_entries."""
+        cutoff = time.monotonic() - self.ttl_seconds
+        over = len(self._by_id) - self.max_entries
+        victims = []
+        for job_id, rec in self._by_id.items():
+            idle = self._seen.get(job_id, 0) < cutoff
+            if not (over > 0 or idle):
+                break   # LRU order: everything after this was used more recently
+            if idle or rec.evictable:   # idle in-flight jobs were abandoned by the scheduler
+                victims.append(job_id)
+                over -= 1
+        for job_id in victims:
+            del self._by_id[job_id]
+            self._seen.pop(job_id, None)
+        self.stats["evicted"] += len(victims)
 
-    def get_by_hash(self, h: str) -> Optional[JobRecord]:
-        return self._by_hash.get(h)
+    def sweep(self) -> int:
+        """Apply the TTL now (otherwise it runs when the store is full or every few inserts)."""
+        with self._lock:
+            before = self.stats["evicted"]
+            self._evict()
+            return self.stats["evicted"] - before
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def snapshot(self) -> Dict[str, int]:
+        return {"entries": len(self._by_id), "users": len(self._by_user),
+                "history_cached": len(self._history), **self.stats}
 
     def put(self, rec: JobRecord, user_id: str = None):
-        self._by_id[rec.job_id] = rec
-        if rec.prompt_hash:
-            self._by_hash[rec.prompt_hash] = rec
+        self._remember(rec)
         if user_id:
+            rec.user_number = user_id
             if not rec.created_at:
                 rec.created_at = datetime.datetime.utcnow().isoformat() + "Z"
             db.insert_job(user_id, rec)
+            self.invalidate_history(user_id)
 
     def get(self, job_id: str) -> Optional[JobRecord]:
-        return self._by_id.get(job_id)
+        with self._lock:
+            rec = self._by_id.get(job_id)
+            if rec is not None:
+                self._by_id.move_to_end(job_id)
+                self._seen[job_id] = time.monotonic()
+                return rec
+        try:
+            row = db.get_job(job_id)
+        except Exception:
+            log.debug("DB lookup failed for job=%s", job_id)
+            row = None
+        if row is None:
+            self.stats["db_misses"] += 1
+            return None
+        self.stats["db_hits"] += 1
+        rec = JobRecord.from_row(row)
+        self._remember(rec)
+        return rec
 
     def store_user_job(self, user_number: str, job_id: str):
         if not user_number:
             return
-        lst = self._by_user.setdefault(user_number, [])
-        if not lst or lst[-1] != job_id:
-            lst.append(job_id)
+        with self._lock:
+            lst = self._by_user.setdefault(user_number, [])
+            self._by_user.move_to_end(user_number)
+            if not lst or lst[-1] != job_id:
+                lst.append(job_id)
+                del lst[:-self.user_jobs]
+            while len(self._by_user) > self.max_users:
+                self._by_user.popitem(last=False)
 
     def get_jobs_for_user(self, user_number: str) -> List[str]:
         return list(self._by_user.get(user_number, []))
 
     def get_last_job_for_user(self, user_number: str) -> Optional[JobRecord]:
-        jobs = self._by_user.get(user_number)
-        if not jobs:
+        """The user's newest job; falls back to the DB (blocking) when this process hasn't seen the user."""
+        with self._lock:
+            jobs = self._by_user.get(user_number)
+            job_id = jobs[-1] if jobs else None
+        if job_id is not None:
+            return self.get(job_id)
+        try:
+            rows = db.get_jobs_for_user(user_number, 1, None)
+        except Exception:
+            log.debug("DB lookup failed for the last job of %s", user_number)
+            rows = []
+        if not rows:
+            self.stats["db_misses"] += 1
             return None
-        return self.get(jobs[-1])
+        self.stats["db_hits"] += 1
+        with self._lock:
+            rec = self._by_id.get(rows[0]["job_id"])   # the live record wins over the row
+        if rec is None:
+            rec = JobRecord.from_row(rows[0])
+            self._remember(rec)
+        self.store_user_job(user_number, rec.job_id)
+        return rec
 
     def get_history_for_user(self, user_number: str, limit: int = 10) -> List[JobRecord]:
-        recs: List[JobRecord] = []
-        job_ids = self._by_user.get(user_number, [])
-        for jid in job_ids:
-            r = self.get(jid)
-            if r:
-                recs.append(r)
+        return self.get_history_page(user_number, limit)[0]
 
-        try:
-            rows = db.get_jobs_for_user(user_number, limit)
-            for row in rows:
-                recs.append(JobRecord(
-                    job_id=row["job_id"],
-                    status=row["status"],
-                    video_path=row["video_url"],
-                    provider="sqlite",
-                    prompt_hash="",
-                    prompt=row["prompt"],
-                    final_prompt=row["final_prompt"],
-                    created_at=row["created_at"],
-                    style=row["style"],   # ✅ add this
-                ))
-        except Exception:
-            pass
+    def get_history_page(
+        self, user_number: str, limit: int = 10, cursor: Optional[str] = None
+    ) -> Tuple[List[JobRecord], Optional[str]]:
+        """
+        One page of the user's jobs, newest first, from the indexed jobs table (blocking: DB).
+        Returns (records, next_cursor); next_cursor is None on the last page. The first
+        page is cached per user until one of their jobs is added or changes status.
+        """
+        if cursor is None and limit <= HISTORY_PAGE_SIZE:
+            with self._lock:
+                items = self._history.get(user_number)
+                if items is not None:
+                    self._history.move_to_end(user_number)
+                gen = self._history_gen
+            if items is None:
+                self.stats["history_misses"] += 1
+                items = self._load_history(user_number, HISTORY_PAGE_SIZE + 1, None)
+                with self._lock:
+                    if gen == self._history_gen:
+                        self._history[user_number] = items
+                        while len(self._history) > HISTORY_CACHE_USERS:
+                            self._history.popitem(last=False)
+            else:
+                self.stats["history_hits"] += 1
+        else:
+            before = decode_cursor(cursor) if cursor else None
+            items = self._load_history(user_number, limit + 1, before)
+
+        page = items[:limit]
+        next_cursor = encode_cursor(*page[-1][0]) if len(items) > limit else None
+        return [rec for _, rec in page], next_cursor
+
+    def _load_history(self, user_number: str, limit: int, before: Optional[Tuple[int, int]]):
+        items = []
+        for row in db.get_jobs_for_user(user_number, limit, before):
+            with self._lock:
+                rec = self._by_id.get(row["job_id"])   # a live record has the freshest status/meta
+            items.append(((row["created_ms"], row["id"]), rec or JobRecord.from_row(row)))
+        return items
+
+    def invalidate_history(self, user_number: Optional[str]):
+        with self._lock:
+            self._history_gen += 1
+            if user_number:
+                self._history.pop(user_number, None)
+
+    def set_history_cursor(self, user_number: str, cursor: Optional[str]):
+        """Remember where the user's last /history page ended (None forgets it)."""
+        with self._lock:
+            if cursor is None:
+                self._history_cursors.pop(user_number, None)
+                return
+            self._history_cursors[user_number] = cursor
+            self._history_cursors.move_to_end(user_number)
+            while len(self._history_cursors) > self.max_users:
+                self._history_cursors.popitem(last=False)
+
+    def get_history_cursor(self, user_number: str) -> Optional[str]:
+        return self._history_cursors.get(user_number)
 
+    def update_status(self, job_id: str, status: str, video_url: str = None, user_number: str = None):
+        """Write a status change through to the DB and drop the owner's cached history page."""
+        self.update_status_in_db(job_id, status, video_url)
+        if user_number is None:
+            with self._lock:
+                rec = self._by_id.get(job_id)
+            user_number = rec.user_number if rec else None
+        self.invalidate_history(user_number)
+
+    def update_statuses(self, changes: List[Tuple[str, str, Optional[str], Optional[str]]]):
+        """Batched update_status: [(job_id, status, video_url, user_number)] in one transaction."""
+        if not changes:
+            return
         try:
-            recs.sort(key=lambda r: r.created_at or "", reverse=True)
+            db.update_job_statuses([(job_id, status, url) for job_id, status, url, _ in changes])
         except Exception:
-            pass
-
-        return recs[:limit]
+            log.exception("Could not persist status for %d jobs", len(changes))
+        for _, _, _, user_number in changes:
+            self.invalidate_history(user_number)
 
     def update_status_in_db(self, job_id: str, status: str, video_url: str = None):
         try:
             db.update_job_status(job_id, status, video_url)
         except Exception:
-            pass
+            log.exception("Could not persist status for job=%s", job_id)
 
     # --- Feedback helpers ---
-    def mark_feedback_pending(self, job_id: str):
-        rec = self.get(job_id)
-        if rec:
-            rec.feedback_pending = True
-
     def mark_feedback_received(self, job_id: str, liked: bool):
         rec = self.get(job_id)
         if rec:
-            rec.feedback_pending = False
             rec.feedback = liked
-
-    def set_pending_prompt(self, user_number: str, prompt: str):
-        # store a temporary record before style is chosen
-        rec = JobRecord(
-            job_id=f"pending-{user_number}",
-            status="pending",
-            video_path=None,
-            provider="pending",
-            prompt_hash="",
-            prompt=prompt,
-            created_at=datetime.datetime.utcnow().isoformat() + "Z",
-            awaiting_style=True
-        )
-        self._by_id[rec.job_id] = rec
-        self._by_user[user_number] = [rec.job_id]
-        return rec
-
-    def get_pending_prompt(self, user_number: str) -> Optional[JobRecord]:
-        jobs = self._by_user.get(user_number)
-        if not jobs:
-            return None
-        rec = self.get(jobs[-1])
-        if rec and rec.awaiting_style:
-            return rec
-        return None
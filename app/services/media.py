@@ -0,0 +1,291 @@
+# app/services/media.py
+"""
+File responses for /video: strong content-hash ETags, conditional requests (304),
+single and multi-range (multipart/byteranges) with If-Range, Cache-Control, and
+zero-copy sends when the ASGI server offers the pathsend/zerocopysend extensions.
+Otherwise the file is read with pread() in large chunks off the event loop.
+"""
+
+import os
+import time
+import secrets
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Dict, List, Optional, Tuple, Union
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+from app.services.blob_store import file_digest
+
+log = logging.getLogger("services.media")
+
+# ---- Configuration (from env) ----
+MEDIA_STAT_CACHE_ENTRIES = int(os.getenv("MEDIA_STAT_CACHE_ENTRIES", "4096"))
+MEDIA_STAT_CACHE_TTL = float(os.getenv("MEDIA_STAT_CACHE_TTL", "5"))      # seconds, for files that can change
+MEDIA_CHUNK_SIZE = int(os.getenv("MEDIA_CHUNK_SIZE", str(1024 * 1024)))
+MEDIA_MAX_RANGES = int(os.getenv("MEDIA_MAX_RANGES", "16"))               # more than this: serve the whole file
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "public, no-cache"
+
+Range = Tuple[int, int]   # inclusive byte offsets
+
+
+@dataclass(frozen=True)
+class MediaFile:
+    path: str
+    size: int
+    mtime: float
+    etag: str
+    immutable: bool   # content-addressed: these bytes never change under this URL
+    content_type: str = "video/mp4"
+
+    @property
+    def last_modified(self) -> str:
+        return formatdate(self.mtime, usegmt=True)
+
+
+class StatCache:
+    """
+    Small LRU of resolved MediaFiles (by any key, e.g. job_id), so hot files skip the
+    index lookup and stat() calls. Immutable entries live until evicted; others are
+    re-resolved after ttl seconds. Content hashes of mutable files are kept per
+    (path, size, mtime) so an ETag costs one read of the file per change.
+    """
+
+    def __init__(self, max_entries: int = MEDIA_STAT_CACHE_ENTRIES, ttl: float = MEDIA_STAT_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[MediaFile, float]]" = OrderedDict()
+        self._digests: "OrderedDict[Tuple[str, int, int], str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {"hits": 0, "misses": 0}
+
+    def lookup(self, key: str) -> Optional[MediaFile]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                media, stored_at = entry
+                if media.immutable or time.monotonic() - stored_at < self.ttl:
+                    self._entries.move_to_end(key)
+                    self.stats["hits"] += 1
+                    return media
+                del self._entries[key]
+            self.stats["misses"] += 1
+        return None
+
+    def store(self, key: str, media: MediaFile):
+        with self._lock:
+            self._entries[key] = (media, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def stat(self, path: str, digest: Optional[str] = None, content_type: str = "video/mp4") -> MediaFile:
+        """
+        MediaFile for path (blocking: stat, and hashing on the first sight of a mutable file).
+        Pass the content digest when it is already known (blob store paths); such files
+        are treated as immutable.
+        """
+        st = os.stat(path)
+        if digest is None:
+            key = (path, st.st_size, st.st_mtime_ns)
+            with self._lock:
+                digest = self._digests.get(key)
+            if digest is None:
+                digest = file_digest(path)
+                with self._lock:
+                    self._digests[key] = digest
+                    while len(self._digests) > self.max_entries:
+                        self._digests.popitem(last=False)
+            immutable = False
+        else:
+            immutable = True
+        return MediaFile(path, st.st_size, st.st_mtime, f'"{digest[:32]}"', immutable, content_type)
+
+
+def parse_ranges(header: Optional[str], size: int) -> Optional[List[Range]]:
+    """
+    Byte ranges from a Range header, sorted and merged. None means ignore the header
+    (absent, malformed, not bytes, or too many ranges); [] means none are satisfiable.
+    """
+    if not header or "=" not in header:
+        return None
+    units, _, spec = header.partition("=")
+    if units.strip().lower() != "bytes":
+        return None
+    ranges: List[Range] = []
+    parts = [p.strip() for p in spec.split(",") if p.strip()]
+    if not parts or len(parts) > MEDIA_MAX_RANGES:
+        return None
+    for part in parts:
+        start_s, sep, end_s = part.partition("-")
+        if not sep:
+            return None
+        try:
+            if start_s:
+                start = int(start_s)
+                end = int(end_s) if end_s else size - 1
+                if end_s and start > end:
+                    return None   # syntactically invalid: the whole header is ignored
+                if start >= size:
+                    continue      # unsatisfiable
+                end = min(end, size - 1)
+            else:
+                n = int(end_s)
+                if n == 0 or size == 0:
+                    continue
+                start, end = max(0, size - n), size - 1
+        except ValueError:
+            return None
+        ranges.append((start, end))
+
+    ranges.sort()
+    merged: List[Range] = []
+    for start, end in ranges:
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _etag_matches(header: str, etag: str, weak: bool) -> bool:
+    for candidate in (c.strip() for c in header.split(",")):
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            if weak and candidate[2:] == etag:
+                return True
+        elif candidate == etag:
+            return True
+    return False
+
+
+def _not_modified(media: MediaFile, headers: Headers) -> bool:
+    inm = headers.get("if-none-match")
+    if inm is not None:
+        return _etag_matches(inm, media.etag, weak=True)
+    ims = headers.get("if-modified-since")
+    if ims:
+        try:
+            return int(media.mtime) <= parsedate_to_datetime(ims).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def _if_range_allows(media: MediaFile, value: str) -> bool:
+    """If-Range needs a strong match: the exact ETag, or exactly the Last-Modified date."""
+    value = value.strip()
+    if value.startswith('"') or value.startswith("W/"):
+        return value == media.etag
+    return value == media.last_modified
+
+
+class FileSegmentsResponse(Response):
+    """Sends literal byte strings and (start, end) file segments, zero-copy when the server allows."""
+
+    def __init__(self, media: MediaFile, status_code: int, headers: Dict[str, str],
+                 segments: List[Union[bytes, Range]], media_type: Optional[str]):
+        super().__init__(content=None, status_code=status_code, headers=headers, media_type=media_type)
+        self.media = media
+        self.segments = segments
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            f = open(self.media.path, "rb", buffering=0)
+        except FileNotFoundError:
+            await Response("Video missing", status_code=404)(scope, receive, send)
+            return
+        try:
+            await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+            if scope.get("method") == "HEAD" or not self.segments:
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+                return
+
+            extensions = scope.get("extensions") or {}
+            whole = self.segments == [(0, self.media.size - 1)]
+            if whole and "http.response.pathsend" in extensions:
+                await send({"type": "http.response.pathsend", "path": os.path.abspath(self.media.path)})
+                return
+            zerocopy = "http.response.zerocopysend" in extensions
+
+            fd = f.fileno()
+            for seg in self.segments:
+                if isinstance(seg, bytes):
+                    await send({"type": "http.response.body", "body": seg, "more_body": True})
+                    continue
+                start, end = seg
+                if zerocopy:
+                    await send({"type": "http.response.zerocopysend", "file": f,
+                                "offset": start, "count": end - start + 1, "more_body": True})
+                    continue
+                offset = start
+                while offset <= end:
+                    n = min(MEDIA_CHUNK_SIZE, end - offset + 1)
+                    chunk = await anyio.to_thread.run_sync(os.pread, fd, n, offset)
+                    if not chunk:
+                        break
+                    offset += len(chunk)
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        finally:
+            f.close()
+
+
+def media_response(media: MediaFile, request_headers: Headers, media_type: Optional[str] = None) -> Response:
+    """The right response for a GET/HEAD of this file given the request's conditional/range headers."""
+    media_type = media_type or media.content_type
+    headers = {
+        "ETag": media.etag,
+        "Last-Modified": media.last_modified,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": IMMUTABLE_CACHE_CONTROL if media.immutable else REVALIDATE_CACHE_CONTROL,
+    }
+    if _not_modified(media, request_headers):
+        return Response(status_code=304, headers=headers)
+
+    size = media.size
+    ranges = parse_ranges(request_headers.get("range"), size)
+    if_range = request_headers.get("if-range")
+    if ranges is not None and if_range is not None and not _if_range_allows(media, if_range):
+        ranges = None   # the client's copy is stale: send the whole current file
+
+    if ranges is None:
+        headers["Content-Length"] = str(size)
+        segments: List[Union[bytes, Range]] = [(0, size - 1)] if size else []
+        return FileSegmentsResponse(media, 200, headers, segments, media_type)
+
+    if not ranges:
+        headers["Content-Range"] = f"bytes */{size}"
+        return Response(status_code=416, headers=headers)
+
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        headers["Content-Length"] = str(end - start + 1)
+        return FileSegmentsResponse(media, 206, headers, [(start, end)], media_type)
+
+    boundary = secrets.token_hex(16)
+    segments = []
+    length = 0
+    for start, end in ranges:
+        part_head = (f"--{boundary}\r\nContent-Type: {media_type}\r\n"
+                     f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n").encode("latin-1")
+        segments += [part_head, (start, end), b"\r\n"]
+        length += len(part_head) + (end - start + 1) + 2
+    closing = f"--{boundary}--\r\n".encode("latin-1")
+    segments.append(closing)
+    headers["Content-Length"] = str(length + len(closing))
+    return FileSegmentsResponse(media, 206, headers, segments, f"multipart/byteranges; boundary={boundary}")
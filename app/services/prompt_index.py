@@ -0,0 +1,109 @@
+# app/services/prompt_index.py
+
+import random
+import hashlib
+import threading
+from typing import Dict, List, Optional, Set, Tuple
+
+from app.services.prompts import normalize_prompt
+
+_MERSENNE_61 = (1 << 61) - 1
+
+
+def shingles(normalized: str) -> Set[str]:
+    """Word unigrams/bigrams plus character trigrams of an already-normalized prompt."""
+    words = normalized.split()
+    out: Set[str] = set(words)
+    out.update(f"{a} {b}" for a, b in zip(words, words[1:]))
+    padded = f" {normalized} "
+    out.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return out
+
+
+class MinHashIndex:
+    """
+    Near-duplicate lookup over past prompts, one LSH table per style.
+
+    Each prompt becomes a MinHash signature of `num_perm` values over its shingles; the
+    signature is split into `bands` bands and any prompt sharing a band bucket is a
+    candidate. Candidates are scored by the fraction of matching signature values (an
+    estimate of Jaccard similarity) and the best one at or above `threshold` wins.
+    """
+
+    def __init__(self, threshold: float = 0.85, num_perm: int = 64, bands: int = 16):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        rng = random.Random(num_perm)   # fixed seed: signatures must be stable across processes
+        self._perms: List[Tuple[int, int]] = [
+            (rng.randrange(1, _MERSENNE_61), rng.randrange(0, _MERSENNE_61)) for _ in range(num_perm)
+        ]
+        self._lock = threading.Lock()
+        # style -> band number -> band values -> keys
+        self._buckets: Dict[str, List[Dict[Tuple[int, ...], Set[str]]]] = {}
+        self._signatures: Dict[str, Tuple[str, Tuple[int, ...]]] = {}   # key -> (style, signature)
+
+    def signature(self, prompt: str) -> Tuple[int, ...]:
+        hashed = [int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest(), "big")
+                  for s in shingles(normalize_prompt(prompt))]
+        if not hashed:
+            return tuple([_MERSENNE_61] * self.num_perm)
+        return tuple(min((a * h + b) % _MERSENNE_61 for h in hashed) for a, b in self._perms)
+
+    def _bands_of(self, sig: Tuple[int, ...]):
+        for band in range(self.bands):
+            yield band, sig[band * self.rows:(band + 1) * self.rows]
+
+    def add(self, key: str, prompt: str, style: str):
+        """Index a prompt (normally a cached result's prompt_hash) under its style."""
+        style = (style or "").lower()
+        sig = self.signature(prompt)
+        with self._lock:
+            self._remove_locked(key)
+            tables = self._buckets.setdefault(style, [{} for _ in range(self.bands)])
+            for band, values in self._bands_of(sig):
+                tables[band].setdefault(values, set()).add(key)
+            self._signatures[key] = (style, sig)
+
+    def remove(self, key: str):
+        with self._lock:
+            self._remove_locked(key)
+
+    def _remove_locked(self, key: str):
+        entry = self._signatures.pop(key, None)
+        if entry is None:
+            return
+        style, sig = entry
+        tables = self._buckets.get(style)
+        for band, values in self._bands_of(sig):
+            bucket = tables[band].get(values)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del tables[band][values]
+
+    def query(self, prompt: str, style: str, threshold: Optional[float] = None) -> Optional[Tuple[str, float]]:
+        """Best (key, similarity) for this prompt+style at or above the threshold, else None."""
+        threshold = self.threshold if threshold is None else threshold
+        style = (style or "").lower()
+        sig = self.signature(prompt)
+        best: Optional[Tuple[str, float]] = None
+        with self._lock:
+            tables = self._buckets.get(style)
+            if not tables:
+                return None
+            candidates: Set[str] = set()
+            for band, values in self._bands_of(sig):
+                candidates.update(tables[band].get(values, ()))
+            for key in candidates:
+                other = self._signatures[key][1]
+                score = sum(1 for x, y in zip(sig, other) if x == y) / self.num_perm
+                if score >= threshold and (best is None or score > best[1]):
+                    best = (key, score)
+        return best
+
+    def __len__(self) -> int:
+        return len(self._signatures)
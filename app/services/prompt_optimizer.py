@@ -1,36 +1,198 @@
 # app/services/prompt_optimizer.py
 
 import os
-from openai import OpenAI
+import time
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, Optional
 
+import httpx
+from openai import AsyncOpenAI
+
+from app import db
+from app.services.prompts import compose_prompt, prompt_hash
+from app.storage import run_db
+
+log = logging.getLogger("services.prompt_optimizer")
+
+# ---- Configuration (from env) ----
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")                    # e.g. a local OpenAI-compatible server
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+OPTIMIZER_TIMEOUT_SECONDS = float(os.getenv("OPTIMIZER_TIMEOUT_SECONDS", "8"))
+OPTIMIZER_MAX_CONNECTIONS = int(os.getenv("OPTIMIZER_MAX_CONNECTIONS", "20"))
+OPTIMIZER_CACHE_ENTRIES = int(os.getenv("OPTIMIZER_CACHE_ENTRIES", "2048"))
+OPTIMIZER_CACHE_TTL_SECONDS = int(os.getenv("OPTIMIZER_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
 
-def optimize_prompt(user_prompt: str, style: str) -> str:
+SYSTEM_PROMPT = "You are a Prompt Engineering expert who rewrites prompts for AI video generation."
+
+
+class PromptOptimizer:
     """
-    Optimize a raw prompt with style using OpenAI API.
-    Fallback to mock response if no API key available.
+    Async LLM prompt rewriting with one pooled client.
+    Results are cached by normalized prompt + style in a bounded in-process LRU backed by
+    jobs.db (prompt_optimizations). Concurrent calls for the same key share one request.
+    On timeout or error the caller gets compose_prompt() instead, which is not cached.
     """
-    if not user_prompt:
-        return "Prompt cannot be empty."
 
-    if not OPENAI_API_KEY:
-        # Fallback mock output
-        return f"[Optimized Mock] A polished {style} style prompt based on: {user_prompt}"
+    def __init__(
+        self,
+        api_key: Optional[str] = OPENAI_API_KEY,
+        base_url: Optional[str] = OPENAI_BASE_URL,
+        model: str = OPENAI_MODEL,
+        timeout: float = OPTIMIZER_TIMEOUT_SECONDS,
+        cache_entries: int = OPTIMIZER_CACHE_ENTRIES,
+        persist: bool = True,
+    ):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.model = model
+        self.timeout = timeout
+        self.cache_entries = cache_entries
+        self.persist = persist
+        self._client: Optional[AsyncOpenAI] = None
+        self._mem: "OrderedDict[str, str]" = OrderedDict()
+        self._inflight: Dict[str, "asyncio.Future[str]"] = {}
+        self._latencies: Deque[float] = deque(maxlen=512)
+        self.stats: Dict[str, int] = {
+            "requests": 0, "hits": 0, "db_hits": 0, "llm_calls": 0,
+            "coalesced": 0, "timeouts": 0, "errors": 0,
+        }
+
+    def _get_client(self) -> AsyncOpenAI:
+        if self._client is None:
+            self._client = AsyncOpenAI(
+                api_key=self.api_key,
+                base_url=self.base_url,
+                timeout=self.timeout,
+                max_retries=0,   # the timeout budget is small; the fallback is the retry
+                http_client=httpx.AsyncClient(
+                    limits=httpx.Limits(max_connections=OPTIMIZER_MAX_CONNECTIONS,
+                                        max_keepalive_connections=OPTIMIZER_MAX_CONNECTIONS),
+                    timeout=self.timeout,
+                ),
+            )
+        return self._client
+
+    def _remember(self, key: str, optimized: str):
+        self._mem[key] = optimized
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.cache_entries:
+            self._mem.popitem(last=False)
+
+    async def optimize(self, user_prompt: str, style: str) -> str:
+        """Optimized prompt for this prompt/style; never raises."""
+        if not user_prompt:
+            return "Prompt cannot be empty."
+
+        if not self.api_key:
+            # Fallback mock output
+            return f"[Optimized Mock] A polished {style} style prompt based on: {user_prompt}"
+
+        self.stats["requests"] += 1
+        key = prompt_hash(user_prompt, style)
+        cached = self._mem.get(key)
+        if cached is not None:
+            self._mem.move_to_end(key)
+            self.stats["hits"] += 1
+            return cached
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.stats["coalesced"] += 1
+        else:
+            task = asyncio.ensure_future(self._resolve(key, user_prompt, style))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # shield: one caller going away must not cancel the request the others are waiting on
+        return await asyncio.shield(task)
+
+    async def _resolve(self, key: str, user_prompt: str, style: str) -> str:
+        if self.persist:
+            try:
+                min_ms = int(time.time() * 1000) - OPTIMIZER_CACHE_TTL_SECONDS * 1000
+                stored = await run_db(db.get_optimized_prompt, key, min_ms)
+            except Exception:
+                log.exception("Optimized prompt lookup failed")
+                stored = None
+            if stored:
+                self.stats["db_hits"] += 1
+                self._remember(key, stored)
+                return stored
 
-    try:
-        
-        client = OpenAI(api_key=OPENAI_API_KEY)
+        self.stats["llm_calls"] += 1
+        t0 = time.perf_counter()
+        try:
+            optimized = await asyncio.wait_for(self._complete(user_prompt, style), self.timeout)
+        except asyncio.TimeoutError:
+            self.stats["timeouts"] += 1
+            log.warning("Prompt optimization timed out after %.1fs; using composed prompt", self.timeout)
+            return compose_prompt(user_prompt, style)
+        except Exception as e:
+            self.stats["errors"] += 1
+            log.warning("Prompt optimization failed (%s); using composed prompt", e)
+            return compose_prompt(user_prompt, style)
+        finally:
+            self._latencies.append(time.perf_counter() - t0)
 
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
+        self._remember(key, optimized)
+        if self.persist:
+            try:
+                await run_db(db.put_optimized_prompt, key, style, optimized, self.model)
+            except Exception:
+                log.exception("Could not store optimized prompt")
+        return optimized
+
+    async def _complete(self, user_prompt: str, style: str) -> str:
+        response = await self._get_client().chat.completions.create(
+            model=self.model,
             messages=[
-                {"role": "system", "content": "You are a Prompt Engineering expert who rewrites prompts for AI video generation."},
+                {"role": "system", "content": SYSTEM_PROMPT},
                 {"role": "user", "content": f"Prompt: {user_prompt}\nStyle: {style}\n\nPlease optimize this prompt for best video generation results."}
             ],
             temperature=0.7,
             max_tokens=100
         )
-        return response.choices[0].message["content"].strip()
+        content = (response.choices[0].message.content or "").strip()
+        if not content:
+            raise ValueError("empty completion")
+        return content
+
+    def snapshot(self) -> Dict[str, Any]:
+        samples = sorted(self._latencies)
+
+        def pct(p: float) -> Optional[float]:
+            if not samples:
+                return None
+            return round(samples[min(len(samples) - 1, int(p * len(samples)))] * 1000, 1)
+
+        served = self.stats["hits"] + self.stats["db_hits"]
+        return {
+            **self.stats,
+            "hit_rate": round(served / self.stats["requests"], 3) if self.stats["requests"] else None,
+            "cached": len(self._mem),
+            "in_flight": len(self._inflight),
+            "llm_latency_ms": {"p50": pct(0.50), "p95": pct(0.95), "max": pct(1.0)},
+        }
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+
+
+_optimizer = PromptOptimizer()
+
+
+async def optimize_prompt_async(user_prompt: str, style: str) -> str:
+    """Optimize a raw prompt with style (cached, coalesced, falls back to compose_prompt)."""
+    return await _optimizer.optimize(user_prompt, style)
+
+
+def optimizer_stats() -> Dict[str, Any]:
+    return _optimizer.snapshot()
+
 
-    except Exception as e:
-        return f"[Fallback due to error] Optimized {style} style prompt: {user_prompt}"
+async def shutdown_optimizer():
+    await _optimizer.aclose()
@@ -1,6 +1,8 @@
 # app/services/prompts.py
 
 import hashlib
+import functools
+import unicodedata
 
 STYLE_PRESETS = {
     "anime": {
@@ -23,5 +25,47 @@ def compose_prompt(user_prompt: str, style: str = "cinematic") -> str:
     n = st.get("negatives", "")
     return f"{user_prompt}. Style: {style}. Visual guidance: {g}. Negative prompts: {n}."
 
+_ACCENTED_SCRIPTS = ("LATIN ", "GREEK ", "CYRILLIC ")
+
+@functools.lru_cache(maxsize=4096)
+def _drops_marks(base: str) -> bool:
+    """
+    Whether combining marks on this character are dropped: accents on Latin, Greek and
+    Cyrillic letters (and marks on non-letters, such as emoji variation selectors) are,
+    but in Thai, Devanagari, Hebrew, etc. the marks are vowels and tones that tell words apart.
+    """
+    if not base or unicodedata.category(base)[0] != "L":
+        return True
+    return unicodedata.name(base, "").startswith(_ACCENTED_SCRIPTS)
+
+def normalize_prompt(user_prompt: str) -> str:
+    """
+    Canonical form used for cache keys: "A cat surfing!" and "a  cat surfing" match.
+    Unicode is compatibility-decomposed and accents dropped from Latin, Greek and Cyrillic
+    letters (other scripts keep their marks: Thai "ถูก" and "ถก" are different words),
+    emoji are folded to their names (🐱 -> "cat face") minus skin-tone/variation
+    modifiers, punctuation and other symbols become spaces, and the result is casefolded
+    with whitespace collapsed.
+    """
+    out = []
+    base = ""
+    for ch in unicodedata.normalize("NFKD", user_prompt or ""):
+        cat = unicodedata.category(ch)
+        if cat == "Mn":                      # accents, variation selectors; vowel/tone marks kept
+            if not _drops_marks(base):
+                out.append(ch)
+            continue
+        base = ch
+        if cat in ("Sk", "Cf"):              # skin tones, ZWJ
+            continue
+        if cat == "So":                      # emoji and pictographs
+            out.append(f" {unicodedata.name(ch, '').lower()} ")
+        elif cat[0] in ("P", "S"):           # punctuation, math/currency symbols
+            out.append(" ")
+        else:
+            out.append(ch)
+    return " ".join("".join(out).casefold().split())
+
 def prompt_hash(user_prompt: str, style: str) -> str:
-    return hashlib.sha256(f"{user_prompt}|{style}".encode()).hexdigest()[:16]
+    key = f"{normalize_prompt(user_prompt)}|{(style or '').strip().lower()}"
+    return hashlib.sha256(key.encode()).hexdigest()[:16]
@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import Callable, List, Optional
 from dataclasses import dataclass
 import datetime
 from app import requests_db
@@ -11,28 +11,56 @@ class RequestRecord:
     prompt: str
     status: str
     created_at: str
+    style: Optional[str] = None
+    channel: str = "api"   # where the request came from, and so where follow-ups go
 
-class RequestQueue:
-    """Database-backed queue for handling multiple user requests."""
-
-    def enqueue(self, user_id: str, prompt: str) -> int:
-        """Add request to queue, return request ID."""
-        return requests_db.insert_request(user_id, prompt)
-
-    def dequeue(self) -> Optional[RequestRecord]:
-        """Fetch next queued request (FIFO)."""
-        row = requests_db.get_next_request()
-        if not row:
-            return None
-        return RequestRecord(
+    @classmethod
+    def from_row(cls, row) -> "RequestRecord":
+        return cls(
             id=row["id"],
             user_id=row["user_id"],
             job_id=row["job_id"],
             prompt=row["prompt"],
             status=row["status"],
             created_at=row["created_at"],
+            style=row["style"] or "cinematic",
+            channel=row["channel"] or "api",
         )
 
+class RequestQueue:
+    """Database-backed queue for handling multiple user requests."""
+
+    def __init__(self):
+        self._listeners: List[Callable[[], None]] = []
+
+    def add_listener(self, fn: Callable[[], None]):
+        """Register a callback fired after every enqueue (used to wake the dispatcher)."""
+        self._listeners.append(fn)
+
+    def enqueue(self, user_id: str, prompt: str, style: str = "cinematic", channel: str = "api") -> int:
+        """Add request to queue, return request ID."""
+        req_id = requests_db.insert_request(user_id, prompt, style, channel)
+        for fn in self._listeners:
+            fn()
+        return req_id
+
+    def claim(self, worker_id: str, limit: int = 1) -> List[RequestRecord]:
+        """Atomically claim up to `limit` queued requests (FIFO) for this worker."""
+        return [RequestRecord.from_row(row) for row in requests_db.claim_requests(worker_id, limit)]
+
+    def dequeue(self) -> Optional[RequestRecord]:
+        """Claim the next queued request (FIFO)."""
+        reqs = self.claim("dequeue", 1)
+        return reqs[0] if reqs else None
+
+    def requeue_stale(self, max_age_seconds: int) -> int:
+        """Release claims whose worker never got as far as submitting."""
+        return requests_db.requeue_stale_claims(max_age_seconds)
+
+    def heartbeat(self, worker_id: str, req_ids) -> int:
+        """Keep this worker's in-flight claims from going stale; returns how many were refreshed."""
+        return requests_db.touch_claims(worker_id, req_ids)
+
     def mark_processing(self, req_id: int, job_id: str):
         """Mark a request as processing with its assigned job_id."""
         requests_db.update_request_status(req_id, "processing", job_id)
@@ -0,0 +1,226 @@
+# app/services/result_cache.py
+
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from app import db
+from app.services.jobs import JobRecord
+from app.services.prompts import normalize_prompt, prompt_hash
+from app.services.prompt_index import MinHashIndex
+
+log = logging.getLogger("services.result_cache")
+
+# ---- Configuration (from env) ----
+RESULT_CACHE_TTL_SECONDS = int(os.getenv("RESULT_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "10000"))
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(5 * 1024 ** 3)))
+RESULT_CACHE_MEMORY_ENTRIES = int(os.getenv("RESULT_CACHE_MEMORY_ENTRIES", "1024"))
+RESULT_CACHE_EVICT_EVERY = int(os.getenv("RESULT_CACHE_EVICT_EVERY", "32"))       # puts between eviction sweeps
+GENERATION_COST_USD = float(os.getenv("GENERATION_COST_USD", "0"))                 # provider price per video
+PROMPT_NEAR_DUP_ENABLED = os.getenv("PROMPT_NEAR_DUP_ENABLED", "false").lower() in ("1", "true", "yes")
+PROMPT_SIMILARITY_THRESHOLD = float(os.getenv("PROMPT_SIMILARITY_THRESHOLD", "0.85"))
+
+
+@dataclass
+class CachedResult:
+    prompt_hash: str
+    job_id: str
+    style: Optional[str]
+    video_path: Optional[str]
+    provider_output_url: Optional[str]
+    size_bytes: Optional[int]
+    created_ms: int
+
+    # mirrors JobRecord so callers can treat a hit like a finished job
+    status: str = "succeeded"
+    cached: bool = True
+
+    def to_record(self) -> JobRecord:
+        rec = JobRecord(
+            job_id=self.job_id,
+            status="succeeded",
+            video_path=self.video_path,
+            provider="cache",
+            prompt_hash=self.prompt_hash,
+            cached=True,
+            style=self.style,
+            chosen_style=self.style,
+        )
+        if self.provider_output_url:
+            rec.meta["provider_output_url"] = self.provider_output_url
+        return rec
+
+
+class ResultCache:
+    """
+    Durable prompt_hash -> finished video cache, stored in jobs.db (result_cache table)
+    so it survives restarts and is shared by every worker using the same file.
+    A small in-process LRU sits in front of the table. Entries expire after the TTL;
+    the table is trimmed to the least recently hit entries beyond the entry/byte limits.
+    With near_dup enabled, lookup() falls back to a MinHash index over cached prompts
+    and serves the most similar one of the same style above similarity_threshold.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: int = RESULT_CACHE_TTL_SECONDS,
+        max_entries: int = RESULT_CACHE_MAX_ENTRIES,
+        max_bytes: int = RESULT_CACHE_MAX_BYTES,
+        memory_entries: int = RESULT_CACHE_MEMORY_ENTRIES,
+        near_dup: bool = PROMPT_NEAR_DUP_ENABLED,
+        similarity_threshold: float = PROMPT_SIMILARITY_THRESHOLD,
+    ):
+        self.ttl_ms = ttl_seconds * 1000
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.memory_entries = memory_entries
+        self._mem: "OrderedDict[str, CachedResult]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._puts = 0
+        self.stats: Dict[str, int] = {"hits": 0, "near_hits": 0, "misses": 0, "puts": 0, "evicted": 0}
+        self.index: Optional[MinHashIndex] = MinHashIndex(similarity_threshold) if near_dup else None
+        self._index_loaded = False
+
+    def _expired(self, entry: CachedResult) -> bool:
+        return entry.created_ms < int(time.time() * 1000) - self.ttl_ms
+
+    def _remember(self, entry: CachedResult):
+        with self._lock:
+            self._mem[entry.prompt_hash] = entry
+            self._mem.move_to_end(entry.prompt_hash)
+            while len(self._mem) > self.memory_entries:
+                self._mem.popitem(last=False)
+
+    def get(self, prompt_hash: str, count: bool = True) -> Optional[CachedResult]:
+        """Look up a finished video for this hash; counts a hit or a miss (blocking: DB)."""
+        if not prompt_hash:
+            return None
+        with self._lock:
+            entry = self._mem.get(prompt_hash)
+            if entry is not None:
+                self._mem.move_to_end(prompt_hash)
+
+        if entry is None:
+            row = db.get_cached_result(prompt_hash)
+            if row is not None:
+                entry = CachedResult(
+                    prompt_hash=row["prompt_hash"],
+                    job_id=row["job_id"],
+                    style=row["style"],
+                    video_path=row["video_path"],
+                    provider_output_url=row["provider_output_url"],
+                    size_bytes=row["size_bytes"],
+                    created_ms=row["created_ms"],
+                )
+
+        if entry is None or self._expired(entry):
+            if entry is not None:
+                self.invalidate(prompt_hash)
+            elif self.index is not None:
+                self.index.remove(prompt_hash)   # evicted from the table since it was indexed
+            if count:
+                self.stats["misses"] += 1
+            return None
+
+        self._remember(entry)
+        if count:
+            self.stats["hits"] += 1
+        try:
+            db.touch_cached_result(prompt_hash)
+        except Exception:
+            log.debug("Could not record cache hit for %s", prompt_hash)
+        return entry
+
+    def lookup(self, user_prompt: str, style: str) -> Optional[CachedResult]:
+        """
+        Exact (normalized) hash lookup, then the most similar cached prompt of the same
+        style when near-duplicate matching is enabled. Counts one hit, near hit or miss.
+        """
+        entry = self.get(prompt_hash(user_prompt, style), count=False)
+        if entry is not None:
+            self.stats["hits"] += 1
+            return entry
+        if self.index is not None:
+            self._load_index()
+            match = self.index.query(user_prompt, style)
+            if match is not None:
+                entry = self.get(match[0], count=False)
+                if entry is not None:
+                    log.info("Near-duplicate cache hit (similarity %.2f) -> %s", match[1], entry.job_id)
+                    self.stats["near_hits"] += 1
+                    return entry
+        self.stats["misses"] += 1
+        return None
+
+    def _load_index(self):
+        """Fill the near-duplicate index from the durable table once per process."""
+        if self._index_loaded:
+            return
+        self._index_loaded = True
+        for row in db.get_cached_prompts():
+            self.index.add(row["prompt_hash"], row["normalized_prompt"], row["style"])
+        log.info("Near-duplicate index loaded with %d prompts", len(self.index))
+
+    def put(self, rec: Any, size_bytes: Optional[int] = None):
+        """Cache a succeeded JobRecord under its prompt_hash (upsert)."""
+        if not rec.prompt_hash or rec.status != "succeeded":
+            return
+        entry = CachedResult(
+            prompt_hash=rec.prompt_hash,
+            job_id=rec.job_id,
+            style=rec.chosen_style or rec.style,
+            video_path=rec.video_path,
+            provider_output_url=rec.meta.get("provider_output_url"),
+            size_bytes=size_bytes,
+            created_ms=int(time.time() * 1000),
+        )
+        normalized = normalize_prompt(rec.prompt) if rec.prompt else None
+        db.put_cached_result(entry.prompt_hash, entry.job_id, entry.style, entry.video_path,
+                             entry.provider_output_url, entry.size_bytes, normalized)
+        self._remember(entry)
+        if self.index is not None and normalized:
+            self.index.add(entry.prompt_hash, normalized, entry.style)
+        self.stats["puts"] += 1
+        self._puts += 1
+        if self._puts % RESULT_CACHE_EVICT_EVERY == 0:
+            self.evict()
+
+    def invalidate(self, prompt_hash: str):
+        with self._lock:
+            self._mem.pop(prompt_hash, None)
+        if self.index is not None:
+            self.index.remove(prompt_hash)
+        db.delete_cached_result(prompt_hash)
+
+    def evict(self) -> int:
+        """Apply TTL and size limits to the durable table."""
+        removed = db.evict_cached_results(
+            int(time.time() * 1000) - self.ttl_ms, self.max_entries, self.max_bytes
+        )
+        if removed:
+            self.stats["evicted"] += removed
+            with self._lock:
+                self._mem.clear()   # cheaper than working out which fronted entries went
+        return removed
+
+    def snapshot(self) -> Dict[str, Any]:
+        served = self.stats["hits"] + self.stats["near_hits"]
+        lookups = served + self.stats["misses"]
+        try:
+            entries, total_bytes = db.cached_result_totals()
+        except Exception:
+            entries, total_bytes = None, None
+        return {
+            **self.stats,
+            "hit_rate": round(served / lookups, 3) if lookups else None,
+            "entries": entries,
+            "bytes": total_bytes,
+            "near_dup_indexed": len(self.index) if self.index is not None else None,
+            "generations_saved": served,
+            "cost_saved_usd": round(served * GENERATION_COST_USD, 2),
+        }
@@ -0,0 +1,116 @@
+# app/services/sessions.py
+"""
+Per-user conversation state for the WhatsApp flows, kept in jobs.db (WAL) so it survives
+restarts and every worker process sees the same thing. A user has at most one session
+of each kind, looked up by primary key:
+  "style"     awaiting_style (prompt received, no style yet) -> queued (style chosen,
+              request with the dispatcher); removed once the job exists
+  "feedback"  awaiting_feedback (video delivered, no 👍/👎 yet); removed by the reply
+Sessions expire SESSION_TTL_SECONDS after their last change and are purged now and then.
+Transitions are single conditional statements on the current state, so two processes
+can't both act on one message; inside a process, lock(user) serializes a user's
+messages over a fixed set of lock shards.
+"""
+
+import os
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from app import db
+from app.storage import epoch_ms
+
+log = logging.getLogger("services.sessions")
+
+# ---- Configuration (from env) ----
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", str(24 * 3600)))   # abandoned sessions expire
+SESSION_LOCK_SHARDS = int(os.getenv("SESSION_LOCK_SHARDS", "64"))              # per-user locks, striped
+SESSION_PURGE_EVERY = 1000   # writes between purges of expired rows
+
+# kinds and states
+STYLE = "style"
+FEEDBACK = "feedback"
+AWAITING_STYLE = "awaiting_style"
+QUEUED = "queued"
+AWAITING_FEEDBACK = "awaiting_feedback"
+
+
+@dataclass(slots=True)
+class Session:
+    user_number: str
+    kind: str
+    state: str
+    prompt: Optional[str] = None
+    style: Optional[str] = None
+    job_id: Optional[str] = None
+    expires_ms: int = 0
+
+    @classmethod
+    def from_row(cls, row) -> "Session":
+        return cls(row["user_number"], row["kind"], row["state"], row["prompt"], row["style"],
+                   row["job_id"], row["expires_ms"])
+
+
+class SessionStore:
+    """Blocking methods (call them through run_db) plus lock(), which is for the event loop."""
+
+    def __init__(self, ttl_seconds: int = SESSION_TTL_SECONDS, lock_shards: int = SESSION_LOCK_SHARDS):
+        self.ttl_seconds = ttl_seconds
+        self._locks: List[asyncio.Lock] = [asyncio.Lock() for _ in range(max(1, lock_shards))]
+        self._writes = 0
+        self.stats: Dict[str, int] = {"reads": 0, "writes": 0, "advanced": 0, "taken": 0,
+                                      "lost_races": 0, "purged": 0}
+
+    def lock(self, user_number: str) -> asyncio.Lock:
+        """The lock shard guarding this user's messages in this process."""
+        return self._locks[hash(user_number) % len(self._locks)]
+
+    def get(self, user_number: str) -> Dict[str, Session]:
+        """kind -> unexpired session."""
+        self.stats["reads"] += 1
+        rows = db.get_sessions(user_number, epoch_ms())
+        return {row["kind"]: Session.from_row(row) for row in rows}
+
+    def start(self, user_number: str, kind: str, state: str, prompt: Optional[str] = None,
+              style: Optional[str] = None, job_id: Optional[str] = None) -> Session:
+        """Create or replace the user's session of this kind."""
+        now = self._write()
+        expires = now + self.ttl_seconds * 1000
+        db.put_session(user_number, kind, state, prompt, style, job_id, now, expires)
+        return Session(user_number, kind, state, prompt, style, job_id, expires)
+
+    def advance(self, user_number: str, kind: str, from_state: str, to_state: str,
+                style: Optional[str] = None) -> Optional[Session]:
+        """Compare-and-set the state; None if the session is gone or already moved on."""
+        now = self._write()
+        row = db.advance_session(user_number, kind, from_state, to_state, style, now, now + self.ttl_seconds * 1000)
+        if row is None:
+            self.stats["lost_races"] += 1
+            return None
+        self.stats["advanced"] += 1
+        return Session.from_row(row)
+
+    def take(self, user_number: str, kind: str, state: Optional[str] = None,
+             job_id: Optional[str] = None) -> Optional[Session]:
+        """Remove and return the session if it still matches state / job_id (when given)."""
+        row = db.take_session(user_number, kind, state, job_id, self._write())
+        if row is None:
+            return None
+        self.stats["taken"] += 1
+        return Session.from_row(row)
+
+    def _write(self) -> int:
+        now = epoch_ms()
+        self._writes += 1
+        self.stats["writes"] += 1
+        if self._writes % SESSION_PURGE_EVERY == 0:
+            try:
+                self.stats["purged"] += db.purge_sessions(now)
+            except Exception:
+                log.exception("Purging expired sessions failed")
+        return now
+
+    def snapshot(self) -> Dict[str, int]:
+        return {**self.stats, "ttl_seconds": self.ttl_seconds, "lock_shards": len(self._locks),
+                "locks_held": sum(lock.locked() for lock in self._locks)}
@@ -1,12 +1,16 @@
 # app/services/video_generator.py
+import sys
 import logging
 import datetime
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Tuple
 from app.services.jobs import JobRecord, JobStore
 from app.services.prompts import compose_prompt, prompt_hash
-from app.providers.base import BaseProvider
+from app.services.result_cache import ResultCache
+from app.services.events import JobEventBus
+from app.storage import run_db
+from app.providers.base import TERMINAL_STATUSES, BaseProvider, VideoJob
 from app.providers.mock import MockProvider
-from app.providers.modelslab import ModelsLabProvider
+from app.providers.router import build_provider
 
 log = logging.getLogger("services.video_generator")
 
@@ -23,10 +27,12 @@ class VideoGenerator:
     IMPORTANT: Accepts a JobStore instance so state is shared with app.main and workers.
     """
 
-    def __init__(self, provider: Optional[Any] = None, job_store: Optional[JobStore] = None):
-        # provider can be a string ("modelslab"/"mock"), a provider instance, or None
+    def __init__(self, provider: Optional[Any] = None, job_store: Optional[JobStore] = None,
+                 result_cache: Optional[ResultCache] = None, events: Optional[JobEventBus] = None):
+        # provider can be a string ("modelslab"/"mock", or a router spec such as
+        # "modelslab:3:20,mock:1"), a provider instance, or None
         if isinstance(provider, str):
-            self.provider = ModelsLabProvider() if provider == "modelslab" else MockProvider()
+            self.provider = build_provider(provider)
         else:
             self.provider = provider or _build_provider()
 
@@ -37,40 +43,59 @@ class VideoGenerator:
         else:
             self.job_store = job_store
 
+        # Durable prompt_hash -> video cache; None disables caching (e.g. benchmarks).
+        self.result_cache = result_cache
+
+        # Status changes are published here for /events watchers; None disables it.
+        self.events = events
+
         log.debug("VideoGenerator initialized with provider=%s job_store_id=%s", type(self.provider).__name__, id(self.job_store))
 
-    def submit(
+    async def submit(
         self,
         user_prompt: str,
         style: str = "cinematic",
         options: Optional[Dict[str, Any]] = None,
+        cache_key: Optional[str] = None,
+        use_cache: bool = True,
     ):
         """
         Submit a video generation request.
-        Uses the shared self.job_store for caching/persistence.
-        Returns provider-specific job object (which has job_id, status, etc).
+        Uses the shared self.job_store for persistence and self.result_cache for repeats.
+        cache_key overrides the hash of user_prompt, for callers that submit a rewritten
+        prompt but cache on what the user originally typed; use_cache=False skips the
+        lookup for callers that have just checked the cache themselves.
+        Returns provider-specific job object (which has job_id, status, etc), or a
+        JobRecord with cached=True when a finished video already exists.
+        The provider call is awaited on the loop; cache lookups run on the DB executor.
         """
         if not user_prompt.strip():
             raise ValueError("Prompt is required")
 
-        h = prompt_hash(user_prompt, style)
-        cached = self.job_store.get_by_hash(h)
+        h = cache_key or prompt_hash(user_prompt, style)
+        cached = None
+        if self.result_cache and use_cache:
+            # an explicit key is an exact lookup; otherwise allow near-duplicate matches too
+            if cache_key:
+                cached = await run_db(self.result_cache.get, h)
+            else:
+                cached = await run_db(self.result_cache.lookup, user_prompt, style)
 
-        if cached and cached.status == "succeeded":
+        if cached:
             # Return JobRecord cached result (keeps compatibility with caller expectations)
             log.info("Returning cached job for hash=%s (job=%s)", h, cached.job_id)
-            return cached
+            return cached.to_record()
 
         # Compose final prompt and send to provider
         final_prompt = compose_prompt(user_prompt, style)
-        job = self.provider.submit(final_prompt, options={"style": style, **(options or {})})
+        job = await self.provider.submit(final_prompt, options={"style": style, **(options or {})})
 
         # Persist record in the shared JobStore
         rec = JobRecord(
             job_id=job.job_id,
             status=job.status,
             video_path=None,
-            provider=type(self.provider).__name__.lower(),
+            provider=job.provider or type(self.provider).__name__.lower(),
             prompt_hash=h,
             prompt=user_prompt,                # store final prompt into record
             final_prompt=user_prompt,
@@ -82,26 +107,107 @@ class VideoGenerator:
         log.debug("Submitted job=%s status=%s stored in job_store_id=%s", job.job_id, job.status, id(self.job_store))
         return job
 
-    def fetch(self, job_id: str):
+    async def fetch(self, job_id: str):
         """
         Check job status and update store.
-        Returns provider job with latest status.
+        Returns provider job with latest status; raises ProviderError if the provider
+        can't be reached right now. Jobs already finished are answered from their record.
+        """
+        done = await run_db(self._finished, [job_id])
+        if job_id in done:
+            return done[job_id]
+        pj = await self.provider.fetch(job_id)
+        await run_db(self._apply, job_id, pj)
+        return pj
+
+    async def fetch_many(self, job_ids: List[str]) -> Dict[str, Any]:
+        """
+        Batched fetch: jobs already finished come from their records, the rest go to the
+        provider in one fetch_many call; status changes are written in one transaction.
+        Returns {job_id: provider job}; jobs that could not be polled are missing.
+        """
+        job_ids = list(dict.fromkeys(job_ids))
+        results = await run_db(self._finished, job_ids)
+        pending = [job_id for job_id in job_ids if job_id not in results]
+        if pending:
+            fetched = await self.provider.fetch_many(pending)
+            if fetched:
+                await run_db(self._apply_all, fetched)
+            results.update(fetched)
+        return results
+
+    async def apply_callback(self, payload: Dict[str, Any]):
+        """
+        Fast path for provider webhooks, taken as a hint that a job changed: only the job id
+        is read from the body, the status and output URL are fetched from the provider
+        (finished jobs are answered from their record). Returns the provider job, or None
+        for a job we don't know; raises ProviderError if the provider can't be asked.
+        """
+        job_id = self.provider.callback_job_id(payload)
+        if job_id is None or await run_db(self.job_store.get, job_id) is None:
+            return None
+        return await self.fetch(job_id)
+
+    def _finished(self, job_ids: List[str]) -> Dict[str, VideoJob]:
+        """Blocking: VideoJobs rebuilt from records that are already terminal (no provider call needed)."""
+        out = {}
+        for job_id in job_ids:
+            rec = self.job_store.get(job_id)
+            if rec is not None and rec.status in TERMINAL_STATUSES:
+                meta = rec._meta or {}
+                out[job_id] = VideoJob(job_id, status=rec.status, video_url=meta.get("provider_output_url"),
+                                       error=meta.get("error"))
+        return out
+
+    def _apply_all(self, results: Dict[str, Any]) -> None:
+        changes = [c for c in (self._merge(job_id, pj) for job_id, pj in results.items()) if c]
+        self.job_store.update_statuses(changes)
+
+    def _apply(self, job_id: str, pj) -> None:
+        change = self._merge(job_id, pj)
+        if change:
+            self.job_store.update_status(*change)
+
+    def _merge(self, job_id: str, pj) -> Optional[Tuple[str, str, Optional[str], str]]:
+        """
+        Fold a provider job into the shared record. Returns the DB write it needs
+        (job_id, status, video_path, user_number), or None when nothing persisted changed.
         """
-        pj = self.provider.fetch(job_id)
         rec = self.job_store.get(job_id)
 
         if not rec:
             # No record in store; return provider job directly
             log.debug("fetch(): no JobRecord for job_id=%s in shared store", job_id)
-            return pj
+            return None
+
+        if rec.status in TERMINAL_STATUSES:
+            return None   # a finished job never changes again
 
         # Update record status
-        rec.status = pj.status
+        changed = rec.status != pj.status
+        rec.status = sys.intern(pj.status)
         if pj.status == "succeeded" and not rec.video_path:
             # expose internal app path that the /video/{job_id} route will serve
             rec.video_path = f"/video/{job_id}"
             if pj.video_url:
                 rec.meta["provider_output_url"] = pj.video_url
             log.debug("fetch(): marked rec.video_path=%s for job=%s", rec.video_path, job_id)
-
-        return pj
+            # not cached yet: the delivery step does that once the file is in the blob store
+        elif pj.status == "failed" and pj.error:
+            rec.meta["error"] = pj.error
+        if changed and self.events:
+            self.events.publish(job_id, {"job_id": job_id, "status": rec.status,
+                                         "video_url": rec.video_path, "error": pj.error})
+        if changed and rec.user_number:
+            # write-through: jobs.db is the source of truth for /history
+            return job_id, rec.status, rec.video_path, rec.user_number
+        return None
+
+    def remember_result(self, rec: JobRecord, size_bytes: Optional[int] = None):
+        """Store a succeeded job in the result cache (no-op without one)."""
+        if not self.result_cache:
+            return
+        try:
+            self.result_cache.put(rec, size_bytes=size_bytes)
+        except Exception:
+            log.exception("Could not cache result for job=%s", rec.job_id)
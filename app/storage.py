@@ -0,0 +1,132 @@
+# app/storage.py
+"""
+Shared SQLite plumbing for jobs.db and requests.db.
+
+Each thread keeps one long-lived connection per database (WAL journal, tuned
+synchronous/busy_timeout, statement cache), so calls stop paying for
+connect/close and re-preparing the same SQL. run_db() is the async facade:
+it runs blocking DB work on a small dedicated thread pool instead of the event loop.
+"""
+
+import os
+import time
+import sqlite3
+import asyncio
+import logging
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Iterator, List, Optional
+
+log = logging.getLogger("app.storage")
+
+# ---- Configuration (from env) ----
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")   # NORMAL is durable enough under WAL
+SQLITE_CACHED_STATEMENTS = int(os.getenv("SQLITE_CACHED_STATEMENTS", "256"))
+DB_THREADS = int(os.getenv("DB_THREADS", "4"))
+
+
+def epoch_ms(ts: Optional[str] = None) -> int:
+    """Sortable integer timestamp: now, or parsed from an ISO-8601 string (trailing 'Z' allowed)."""
+    if ts:
+        try:
+            dt = datetime.fromisoformat(ts.replace("Z", "+00:00"))
+            if dt.tzinfo is None:   # CURRENT_TIMESTAMP-style values are UTC
+                return int((dt - datetime(1970, 1, 1)).total_seconds() * 1000)
+            return int(dt.timestamp() * 1000)
+        except ValueError:
+            pass
+    return int(time.time() * 1000)
+
+
+class SQLiteDB:
+    """Per-thread pooled connections to one SQLite file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._conns: List[sqlite3.Connection] = []
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.path,
+            timeout=SQLITE_BUSY_TIMEOUT_MS / 1000,
+            isolation_level=None,              # autocommit; use transaction() for multi-statement work
+            check_same_thread=False,           # only ever used by its owning thread; closed from any
+            cached_statements=SQLITE_CACHED_STATEMENTS,
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+        conn.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        with self._lock:
+            self._conns.append(conn)
+        return conn
+
+    def connection(self) -> sqlite3.Connection:
+        """This thread's connection, opened on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._open()
+        return conn
+
+    def execute(self, sql: str, params: Any = ()) -> sqlite3.Cursor:
+        return self.connection().execute(sql, params)
+
+    @contextmanager
+    def transaction(self, immediate: bool = False) -> Iterator[sqlite3.Connection]:
+        """
+        BEGIN ... COMMIT on this thread's connection (ROLLBACK on error).
+        immediate=True takes the write lock up front, for read-then-write sequences.
+        Nested use joins the outer transaction.
+        """
+        conn = self.connection()
+        if conn.in_transaction:
+            yield conn
+            return
+        conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def close_all(self):
+        """Close every pooled connection (e.g. at shutdown or before swapping files in tests)."""
+        with self._lock:
+            conns, self._conns = self._conns, []
+        for conn in conns:
+            try:
+                conn.close()
+            except Exception:
+                log.debug("Error closing connection to %s", self.path)
+        self._local = threading.local()
+
+
+# ---- Async facade ----
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=DB_THREADS, thread_name_prefix="sqlite")
+    return _executor
+
+
+async def run_db(fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """Await a blocking DB call without stalling the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), lambda: fn(*args, **kwargs))
+
+
+def shutdown_db_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+        _executor = None
@@ -5,8 +5,10 @@ Command handlers for the WhatsApp bot.
 These return text strings that the webhook will wrap into TwiML via ack_twiml().
 """
 
-from typing import List
+from typing import List, Optional
 from app.services.jobs import JobStore
+from app.services.sessions import QUEUED, STYLE, SessionStore
+from app.storage import run_db
 
 def handle_guide() -> str:
     return (
@@ -14,21 +16,30 @@ def handle_guide() -> str:
         "Commands you can use:\n"
         "• `/guide` – Show this help message\n"
         "• `/status` – Check your last video generation status\n"
-        "• `/history` – View your recent requests\n\n"
+        "• `/history` – View your recent requests\n"
+        "• `/history more` – Show older requests\n\n"
         "Or simply send me a prompt and I’ll generate a short video!"
     )
 
-def handle_status(user_number: str, job_store: JobStore, video_gen) -> str:
+async def handle_status(user_number: str, job_store: JobStore, video_gen,
+                        sessions: Optional[SessionStore] = None) -> str:
     """
-    Return a one-line friendly status message for the user's most recent job.
+    Return a one-line friendly status message for the user's most recent job,
+    or for a prompt that has no job yet (in the sessions store).
     """
-    rec = job_store.get_last_job_for_user(user_number)
+    pending = (await run_db(sessions.get, user_number)).get(STYLE) if sessions is not None else None
+    if pending is not None:
+        # style chosen, request still with the dispatcher (no provider job yet)
+        if pending.state == QUEUED:
+            return "⏳ Your video request is queued — it'll start in a moment!"
+        return "ℹ️ Choose a style for your prompt first: anime(✨), cartoon(🎭), or cyberpunk(🤖)."
+    rec = await run_db(job_store.get_last_job_for_user, user_number)
     if not rec:
         return "ℹ️ You don’t have any recent jobs. Send me a prompt to start!"
 
     # fetch latest status from provider
     try:
-        pj = video_gen.fetch(rec.job_id)
+        pj = await video_gen.fetch(rec.job_id)
         status = pj.status
     except Exception:
         # fall back to the stored record
@@ -43,12 +54,17 @@ def handle_status(user_number: str, job_store: JobStore, video_gen) -> str:
     else:
         return f"⏳ Job `{rec.job_id}` is still {status} — hang tight!"
 
-def handle_history(user_number: str, job_store: JobStore, limit: int = 5) -> str:
+def handle_history(user_number: str, job_store: JobStore, limit: int = 5, more: bool = False) -> str:
     """
     Return a short history summary for the user listing the most recent jobs.
+    more=True continues from where the previous /history page ended.
     Uses JobRecord fields: created_at, job_id, status, prompt, video_path.
     """
-    recs = job_store.get_history_for_user(user_number, limit=limit)
+    cursor = job_store.get_history_cursor(user_number) if more else None
+    if more and not cursor:
+        return "ℹ️ That's all of your history. Send `/history` to start from the newest again."
+    recs, next_cursor = job_store.get_history_page(user_number, limit=limit, cursor=cursor)
+    job_store.set_history_cursor(user_number, next_cursor)
     if not recs:
         return "ℹ️ No history yet. Send me a prompt and I'll create your first video!"
 
@@ -80,4 +96,6 @@ def handle_history(user_number: str, job_store: JobStore, limit: int = 5) -> str
 
         lines.append(line)
 
-    return "📜 Your recent jobs (newest first):\n\n" + "\n\n".join(lines)
+    header = "📜 Older jobs:" if more else "📜 Your recent jobs (newest first):"
+    footer = "\n\nSend `/history more` for older jobs." if next_cursor else ""
+    return f"{header}\n\n" + "\n\n".join(lines) + footer
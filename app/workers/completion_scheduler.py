@@ -0,0 +1,212 @@
+# app/workers/completion_scheduler.py
+
+import os
+import heapq
+import asyncio
+import logging
+import itertools
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+log = logging.getLogger("workers.completion")
+
+# ---- Configuration (from env) ----
+COMPLETION_BATCH_SIZE = int(os.getenv("COMPLETION_BATCH_SIZE", "200"))
+COMPLETION_MIN_DELAY = float(os.getenv("COMPLETION_MIN_DELAY", "0.25"))
+COMPLETION_MAX_DELAY = float(os.getenv("COMPLETION_MAX_DELAY", "15"))
+COMPLETION_SLOW_AFTER = float(os.getenv("COMPLETION_SLOW_AFTER", "90"))         # "taking longer" notice
+COMPLETION_GIVE_UP_AFTER = float(os.getenv("COMPLETION_GIVE_UP_AFTER", "1800"))  # stop tracking entirely
+COMPLETION_MAX_FETCH_ERRORS = int(os.getenv("COMPLETION_MAX_FETCH_ERRORS", "3"))
+
+BACKOFF_FACTOR = 1.5
+
+# on_complete(job_id, user_number, provider_job_or_None); on_progress/on_slow(job_id, user_number)
+CompleteHandler = Callable[[str, str, Any], Awaitable[None]]
+NoticeHandler = Callable[[str, str], Awaitable[None]]
+
+
+@dataclass
+class _Tracked:
+    job_id: str
+    user_number: str
+    started: float
+    seq: int = 0          # matches the live heap entry; older entries are stale
+    checks: int = 0
+    errors: int = 0
+    slow_notified: bool = False
+
+
+class CompletionScheduler:
+    """
+    One shared loop that watches every in-flight job.
+
+    Jobs sit in a heap ordered by their next check time. Each wake-up pops every due job
+    (up to batch_size) and checks them with a single VideoGenerator.fetch_many call.
+    Still-processing jobs are re-armed with exponential backoff paced by the provider's
+    expected generation time; terminal jobs are handed to on_complete. Provider webhooks
+    short-circuit the wait through notify().
+    """
+
+    def __init__(
+        self,
+        video_gen,
+        on_complete: CompleteHandler,
+        on_progress: Optional[NoticeHandler] = None,
+        on_slow: Optional[NoticeHandler] = None,
+        expected_seconds: Optional[float] = None,
+        batch_size: int = COMPLETION_BATCH_SIZE,
+        min_delay: float = COMPLETION_MIN_DELAY,
+        max_delay: float = COMPLETION_MAX_DELAY,
+        slow_after: float = COMPLETION_SLOW_AFTER,
+        give_up_after: float = COMPLETION_GIVE_UP_AFTER,
+    ):
+        self.video_gen = video_gen
+        self.on_complete = on_complete
+        self.on_progress = on_progress
+        self.on_slow = on_slow
+        expected = expected_seconds or getattr(video_gen.provider, "expected_seconds", 30.0)
+        self.first_delay = max(min_delay, expected * 0.75)
+        self.step_delay = max(min_delay, expected * 0.25)
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.slow_after = slow_after
+        self.give_up_after = give_up_after
+
+        self._jobs: Dict[str, _Tracked] = {}
+        self._heap: List[Tuple[float, int, str]] = []
+        self._seq = itertools.count()
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._handlers: Set[asyncio.Task] = set()
+
+        self.stats: Dict[str, int] = {
+            "tracked": 0, "completed": 0, "checks": 0, "batches": 0,
+            "callbacks": 0, "fetch_errors": 0, "slow": 0, "abandoned": 0,
+        }
+
+    # ---- Public API ----
+    def track(self, job_id: str, user_number: str):
+        """Start watching a submitted job; on_complete fires once it is terminal."""
+        loop = asyncio.get_running_loop()
+        t = _Tracked(job_id=job_id, user_number=user_number, started=loop.time())
+        self._jobs[job_id] = t
+        self.stats["tracked"] += 1
+        self._arm(t, loop.time() + self.first_delay)
+
+    def notify(self, pj) -> bool:
+        """Webhook fast path: a provider pushed a status. Returns True if it completed a tracked job."""
+        self.stats["callbacks"] += 1
+        if pj is None or not pj.is_terminal:
+            return False
+        t = self._jobs.pop(pj.job_id, None)
+        if t is None:
+            return False
+        self._complete(t, pj)
+        return True
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {**self.stats, "in_flight": len(self._jobs), "delivering": len(self._handlers)}
+
+    # ---- Loop ----
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        if self._wake is None:
+            self._wake = asyncio.Event()
+        while True:
+            now = loop.time()
+            due: List[_Tracked] = []
+            while self._heap and self._heap[0][0] <= now and len(due) < self.batch_size:
+                _, seq, job_id = heapq.heappop(self._heap)
+                t = self._jobs.get(job_id)
+                if t is not None and t.seq == seq:
+                    due.append(t)
+
+            if not due:
+                self._wake.clear()
+                timeout = (self._heap[0][0] - now) if self._heap else None
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            try:
+                await self._check_batch(due, loop)
+            except Exception:
+                log.exception("Completion batch failed")
+
+    async def _check_batch(self, due: List[_Tracked], loop: asyncio.AbstractEventLoop):
+        self.stats["batches"] += 1
+        self.stats["checks"] += len(due)
+        ids = [t.job_id for t in due]
+        try:
+            results = await self.video_gen.fetch_many(ids)
+        except Exception:
+            log.exception("Error polling provider for %d jobs", len(ids))
+            self.stats["fetch_errors"] += 1
+            results = {}
+
+        now = loop.time()
+        for t in due:
+            if self._jobs.get(t.job_id) is not t:
+                continue  # completed by a webhook while we were fetching
+            t.checks += 1
+            pj = results.get(t.job_id)
+
+            if pj is None:
+                t.errors += 1
+                if t.errors >= COMPLETION_MAX_FETCH_ERRORS:
+                    del self._jobs[t.job_id]
+                    self._complete(t, None)
+                    continue
+            elif pj.is_terminal:
+                del self._jobs[t.job_id]
+                self._complete(t, pj)
+                continue
+
+            age = now - t.started
+            if age >= self.give_up_after:
+                del self._jobs[t.job_id]
+                self.stats["abandoned"] += 1
+                log.warning("Giving up on job=%s after %.0fs", t.job_id, age)
+                continue
+            if t.checks == 1 and self.on_progress:
+                self._spawn(self.on_progress(t.job_id, t.user_number))
+            if age >= self.slow_after and not t.slow_notified:
+                t.slow_notified = True
+                self.stats["slow"] += 1
+                if self.on_slow:
+                    self._spawn(self.on_slow(t.job_id, t.user_number))
+
+            delay = min(self.max_delay, self.step_delay * (BACKOFF_FACTOR ** (t.checks - 1)))
+            self._arm(t, now + delay)
+
+    # ---- Helpers ----
+    def _arm(self, t: _Tracked, due_at: float):
+        t.seq = next(self._seq)
+        heapq.heappush(self._heap, (due_at, t.seq, t.job_id))
+        if self._wake is not None and self._heap[0][2] == t.job_id:
+            self._wake.set()  # new earliest deadline; re-plan the sleep
+
+    def _complete(self, t: _Tracked, pj):
+        self.stats["completed"] += 1
+        self._spawn(self.on_complete(t.job_id, t.user_number, pj))
+
+    def _spawn(self, coro: Awaitable[None]):
+        task = asyncio.ensure_future(coro)
+        self._handlers.add(task)
+        task.add_done_callback(self._handlers.discard)
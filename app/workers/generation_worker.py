@@ -5,8 +5,15 @@ import asyncio
 import logging
 from typing import Optional
 
-from app.integrations.twilio import send_message, send_media
-from app.services.jobs import JobStore
+from app.integrations.twilio import send_message_async, send_media_async
+from app.providers.base import VideoJob
+from app.services.blob_store import BlobRef, BlobStore
+from app.services.ingest import Downloader
+from app.services.jobs import JobRecord, JobStore
+from app.services.sessions import AWAITING_FEEDBACK, FEEDBACK, SessionStore
+from app.storage import run_db
+from app.workers.renditions import RENDITIONS_ENABLED, build_renditions
+from app.workers.transcoder import PRIORITY_USER, Transcoder
 from app.workers.video_utils import downscale_video
 
 log = logging.getLogger("workers.generation")
@@ -18,134 +25,184 @@ PUBLIC_BASE_URL = os.getenv("PUBLIC_BASE_URL", "").rstrip("/")
 API_BASE_URL = os.getenv("API_BASE_URL", PUBLIC_BASE_URL).rstrip("/")
 
 
-async def process_whatsapp_job(job_id: str, user_number: str, video_gen, job_store: JobStore):
+PLACEHOLDER_VIDEO = "app/static/placeholder.mp4"
+
+
+def _is_provider_url(url: Optional[str]) -> bool:
+    """A remote file to fetch (not our own /video link)."""
+    if not url or not url.startswith(("http://", "https://")):
+        return False
+    return not (PUBLIC_BASE_URL and url.startswith(PUBLIC_BASE_URL + "/"))
+
+
+async def store_video(job_id: str, rec: JobRecord, blob_store: BlobStore,
+                      transcoder: Optional[Transcoder] = None, downloader: Optional[Downloader] = None,
+                      source_url: Optional[str] = None) -> BlobRef:
+    """
+    Make /video/{job_id} resolve to a WhatsApp-safe file in the blob store.
+    A prompt_hash that already has a stored video just gets another pointer to it.
+    Otherwise the provider's output (source_url) is streamed to disk and encoded; jobs
+    without one (the mock provider) use the placeholder clip.
+    The encode goes through the transcoder when given, else a worker thread.
+    """
+    ref = await run_db(blob_store.alias_prompt, job_id, rec.prompt_hash)
+    if ref is not None:
+        return ref
+
+    input_path = PLACEHOLDER_VIDEO
+    download_path = None
+    try:
+        if _is_provider_url(source_url):
+            download_path = blob_store.scratch_path(f"{job_id}.source")
+            if downloader is not None:
+                await downloader.download(source_url, download_path)
+            else:
+                downloader = Downloader(max_concurrency=1)
+                try:
+                    await downloader.download(source_url, download_path)
+                finally:
+                    await downloader.aclose()
+            input_path = download_path
+
+        scratch = blob_store.scratch_path(f"{job_id}.mp4")
+        if transcoder is not None:
+            await transcoder.downscale(input_path, scratch, priority=PRIORITY_USER, job_id=job_id)
+        else:
+            await asyncio.to_thread(downscale_video, input_path, scratch)
+    finally:
+        if download_path and os.path.exists(download_path):
+            os.remove(download_path)
+    return await asyncio.to_thread(blob_store.ingest, job_id, scratch, True)
+
+
+async def process_whatsapp_job(job_id: str, user_number: str, pj: Optional[VideoJob], video_gen, job_store: JobStore,
+                               blob_store: Optional[BlobStore] = None, transcoder: Optional[Transcoder] = None,
+                               downloader: Optional[Downloader] = None, sessions: Optional[SessionStore] = None):
     """
-    Background worker that polls the provider for job completion and sends
-    the video back to the WhatsApp user via Twilio when ready.
+    Delivery step for a finished job: sends the video (or the failure) back to the
+    WhatsApp user via Twilio. Called by the CompletionScheduler once the job is terminal.
 
     Parameters:
       - job_id: provider job id
       - user_number: e.g. "whatsapp:+1234567890"
+      - pj: terminal provider job, or None if the provider could not be polled
       - video_gen: a VideoGenerator instance (passed by main to avoid circular imports)
       - job_store: the same JobStore instance used by the app
+      - blob_store: where the final file is stored (defaults to a BlobStore on BLOB_STORE_DIR)
+      - transcoder: shared Transcoder that runs the encode (None: ffmpeg in a worker thread)
+                    and, after delivery, the preview/poster renditions
+      - downloader: shared Downloader that streams the provider's output to disk
+      - sessions: where the user's owed 👍/👎 is recorded once the video is sent
     """
-    log.info("Worker started: job=%s -> %s", job_id, user_number)
+    log.info("Delivering job=%s status=%s -> %s", job_id, pj.status if pj else None, user_number)
 
-    max_attempts = 60  # poll up to ~60 * backoff seconds
-    attempt = 0
-    backoff = 1.5
-
-    while attempt < max_attempts:
-        attempt += 1
+    if pj is None:
+        # provider error while fetching — notify and stop
         try:
-            pj = video_gen.fetch(job_id)
+            await send_message_async(user_number, "⚠️ Error checking generation status. Please try again later.")
         except Exception:
-            log.exception("Error polling provider for job %s", job_id)
-            pj = None
+            log.exception("Failed to notify user about provider fetch error for job %s", job_id)
+        return
 
-        if pj is None:
-            # provider error while fetching — notify and stop
-            try:
-                send_message(user_number, "⚠️ Error checking generation status. Please try again later.")
-            except Exception:
-                log.exception("Failed to notify user about provider fetch error for job %s", job_id)
-            return
-
-        log.debug("Polled job %s status=%s", job_id, pj.status)
-
-        if pj.status == "succeeded":
-            rec = job_store.get(job_id)
-
-            # Prefer public provider URL if available
-            media_url = pj.video_url or (rec.meta.get("provider_output_url") if rec else None)
-
-            # If we don't have a direct public URL, try to expose our local /video/{job_id}
-            if not media_url:
-                if rec and rec.video_path:
-                    if PUBLIC_BASE_URL:
-                        p = rec.video_path
-                        if not p.startswith("/"):
-                            p = "/" + p
-                        media_url = f"{PUBLIC_BASE_URL}{p}"
-                    else:
-                        # cannot deliver media to Twilio without public base URL
-                        log.warning("No PUBLIC_BASE_URL defined; cannot deliver media for job=%s", job_id)
-                        try:
-                            send_message(
-                                user_number,
-                                f"✅ Your video is ready but the server is not public. Open the app to view it (job: {job_id}).",
-                            )
-                        except Exception:
-                            log.exception("Failed to notify user about local-only video for job %s", job_id)
-                        return
+    if pj.status == "succeeded":
+        rec = await run_db(job_store.get, job_id)   # may read jobs.db if the record was evicted
+
+        # Prefer public provider URL if available
+        media_url = pj.video_url or (rec.meta.get("provider_output_url") if rec else None)
+
+        # If we don't have a direct public URL, try to expose our local /video/{job_id}
+        if not media_url:
+            if rec and rec.video_path:
+                if PUBLIC_BASE_URL:
+                    p = rec.video_path
+                    if not p.startswith("/"):
+                        p = "/" + p
+                    media_url = f"{PUBLIC_BASE_URL}{p}"
                 else:
-                    # No video URL at all
+                    # cannot deliver media to Twilio without public base URL
+                    log.warning("No PUBLIC_BASE_URL defined; cannot deliver media for job=%s", job_id)
                     try:
-                        send_message(user_number, "⚠️ Video finished but URL missing. Please try again later.")
+                        await send_message_async(
+                            user_number,
+                            f"✅ Your video is ready but the server is not public. Open the app to view it (job: {job_id}).",
+                        )
                     except Exception:
-                        log.exception("Failed to notify user about missing URL for job %s", job_id)
+                        log.exception("Failed to notify user about local-only video for job %s", job_id)
                     return
-                
-            # --- Ensure WhatsApp-safe size (<16MB) ---
-            compressed_dir = "app/static/compressed"
-            os.makedirs(compressed_dir, exist_ok=True)
-
-            # For demo we always compress placeholder; in real case use provider file path
-            input_path = "app/static/placeholder.mp4"
-            output_path = os.path.join(compressed_dir, f"{job_id}.mp4")
-
-            try:
-                downscale_video(input_path, output_path)
-                # Update record + media_url to point to compressed file served via /video/{job_id}
-                rec.video_path = f"/video/{job_id}"
-                if PUBLIC_BASE_URL:
-                    media_url = f"{PUBLIC_BASE_URL}{rec.video_path}"
-            except Exception as e:
-                log.exception("Video compression failed for job=%s: %s", job_id, e)
-
-            # Prepare unified caption (video + feedback request)
-            caption = (
-                "✅ Here's your AI-generated video!\n\n"
-                "🙏 Did you like it?\n"
-                "Please reply with 👍 or 👎"
-            )
+            else:
+                # No video URL at all
+                try:
+                    await send_message_async(user_number, "⚠️ Video finished but URL missing. Please try again later.")
+                except Exception:
+                    log.exception("Failed to notify user about missing URL for job %s", job_id)
+                return
+            
+        # --- Ensure WhatsApp-safe size (<16MB), stored once per distinct file ---
+        blob_store = blob_store or BlobStore()
+        ref = None
+        try:
+            ref = await store_video(job_id, rec, blob_store, transcoder, downloader, media_url)
+            # Update record + media_url to point to the stored file served via /video/{job_id}
+            rec.video_path = f"/video/{job_id}"
+            if PUBLIC_BASE_URL:
+                media_url = f"{PUBLIC_BASE_URL}{rec.video_path}"
+            # cache the result only now that the final file (and its size) exists; until then
+            # /video/{job_id} would serve the placeholder to every repeat of this prompt
+            await run_db(video_gen.remember_result, rec, ref.size_bytes)
+        except Exception as e:
+            log.exception("Video compression failed for job=%s: %s", job_id, e)
+
+        # Prepare unified caption (video + feedback request)
+        caption = (
+            "✅ Here's your AI-generated video!\n\n"
+            "🙏 Did you like it?\n"
+            "Please reply with 👍 or 👎"
+        )
 
-            try:
-                # --- DEVELOPMENT MODE (use link to save Twilio media quota) ---
-                fallback = pj.video_url or media_url or f"/video/{job_id}"
-                send_message(user_number, f"{caption}\n\n🔗 Video link: {fallback}")
+        try:
+            # --- DEVELOPMENT MODE (use link to save Twilio media quota) ---
+            fallback = pj.video_url or media_url or f"/video/{job_id}"
+            await send_message_async(user_number, f"{caption}\n\n🔗 Video link: {fallback}")
 
-                # --- DEMO MODE (uncomment this for real demo day) ---
-                send_media(user_number, media_url, caption=caption)
+            # --- DEMO MODE (uncomment this for real demo day) ---
+            await send_media_async(user_number, media_url, caption=caption)
 
-                log.info("Sent video (dev link mode) for job %s -> %s", job_id, user_number)
+            log.info("Sent video (dev link mode) for job %s -> %s", job_id, user_number)
 
-                # 🔹 NEW: Mark this job as awaiting feedback
-                job_store.mark_feedback_pending(job_id)
+            # 🔹 NEW: Mark this job as awaiting feedback
+            if sessions is not None:
+                await run_db(sessions.start, user_number, FEEDBACK, AWAITING_FEEDBACK,
+                             prompt=rec.prompt if rec else None, job_id=job_id)
 
-            except Exception:
-                log.exception("Failed to send video for job=%s to %s", job_id, user_number)
-            return
+        except Exception:
+            log.exception("Failed to send video for job=%s to %s", job_id, user_number)
 
-        if pj.status == "failed":
-            err_msg = pj.error or "Generation failed"
+        # --- Preview + poster for the web UI, after the user already has the video ---
+        if ref is not None and transcoder is not None and RENDITIONS_ENABLED:
             try:
-                send_message(user_number, f"⚠️ Video generation failed: {err_msg}")
+                await build_renditions(job_id, ref, transcoder, blob_store)
             except Exception:
-                log.exception("Failed to notify user about failure for job=%s", job_id)
-            return
+                log.exception("Rendition pipeline failed for job=%s", job_id)
+        return
 
-        # still processing: optionally send a progress update after first poll
-        if attempt == 2:
-            try:
-                send_message(user_number, "⏳ Still working — this can take ~30–90s. I'll message you when it's ready.")
-            except Exception:
-                log.debug("Could not send progress update to %s", user_number)
+    err_msg = pj.error or "Generation failed"
+    try:
+        await send_message_async(user_number, f"⚠️ Video generation failed: {err_msg}")
+    except Exception:
+        log.exception("Failed to notify user about failure for job=%s", job_id)
+
+
+async def notify_progress(job_id: str, user_number: str):
+    """Sent once when the job is still processing at its first status check."""
+    try:
+        await send_message_async(user_number, "⏳ Still working — this can take ~30–90s. I'll message you when it's ready.")
+    except Exception:
+        log.debug("Could not send progress update to %s", user_number)
 
-        await asyncio.sleep(backoff)
 
-    # Timeout reached
+async def notify_slow(job_id: str, user_number: str):
+    """Sent once when the job exceeds the expected completion window (tracking continues)."""
     try:
-        send_message(user_number, "⚠️ The generation is taking longer than expected. We'll notify you when it's ready.")
+        await send_message_async(user_number, "⚠️ The generation is taking longer than expected. We'll notify you when it's ready.")
     except Exception:
         log.exception("Failed to send timeout message for job=%s", job_id)
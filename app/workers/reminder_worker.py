@@ -1,52 +1,288 @@
 # app/workers/reminder_worker.py
+
+import os
+import time
+import heapq
 import asyncio
 import logging
-from app.integrations.twilio import send_message
-
-log = logging.getLogger("app.reminder_worker")
-
-# Keep track of scheduled reminder tasks per user
-_reminder_tasks = {}
-
-REMINDER_INTERVAL = 15  # seconds (demo)
-
-async def _reminder_loop(user_number: str, job_store):
-    try:
-        while True:  # keep looping
-            await asyncio.sleep(REMINDER_INTERVAL)
-            if user_number in _reminder_tasks:
-                last_job = job_store.get_last_job_for_user(user_number)
-                if last_job and last_job.style:
-                    # Take first 30 characters of prompt (or fewer if shorter)
-                    prompt_snippet = (last_job.prompt[:15] + "...") if last_job.prompt and len(last_job.prompt) > 30 else (last_job.prompt or "your idea")
-                    style_name = last_job.style.title()
-
-                    msg = (
-                        f"👋 Hey! Remember your last video on \"{prompt_snippet}\" "
-                        f"with the {style_name} style?\n"
-                        f"Want me to whip up another one? 🚀\n"
-                        f"What are we waiting for!!!"
-                    )
-                else:
-                    msg = (
-                        "👋 Hey champ, it’s been a while since we made a video.\n"
-                        "Got a new idea for me? 🎥✨"
-                    )
-                send_message(user_number, msg)
-    except asyncio.CancelledError:
-        log.info(f"Reminder for {user_number} cancelled (user active again)")
-        raise
-
-
-def schedule_reminder(user_number: str, job_store):
-    """Start or restart a periodic reminder for the user."""
-    cancel_reminder(user_number)  # cancel any existing one
-    task = asyncio.create_task(_reminder_loop(user_number, job_store))
-    _reminder_tasks[user_number] = task
-
-
-def cancel_reminder(user_number: str):
-    """Cancel a scheduled reminder if one exists."""
-    task = _reminder_tasks.pop(user_number, None)
-    if task and not task.done():
-        task.cancel()
+import itertools
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from app import db
+from app.integrations.twilio import send_message_async
+from app.storage import epoch_ms, run_db
+
+log = logging.getLogger("workers.reminders")
+
+# ---- Configuration (from env) ----
+REMINDER_INTERVAL_SECONDS = float(os.getenv("REMINDER_INTERVAL_SECONDS", "15"))   # demo pace
+REMINDER_MAX_PER_USER = int(os.getenv("REMINDER_MAX_PER_USER", "3"))    # per stretch of inactivity
+REMINDER_SEND_RATE = float(os.getenv("REMINDER_SEND_RATE", "5"))        # messages per second, all users
+REMINDER_BATCH_SIZE = int(os.getenv("REMINDER_BATCH_SIZE", "200"))      # due reminders claimed at once
+REMINDER_FLUSH_SECONDS = float(os.getenv("REMINDER_FLUSH_SECONDS", "1"))  # write-behind delay
+
+COMPACT_MIN_STALE = 1024   # stale heap entries tolerated before a rebuild is considered
+
+# send(user_number, text) -> message sid
+Sender = Callable[[str, str], Awaitable[Any]]
+
+
+def reminder_text(last_job) -> str:
+    if last_job and last_job.style:
+        # Take first 30 characters of prompt (or fewer if shorter)
+        prompt_snippet = (last_job.prompt[:30] + "...") if last_job.prompt and len(last_job.prompt) > 30 else (last_job.prompt or "your idea")
+        return (
+            f"👋 Hey! Remember your last video on \"{prompt_snippet}\" "
+            f"with the {last_job.style.title()} style?\n"
+            f"Want me to whip up another one? 🚀\n"
+            f"What are we waiting for!!!"
+        )
+    return (
+        "👋 Hey champ, it’s been a while since we made a video.\n"
+        "Got a new idea for me? 🎥✨"
+    )
+
+
+class ReminderScheduler:
+    """
+    One loop for every user's inactivity reminders (it replaces a task per user).
+
+    Due times sit in a heap of (due_ms, seq, user_number); _users maps each user to the
+    seq of their live entry, so cancel() is a dict pop and superseded heap entries are
+    skipped when popped (the heap is rebuilt once they outnumber the live ones). Changes
+    are written behind to the reminders table in batches and loaded back at startup.
+    Due reminders are claimed in the database a batch at a time, which also keeps two
+    processes from both sending one, then sent through a token bucket of send_rate
+    messages per second. A user gets at most max_per_user reminders until active again.
+    """
+
+    def __init__(
+        self,
+        job_store,
+        send: Sender = send_message_async,
+        interval: float = REMINDER_INTERVAL_SECONDS,
+        max_per_user: int = REMINDER_MAX_PER_USER,
+        send_rate: float = REMINDER_SEND_RATE,
+        batch_size: int = REMINDER_BATCH_SIZE,
+        flush_seconds: float = REMINDER_FLUSH_SECONDS,
+    ):
+        self.job_store = job_store
+        self.send = send
+        self.interval_ms = int(interval * 1000)
+        self.max_per_user = max_per_user
+        self.send_rate = send_rate
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+
+        self._users: Dict[str, int] = {}                   # user -> seq of the live heap entry
+        self._heap: List[Tuple[int, int, str]] = []
+        self._seq = itertools.count()
+        self._dirty: Dict[str, Optional[Tuple[int, int]]] = {}   # user -> (due_ms, sent), None = delete
+        self._outbox: Set[str] = set()                     # claimed, not sent yet; cancel() removes
+        self._last_flush = 0.0
+        self._tokens = max(1.0, send_rate)
+        self._refilled = time.monotonic()
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._handlers: Set[asyncio.Task] = set()
+
+        self.stats: Dict[str, int] = {
+            "scheduled": 0, "cancelled": 0, "loaded": 0, "claimed": 0, "lost_claims": 0,
+            "sent": 0, "failed": 0, "skipped_active": 0, "capped": 0,
+            "flushes": 0, "rows_written": 0, "compactions": 0,
+        }
+
+    # ---- Public API ----
+    def schedule(self, user_number: str):
+        """(Re)start the user's reminders: the first one interval from now."""
+        due_ms = epoch_ms() + self.interval_ms
+        self._arm(user_number, due_ms)
+        self._dirty[user_number] = (due_ms, 0)
+        self.stats["scheduled"] += 1
+        self._maybe_compact()
+
+    def cancel(self, user_number: str):
+        """The user is active again: no reminders until the next schedule()."""
+        if self._users.pop(user_number, None) is not None:
+            self.stats["cancelled"] += 1
+            self._maybe_compact()
+        self._outbox.discard(user_number)
+        # written even if unknown here: another process (or a previous run) may have scheduled it
+        self._dirty[user_number] = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await run_db(self._flush, self._take_dirty())
+        except Exception:
+            log.exception("Could not persist %d reminder changes at shutdown", len(self._dirty))
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {**self.stats, "users": len(self._users), "heap": len(self._heap),
+                "unflushed": len(self._dirty), "sending": len(self._outbox) + len(self._handlers)}
+
+    # ---- Loop ----
+    async def run(self):
+        if self._wake is None:
+            self._wake = asyncio.Event()
+        try:
+            await self._load()
+        except Exception:
+            log.exception("Could not load persisted reminders")
+        while True:
+            now = epoch_ms()
+            due: List[Tuple[str, int, int]] = []
+            while self._heap and self._heap[0][0] <= now and len(due) < self.batch_size:
+                due_ms, seq, user_number = heapq.heappop(self._heap)
+                if self._users.get(user_number) == seq:
+                    due.append((user_number, due_ms, seq))
+
+            if due or (self._dirty and time.monotonic() - self._last_flush >= self.flush_seconds):
+                try:
+                    await self._process(due)
+                except Exception:
+                    log.exception("Reminder batch failed (%d due)", len(due))
+                if due:
+                    continue
+
+            self._wake.clear()
+            timeout = (self._heap[0][0] - now) / 1000 if self._heap else None
+            if self._dirty:
+                flush_in = max(0.0, self._last_flush + self.flush_seconds - time.monotonic())
+                timeout = flush_in if timeout is None else min(timeout, flush_in)
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _load(self):
+        rows = await run_db(db.load_reminders)
+        for user_number, due_ms in rows:
+            if user_number not in self._dirty:   # changed here since startup; that wins
+                self._arm(user_number, due_ms)
+        self.stats["loaded"] += len(rows)
+        log.info("Loaded %d pending reminders", len(rows))
+
+    async def _process(self, due: List[Tuple[str, int, int]]):
+        """Flush pending changes, claim the due batch, then send what was claimed."""
+        next_due_ms = epoch_ms() + self.interval_ms
+        changes = self._take_dirty()
+        try:
+            claimed = await run_db(self._flush_and_claim, changes,
+                                   [(user_number, due_ms) for user_number, due_ms, _ in due], next_due_ms)
+        except Exception:
+            # keep everything for the next attempt; newer changes made meanwhile win
+            for user_number, change in changes.items():
+                self._dirty.setdefault(user_number, change)
+            retry_ms = epoch_ms() + int(self.flush_seconds * 1000)
+            for user_number, due_ms, seq in due:
+                if self._users.get(user_number) == seq:
+                    self._arm(user_number, retry_ms)
+            raise
+        sent_count = dict(claimed)
+        self.stats["claimed"] += len(claimed)
+        self.stats["lost_claims"] += len(due) - len(claimed)
+
+        users = []
+        for user_number, _, seq in due:
+            if self._users.get(user_number) != seq:
+                continue   # rescheduled or cancelled while claiming
+            sent = sent_count.get(user_number)
+            if sent is None:
+                del self._users[user_number]   # cancelled or sent by another process
+            elif sent >= self.max_per_user:
+                del self._users[user_number]
+                self.stats["capped"] += 1
+                users.append(user_number)
+            else:
+                self._arm(user_number, next_due_ms)
+                users.append(user_number)
+        if not users:
+            return
+
+        texts = await run_db(self._compose, users)
+        self._outbox.update(users)
+        for user_number, text in zip(users, texts):
+            await self._take_token()
+            if user_number not in self._outbox:
+                self.stats["skipped_active"] += 1   # wrote to us while waiting for the rate limit
+                continue
+            self._outbox.discard(user_number)
+            self._spawn(self._send_one(user_number, text))
+
+    def _flush_and_claim(self, changes, due: List[Tuple[str, int]], next_due_ms: int) -> List[Tuple[str, int]]:
+        """Blocking: write pending changes first so the claim sees them."""
+        self._flush(changes)
+        if not due:
+            return []
+        return db.claim_due_reminders(due, next_due_ms, self.max_per_user)
+
+    def _flush(self, changes: Dict[str, Optional[Tuple[int, int]]]):
+        if not changes:
+            return
+        upserts = [(u, c[0], c[1]) for u, c in changes.items() if c is not None]
+        deletes = [u for u, c in changes.items() if c is None]
+        db.write_reminders(upserts, deletes)
+        self.stats["flushes"] += 1
+        self.stats["rows_written"] += len(changes)
+
+    def _compose(self, users: List[str]) -> List[str]:
+        """Blocking: each user's reminder, mentioning their last video."""
+        return [reminder_text(self.job_store.get_last_job_for_user(u)) for u in users]
+
+    async def _send_one(self, user_number: str, text: str):
+        try:
+            await self.send(user_number, text)
+            self.stats["sent"] += 1
+        except Exception as e:
+            self.stats["failed"] += 1
+            log.warning("Reminder to %s failed: %s", user_number, e)
+
+    # ---- Helpers ----
+    def _arm(self, user_number: str, due_ms: int):
+        seq = next(self._seq)
+        self._users[user_number] = seq
+        heapq.heappush(self._heap, (due_ms, seq, user_number))
+        if self._wake is not None and self._heap[0][1] == seq:
+            self._wake.set()  # new earliest deadline; re-plan the sleep
+
+    def _take_dirty(self) -> Dict[str, Optional[Tuple[int, int]]]:
+        changes, self._dirty = self._dirty, {}
+        self._last_flush = time.monotonic()
+        return changes
+
+    def _maybe_compact(self):
+        """Drop superseded heap entries (left behind by cancel and reschedule) once they dominate."""
+        if len(self._heap) <= 2 * len(self._users) + COMPACT_MIN_STALE:
+            return
+        self._heap = [e for e in self._heap if self._users.get(e[2]) == e[1]]
+        heapq.heapify(self._heap)
+        self.stats["compactions"] += 1
+
+    async def _take_token(self):
+        if self.send_rate <= 0:
+            return
+        while True:
+            now = time.monotonic()
+            self._tokens = min(max(1.0, self.send_rate), self._tokens + (now - self._refilled) * self.send_rate)
+            self._refilled = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.send_rate)
+
+    def _spawn(self, coro: Awaitable[None]):
+        task = asyncio.ensure_future(coro)
+        self._handlers.add(task)
+        task.add_done_callback(self._handlers.discard)
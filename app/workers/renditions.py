@@ -0,0 +1,81 @@
+# app/workers/renditions.py
+"""
+Renditions of a job's stored (WhatsApp-sized) video: a low-res preview and a poster
+frame, kept in the blob store next to it and listed by /status/{job_id} so clients can
+show the poster at once and pick the smallest suitable file. Built at background
+priority after delivery, once per distinct video (jobs sharing a video share them).
+"""
+
+import os
+import asyncio
+import logging
+from typing import List
+
+from app import db
+from app.services.blob_store import BlobRef, BlobStore
+from app.storage import run_db
+from app.workers.transcoder import PRIORITY_BACKGROUND, TranscodeError, Transcoder
+from app.workers.video_utils import EncodeError, poster_args, preview_args, scaled_size
+
+log = logging.getLogger("workers.renditions")
+
+# ---- Configuration (from env) ----
+RENDITIONS_ENABLED = os.getenv("RENDITIONS_ENABLED", "true").lower() in ("1", "true", "yes")
+PREVIEW_HEIGHT = int(os.getenv("RENDITION_PREVIEW_HEIGHT", "240"))
+PREVIEW_VIDEO_KBPS = int(os.getenv("RENDITION_PREVIEW_KBPS", "250"))
+POSTER_WIDTH = int(os.getenv("RENDITION_POSTER_WIDTH", "640"))
+POSTER_FORMAT = os.getenv("RENDITION_POSTER_FORMAT", "jpeg").lower()   # jpeg | webp (needs libwebp)
+
+PREVIEW_AUDIO_KBPS = 48
+POSTER_AT_SECONDS = 1.0
+POSTER_TYPES = {"jpeg": ("image/jpeg", ".jpg"), "webp": ("image/webp", ".webp")}
+
+KINDS = ("whatsapp", "preview", "poster")
+
+
+async def build_renditions(job_id: str, source: BlobRef, transcoder: Transcoder, blob_store: BlobStore,
+                           priority: int = PRIORITY_BACKGROUND) -> List[str]:
+    """Create whichever renditions the video source is still missing; returns the kinds made."""
+    have = await run_db(db.get_renditions, source.digest)
+    missing = [kind for kind in KINDS if kind not in have]
+    if not missing:
+        return []
+    try:
+        info = await transcoder.probe(source.path)
+    except (TranscodeError, EncodeError) as e:
+        log.warning("Cannot probe %s for renditions of job=%s: %s", source.digest, job_id, e)
+        return []
+
+    made = []
+    for kind in missing:
+        scratch = None
+        try:
+            if kind == "whatsapp":
+                # the delivered file itself, listed so clients see its dimensions
+                await run_db(db.link_rendition, source.digest, kind, source.digest, source.size_bytes,
+                             "video/mp4", info.width, info.height)
+            elif kind == "preview":
+                if info.height and info.height <= PREVIEW_HEIGHT:
+                    continue   # the WhatsApp file is already preview-sized
+                width, height = scaled_size(info, height=PREVIEW_HEIGHT)
+                scratch = blob_store.scratch_path(f"{job_id}.preview.mp4")
+                audio = PREVIEW_AUDIO_KBPS if info.has_audio else 0
+                await transcoder.run(preview_args(source.path, scratch, height, PREVIEW_VIDEO_KBPS, audio),
+                                     f"{job_id}:preview", priority)
+                await asyncio.to_thread(blob_store.ingest_rendition, source.digest, kind, scratch,
+                                        "video/mp4", width, height)
+            else:
+                mime, ext = POSTER_TYPES.get(POSTER_FORMAT, POSTER_TYPES["jpeg"])
+                width, height = scaled_size(info, width=min(POSTER_WIDTH, info.width or POSTER_WIDTH))
+                scratch = blob_store.scratch_path(f"{job_id}.poster{ext}")
+                at = min(POSTER_AT_SECONDS, info.duration_s / 2)
+                await transcoder.run(poster_args(source.path, scratch, at, width), f"{job_id}:poster", priority)
+                await asyncio.to_thread(blob_store.ingest_rendition, source.digest, kind, scratch, mime, width, height)
+            made.append(kind)
+        except (TranscodeError, OSError) as e:
+            log.warning("Could not build %s rendition for job=%s: %s", kind, job_id, e)
+            if scratch and os.path.exists(scratch):
+                os.remove(scratch)
+    if made:
+        log.info("Renditions for job=%s: %s", job_id, ", ".join(made))
+    return made
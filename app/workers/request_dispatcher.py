@@ -0,0 +1,156 @@
+# app/workers/request_dispatcher.py
+
+import os
+import socket
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Optional, Set
+
+from app.services.requests import RequestQueue, RequestRecord
+from app.storage import run_db
+
+log = logging.getLogger("workers.dispatcher")
+
+# ---- Configuration (from env) ----
+DISPATCH_CONCURRENCY = int(os.getenv("DISPATCH_CONCURRENCY", "4"))
+DISPATCH_BATCH_SIZE = int(os.getenv("DISPATCH_BATCH_SIZE", "8"))
+DISPATCH_POLL_INTERVAL = float(os.getenv("DISPATCH_POLL_INTERVAL", "5"))   # fallback for other processes' enqueues
+DISPATCH_STALE_CLAIM_SECONDS = int(os.getenv("DISPATCH_STALE_CLAIM_SECONDS", "300"))   # claims heartbeat at a third of this
+
+RequestHandler = Callable[[RequestRecord], Awaitable[None]]
+
+
+class RequestDispatcher:
+    """
+    Drains the request queue with up to `concurrency` submissions in flight.
+
+    Wakes immediately when this process enqueues (RequestQueue listener), and otherwise
+    polls every `poll_interval` seconds to pick up rows written by other processes. Rows
+    are claimed in batches with an atomic UPDATE, so several dispatchers can share one
+    requests.db without double-dispatching. While a request is being handled its claim is
+    refreshed every stale_claim_seconds / 3, so only the claims of a dead worker go stale
+    and get re-queued, however long the optimize and submit take.
+    """
+
+    def __init__(
+        self,
+        queue: RequestQueue,
+        handler: RequestHandler,
+        concurrency: int = DISPATCH_CONCURRENCY,
+        batch_size: int = DISPATCH_BATCH_SIZE,
+        poll_interval: float = DISPATCH_POLL_INTERVAL,
+        stale_claim_seconds: int = DISPATCH_STALE_CLAIM_SECONDS,
+    ):
+        self.queue = queue
+        self.handler = handler
+        self.concurrency = max(1, concurrency)
+        self.batch_size = max(1, batch_size)
+        self.poll_interval = poll_interval
+        self.stale_claim_seconds = stale_claim_seconds
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{id(self):x}"
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self._active: Set[asyncio.Task] = set()
+        self._claims: Set[int] = set()   # ids of the requests being handled here
+        self.stats: Dict[str, int] = {"claimed": 0, "succeeded": 0, "failed": 0, "wakeups": 0, "requeued": 0,
+                                      "heartbeats": 0}
+
+        queue.add_listener(self.wake)
+
+    def wake(self):
+        """Thread-safe nudge: there may be new work in the queue."""
+        if self._loop is not None and self._wake is not None:
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._loop = asyncio.get_running_loop()
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self.run())
+            self._heartbeat_task = asyncio.create_task(self._heartbeat())
+
+    async def stop(self):
+        for task in (self._task, self._heartbeat_task):
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._task = self._heartbeat_task = None
+
+    def snapshot(self) -> Dict[str, int]:
+        return {**self.stats, "active": len(self._active), "concurrency": self.concurrency}
+
+    async def run(self):
+        while True:
+            self._wake.clear()
+            free = self.concurrency - len(self._active)
+            claimed = 0
+            if free > 0:
+                want = min(free, self.batch_size)
+                try:
+                    reqs = await run_db(self.queue.claim, self.worker_id, want)
+                except Exception:
+                    log.exception("Claiming queued requests failed")
+                    reqs = []
+                claimed = len(reqs)
+                self.stats["claimed"] += claimed
+                for req in reqs:
+                    task = asyncio.create_task(self._handle(req))
+                    self._active.add(task)
+                    task.add_done_callback(self._done)
+                if claimed and claimed == want:
+                    continue  # queue may hold more; claim again while there's capacity
+
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+                self.stats["wakeups"] += 1
+            except asyncio.TimeoutError:
+                await self._requeue_stale()
+
+    async def _handle(self, req: RequestRecord):
+        self._claims.add(req.id)
+        try:
+            await self.handler(req)
+            self.stats["succeeded"] += 1
+        except Exception as e:
+            self.stats["failed"] += 1
+            log.error(f"Queue processing failed for request {req.id}: {e}")
+            try:
+                await run_db(self.queue.mark_done, req.id, False)
+            except Exception:
+                log.exception("Could not mark request %s failed", req.id)
+        finally:
+            self._claims.discard(req.id)
+
+    def _done(self, task: asyncio.Task):
+        self._active.discard(task)
+        if self._wake is not None:
+            self._wake.set()  # a slot freed up
+
+    async def _heartbeat(self):
+        """Refresh the claims in flight here (rows already marked processing no longer need it)."""
+        while True:
+            await asyncio.sleep(max(1.0, self.stale_claim_seconds / 3))
+            claims = set(self._claims)
+            if not claims:
+                continue
+            try:
+                await run_db(self.queue.heartbeat, self.worker_id, claims)
+                self.stats["heartbeats"] += 1
+            except Exception:
+                log.exception("Refreshing %d request claims failed", len(claims))
+
+    async def _requeue_stale(self):
+        try:
+            n = await run_db(self.queue.requeue_stale, self.stale_claim_seconds)
+        except Exception:
+            log.exception("Re-queueing stale claims failed")
+            return
+        if n:
+            self.stats["requeued"] += n
+            log.warning("Re-queued %d stale request claims", n)
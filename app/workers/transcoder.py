@@ -0,0 +1,314 @@
+# app/workers/transcoder.py
+"""
+Async transcoding: ffmpeg runs as a child process (asyncio.create_subprocess_exec) so an
+encode never blocks the event loop. Jobs wait in one priority queue and at most
+TRANSCODE_WORKERS encodes run at once (default: one per core). Each run has a timeout,
+and cancelling the awaiting caller kills the process (or drops the job if still queued).
+Progress comes from ffmpeg's -progress output.
+"""
+
+import os
+import re
+import time
+import shutil
+import asyncio
+import tempfile
+import logging
+import itertools
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Optional
+
+from app.workers.video_utils import (
+    ENCODE_MAX_ATTEMPTS, ENCODE_MODE, ENCODE_PRESET, FFMPEG_BIN, FFPROBE_BIN, MB, WHATSAPP_MAX_MB,
+    EncodeError, EncodeResult, VideoInfo, encode_args, is_faststart, next_scale, parse_probe, plan_encode,
+    probe_args, remux_args,
+)
+
+log = logging.getLogger("workers.transcoder")
+
+# ---- Configuration (from env) ----
+TRANSCODE_WORKERS = int(os.getenv("TRANSCODE_WORKERS", "0")) or (os.cpu_count() or 1)
+TRANSCODE_TIMEOUT_SECONDS = float(os.getenv("TRANSCODE_TIMEOUT_SECONDS", "300"))
+PROBE_TIMEOUT_SECONDS = 30
+
+# lower runs first
+PRIORITY_USER = 0          # someone is waiting for this video
+PRIORITY_BACKGROUND = 10   # backfills, re-encodes, renditions nobody asked for yet
+
+_DURATION_RE = re.compile(r"Duration:\s*(\d+):(\d+):(\d+(?:\.\d+)?)")
+_STDERR_TAIL = 20
+
+
+class TranscodeError(RuntimeError):
+    pass
+
+
+@dataclass
+class TranscodeJob:
+    job_id: str
+    args: List[str]
+    priority: int
+    timeout: float
+    future: "asyncio.Future[None]"
+    submitted: float
+    started: Optional[float] = None
+    duration_s: Optional[float] = None     # input duration, once ffmpeg has printed it
+    out_time_s: float = 0.0                # how far the encode has got
+    proc: Optional[asyncio.subprocess.Process] = None
+    stderr_tail: Deque[str] = field(default_factory=lambda: deque(maxlen=_STDERR_TAIL))
+
+    @property
+    def progress(self) -> Optional[float]:
+        if not self.duration_s:
+            return None
+        return min(1.0, self.out_time_s / self.duration_s)
+
+
+class Transcoder:
+    """Bounded pool of ffmpeg processes fed by a priority queue."""
+
+    def __init__(self, workers: int = TRANSCODE_WORKERS, ffmpeg: str = FFMPEG_BIN,
+                 timeout: float = TRANSCODE_TIMEOUT_SECONDS, ffprobe: str = FFPROBE_BIN):
+        self.workers = max(1, workers)
+        self.ffmpeg = ffmpeg
+        self.ffprobe = ffprobe
+        self.timeout = timeout
+        self._queue: Optional["asyncio.PriorityQueue"] = None
+        self._tasks: List[asyncio.Task] = []
+        self._seq = itertools.count()
+        self._pending = 0
+        self._active: Dict[str, TranscodeJob] = {}
+        self._wait_times: Deque[float] = deque(maxlen=512)
+        self._run_times: Deque[float] = deque(maxlen=512)
+        self.stats: Dict[str, int] = {
+            "submitted": 0, "completed": 0, "failed": 0,
+            "timeouts": 0, "cancelled": 0, "copied": 0, "remuxed": 0,
+            "encoded": 0, "retries": 0, "oversized": 0,
+        }
+
+    def start(self):
+        if not self._tasks:
+            self._queue = asyncio.PriorityQueue()
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._queue is not None:
+            while not self._queue.empty():
+                _, _, job = self._queue.get_nowait()
+                if not job.future.done():
+                    job.future.set_exception(TranscodeError("transcoder stopped"))
+        self._pending = 0
+
+    # ---- Public API ----
+    async def run(self, args: List[str], job_id: str, priority: int = PRIORITY_USER,
+                  timeout: Optional[float] = None):
+        """Run ffmpeg with args (no binary) and wait for it; raises TranscodeError on failure."""
+        self.start()
+        loop = asyncio.get_running_loop()
+        job = TranscodeJob(job_id, args, priority, timeout or self.timeout, loop.create_future(), loop.time())
+        job.future.add_done_callback(lambda fut: self._on_done(job))
+        self.stats["submitted"] += 1
+        self._pending += 1
+        self._queue.put_nowait((priority, next(self._seq), job))
+        # cancelling the caller cancels job.future: dropped if queued, killed if running
+        await job.future
+
+    async def probe(self, path: str) -> VideoInfo:
+        """ffprobe the file (not queued: it only reads the headers)."""
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                self.ffprobe, *probe_args(path),
+                stdin=asyncio.subprocess.DEVNULL, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+            )
+        except OSError as e:
+            raise TranscodeError(f"cannot run {self.ffprobe}: {e}")
+        try:
+            out, err = await asyncio.wait_for(proc.communicate(), PROBE_TIMEOUT_SECONDS)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            proc.kill()
+            await asyncio.shield(proc.wait())
+            raise
+        if proc.returncode != 0:
+            raise TranscodeError(f"ffprobe exited with {proc.returncode}: {err.decode('utf-8', 'replace').strip()}")
+        return parse_probe(out)
+
+    async def downscale(self, input_path: str, output_path: str, max_size_mb: int = WHATSAPP_MAX_MB,
+                        priority: int = PRIORITY_USER, job_id: Optional[str] = None,
+                        mode: str = ENCODE_MODE, preset: str = ENCODE_PRESET) -> EncodeResult:
+        """
+        Async encode_to_size(): a +faststart MP4 of at most max_size_mb at output_path.
+        Small files are remuxed (or copied if already faststart); larger ones are probed,
+        encoded to the size budget and re-encoded smaller while they overshoot.
+        """
+        if not os.path.exists(input_path):
+            raise FileNotFoundError(f"Input video not found: {input_path}")
+        max_bytes = int(max_size_mb * MB)
+        job_id = job_id or os.path.basename(output_path)
+        size = os.path.getsize(input_path)
+        try:
+            if size <= max_bytes:
+                if not await asyncio.to_thread(is_faststart, input_path):
+                    try:
+                        await self.run(remux_args(input_path, output_path), job_id, priority)
+                        self.stats["remuxed"] += 1
+                        return EncodeResult(output_path, os.path.getsize(output_path), 0)
+                    except TranscodeError as e:
+                        log.warning("Faststart remux of %s failed (%s); copying as is", input_path, e)
+                await asyncio.to_thread(shutil.copy, input_path, output_path)
+                self.stats["copied"] += 1
+                return EncodeResult(output_path, size, 0)
+
+            info = await self.probe(input_path)
+            scale = 1.0
+            with tempfile.TemporaryDirectory() as tmp:
+                for attempt in range(1, ENCODE_MAX_ATTEMPTS + 1):
+                    try:
+                        plan = plan_encode(info, max_bytes, mode, preset, scale)
+                    except EncodeError:
+                        self.stats["oversized"] += 1   # too long to fit at a watchable bitrate
+                        raise
+                    for args in encode_args(input_path, output_path, plan, os.path.join(tmp, "pass")):
+                        await self.run(args, job_id, priority)
+                    out = os.path.getsize(output_path)
+                    if out <= max_bytes:
+                        self.stats["encoded"] += 1
+                        return EncodeResult(output_path, out, attempt, plan)
+                    log.info("Encode of %s came out at %d bytes (limit %d); retrying smaller", job_id, out, max_bytes)
+                    self.stats["retries"] += 1
+                    scale = next_scale(scale, out, max_bytes)
+            self.stats["oversized"] += 1
+            raise TranscodeError(f"still over {max_size_mb} MB after {ENCODE_MAX_ATTEMPTS} attempts")
+        except BaseException:
+            if os.path.exists(output_path):
+                os.remove(output_path)   # don't leave a truncated or oversized encode behind
+            raise
+
+    def snapshot(self) -> Dict[str, Any]:
+        def pct(values: Deque[float], p: float) -> Optional[float]:
+            samples = sorted(values)
+            if not samples:
+                return None
+            return round(samples[min(len(samples) - 1, int(p * len(samples)))] * 1000, 1)
+
+        return {
+            **self.stats,
+            "workers": self.workers,
+            "queued": self._pending,
+            "active": {
+                job_id: {"progress": round(job.progress, 3) if job.progress is not None else None,
+                         "priority": job.priority}
+                for job_id, job in self._active.items()
+            },
+            "queue_wait_ms": {"p50": pct(self._wait_times, 0.50), "p95": pct(self._wait_times, 0.95)},
+            "run_ms": {"p50": pct(self._run_times, 0.50), "p95": pct(self._run_times, 0.95)},
+        }
+
+    # ---- Workers ----
+    def _on_done(self, job: TranscodeJob):
+        if job.started is None:
+            self._pending -= 1   # finished (cancelled/failed) without ever running
+        if job.future.cancelled():
+            self.stats["cancelled"] += 1
+            if job.proc is not None and job.proc.returncode is None:
+                job.proc.kill()
+
+    async def _worker(self):
+        while True:
+            _, _, job = await self._queue.get()
+            if job.future.done():
+                continue   # cancelled while queued
+            try:
+                await self._execute(job)
+            except asyncio.CancelledError:
+                if not job.future.done():
+                    job.future.set_exception(TranscodeError("transcoder stopped"))
+                raise
+            except Exception as e:
+                log.exception("Transcode of %s crashed", job.job_id)
+                if not job.future.done():
+                    job.future.set_exception(TranscodeError(str(e)))
+
+    async def _execute(self, job: TranscodeJob):
+        loop = asyncio.get_running_loop()
+        job.started = loop.time()
+        self._pending -= 1
+        self._wait_times.append(job.started - job.submitted)
+        self._active[job.job_id] = job
+        t0 = time.perf_counter()
+        try:
+            try:
+                job.proc = await asyncio.create_subprocess_exec(
+                    self.ffmpeg, "-hide_banner", "-nostats", "-progress", "pipe:1", *job.args,
+                    stdin=asyncio.subprocess.DEVNULL,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE,
+                )
+            except OSError as e:
+                self.stats["failed"] += 1
+                job.future.set_exception(TranscodeError(f"cannot run {self.ffmpeg}: {e}"))
+                return
+            proc = job.proc
+            if job.future.done():
+                proc.kill()   # cancelled while the process was starting
+
+            try:
+                await asyncio.wait_for(
+                    asyncio.gather(self._read_progress(job, proc.stdout), self._read_stderr(job, proc.stderr), proc.wait()),
+                    job.timeout,
+                )
+            except asyncio.TimeoutError:
+                if proc.returncode is None:
+                    proc.kill()
+                await proc.wait()
+                self.stats["timeouts"] += 1
+                log.warning("Transcode of %s timed out after %gs", job.job_id, job.timeout)
+                if not job.future.done():
+                    job.future.set_exception(TranscodeError(f"timed out after {job.timeout:g}s"))
+                return
+            except asyncio.CancelledError:
+                if proc.returncode is None:
+                    proc.kill()
+                    await asyncio.shield(proc.wait())
+                raise
+
+            if job.future.done():
+                return   # cancelled: the process was killed by _on_done
+            if proc.returncode == 0:
+                self.stats["completed"] += 1
+                job.future.set_result(None)
+            else:
+                self.stats["failed"] += 1
+                detail = " | ".join(job.stderr_tail) or "no output"
+                log.warning("Transcode of %s failed (exit %s): %s", job.job_id, proc.returncode, detail)
+                job.future.set_exception(TranscodeError(f"ffmpeg exited with {proc.returncode}: {detail}"))
+        finally:
+            self._active.pop(job.job_id, None)
+            self._run_times.append(time.perf_counter() - t0)
+
+    @staticmethod
+    async def _read_progress(job: TranscodeJob, stream: asyncio.StreamReader):
+        async for raw in stream:
+            key, _, value = raw.decode("utf-8", "replace").strip().partition("=")
+            if key in ("out_time_us", "out_time_ms"):   # both are microseconds
+                try:
+                    job.out_time_s = int(value) / 1_000_000
+                except ValueError:
+                    pass
+
+    @staticmethod
+    async def _read_stderr(job: TranscodeJob, stream: asyncio.StreamReader):
+        async for raw in stream:
+            line = raw.decode("utf-8", "replace").strip()
+            if not line:
+                continue
+            if job.duration_s is None:
+                m = _DURATION_RE.search(line)
+                if m:
+                    h, mi, s = m.groups()
+                    job.duration_s = int(h) * 3600 + int(mi) * 60 + float(s)
+            job.stderr_tail.append(line)
@@ -1,36 +1,254 @@
 # app/workers/video_utils.py
+"""
+Size-targeted H.264 encoding for WhatsApp: probe the clip with ffprobe, pick the
+bitrate (and a resolution from a small ladder) that lands under the size limit,
+encode two-pass or CRF-with-a-cap, check the result and retry smaller if needed.
+Outputs are always +faststart so playback can begin before the download ends.
+The helpers build argument lists only; the blocking runner is encode_to_size(), the
+async one Transcoder.downscale (app/workers/transcoder.py).
+"""
 
 import os
-import subprocess
+import json
 import shutil
+import struct
+import logging
+import tempfile
+import subprocess
+from dataclasses import dataclass
+from typing import List, Optional
+
+log = logging.getLogger("workers.video_utils")
+
+# ---- Configuration (from env) ----
+FFMPEG_BIN = os.getenv("FFMPEG_BIN", "ffmpeg")
+FFPROBE_BIN = os.getenv("FFPROBE_BIN", "ffprobe")
+ENCODE_MODE = os.getenv("ENCODE_MODE", "twopass").lower()          # twopass | crf
+ENCODE_PRESET = os.getenv("ENCODE_PRESET", "veryfast")
+ENCODE_CRF = int(os.getenv("ENCODE_CRF", "23"))
+ENCODE_AUDIO_KBPS = int(os.getenv("ENCODE_AUDIO_KBPS", "96"))
+ENCODE_MAX_VIDEO_KBPS = int(os.getenv("ENCODE_MAX_VIDEO_KBPS", "4000"))   # no point going higher for a phone
+ENCODE_MAX_ATTEMPTS = int(os.getenv("ENCODE_MAX_ATTEMPTS", "3"))
+
+WHATSAPP_MAX_MB = 16
+MB = 1000 * 1000             # media limits are decimal megabytes
+MUX_OVERHEAD = 0.03          # share of the file spent on container/headers
+MIN_VIDEO_KBPS = 150         # below this the clip is dropped rather than sent unwatchable
+LOW_AUDIO_KBPS = 48          # when the budget is too tight for ENCODE_AUDIO_KBPS; none when tighter still
+
+# (output height, minimum video kbps to use it); the first one the budget affords wins
+HEIGHT_LADDER = ((720, 2500), (540, 1500), (480, 900), (360, 500), (240, 0))
+
+
+class EncodeError(RuntimeError):
+    pass
+
+
+@dataclass
+class VideoInfo:
+    duration_s: float
+    width: int
+    height: int
+    bit_rate: Optional[int]
+    has_audio: bool
+
+
+@dataclass
+class EncodePlan:
+    mode: str
+    preset: str
+    video_kbps: int
+    audio_kbps: int      # 0: no audio track
+    height: int
+
+
+@dataclass
+class EncodeResult:
+    path: str
+    size_bytes: int
+    attempts: int        # 0: copied or remuxed without re-encoding
+    plan: Optional[EncodePlan] = None
 
-def downscale_video(input_path: str, output_path: str, max_size_mb: int = 16) -> str:
+
+def probe_args(path: str) -> List[str]:
+    return ["-v", "error", "-print_format", "json", "-show_format", "-show_streams", path]
+
+
+def parse_probe(output: bytes) -> VideoInfo:
+    data = json.loads(output or b"{}")
+    streams = data.get("streams") or []
+    video = next((s for s in streams if s.get("codec_type") == "video"), None)
+    if video is None:
+        raise EncodeError("no video stream")
+    fmt = data.get("format") or {}
+    duration = float(fmt.get("duration") or video.get("duration") or 0)
+    if duration <= 0:
+        raise EncodeError("unknown duration")
+    bit_rate = fmt.get("bit_rate")
+    return VideoInfo(
+        duration_s=duration,
+        width=int(video.get("width") or 0),
+        height=int(video.get("height") or 0),
+        bit_rate=int(bit_rate) if bit_rate else None,
+        has_audio=any(s.get("codec_type") == "audio" for s in streams),
+    )
+
+
+def probe_video(path: str) -> VideoInfo:
+    """Blocking ffprobe."""
+    out = subprocess.run([FFPROBE_BIN, *probe_args(path)], check=True, capture_output=True).stdout
+    return parse_probe(out)
+
+
+def is_faststart(path: str) -> bool:
+    """True when the MP4's moov atom comes before mdat (reads only the top-level box headers)."""
+    try:
+        with open(path, "rb") as f:
+            while True:
+                header = f.read(8)
+                if len(header) < 8:
+                    return False
+                size, kind = struct.unpack(">I4s", header)
+                if kind == b"moov":
+                    return True
+                if kind == b"mdat":
+                    return False
+                if size == 1:
+                    size = struct.unpack(">Q", f.read(8))[0]
+                    f.seek(size - 16, os.SEEK_CUR)
+                elif size == 0:
+                    return False
+                else:
+                    f.seek(size - 8, os.SEEK_CUR)
+    except (OSError, struct.error):
+        return False
+
+
+def plan_encode(info: VideoInfo, max_bytes: int, mode: str = ENCODE_MODE, preset: str = ENCODE_PRESET,
+                scale: float = 1.0) -> EncodePlan:
     """
-    Downscale/compress a video to fit within WhatsApp's 16MB limit using ffmpeg.
-    Returns the path to the output file.
+    Bitrates and height that fit info's duration into max_bytes (scale < 1 after an oversized
+    try). The plan never exceeds the budget, so each retry really is smaller: audio is cut
+    back, then dropped, and a budget that leaves the video under MIN_VIDEO_KBPS raises
+    EncodeError before any encoding time is spent.
     """
-    if not os.path.exists(input_path):
-        raise FileNotFoundError(f"Input video not found: {input_path}")
+    total_kbps = max_bytes * 8 * (1 - MUX_OVERHEAD) * scale / info.duration_s / 1000
+    audio = ENCODE_AUDIO_KBPS if info.has_audio else 0
+    if audio and total_kbps - audio < MIN_VIDEO_KBPS * 2:
+        audio = LOW_AUDIO_KBPS
+    if audio and total_kbps - audio < MIN_VIDEO_KBPS:
+        audio = 0
+    if total_kbps < MIN_VIDEO_KBPS:
+        raise EncodeError(f"{info.duration_s:.0f}s leaves {total_kbps:.0f} kbps in {max_bytes} bytes; "
+                          f"the floor is {MIN_VIDEO_KBPS} kbps")
+    video = int(min(total_kbps - audio, ENCODE_MAX_VIDEO_KBPS))
+    height = next(h for h, min_kbps in HEIGHT_LADDER if video >= min_kbps)
+    if info.height:
+        height = min(height, info.height - info.height % 2)   # never upscale
+    return EncodePlan(mode, preset, video, audio, height)
 
-    # If already under limit, just copy
-    size_mb = os.path.getsize(input_path) / (1024 * 1024)
-    if size_mb <= max_size_mb:
-        shutil.copy(input_path, output_path)
-        return output_path
-
-    # Run ffmpeg to compress
-    cmd = [
-        "ffmpeg",
-        "-y",  # overwrite
-        "-i", input_path,
-        "-vf", "scale=-2:480",  # scale height to 480px, keep aspect
-        "-b:v", "800k",
-        "-bufsize", "800k",
-        "-maxrate", "800k",
-        "-c:a", "aac",
-        "-b:a", "96k",
+
+def remux_args(input_path: str, output_path: str) -> List[str]:
+    """Copy the streams as they are, moving the moov atom to the front."""
+    return ["-y", "-i", input_path, "-c", "copy", "-movflags", "+faststart", output_path]
+
+
+def encode_args(input_path: str, output_path: str, plan: EncodePlan, passlog: str) -> List[List[str]]:
+    """ffmpeg argument lists (without the binary) to run in order for this plan."""
+    video = [
+        "-y", "-i", input_path,
+        "-vf", f"scale=-2:{plan.height}",
+        "-c:v", "libx264", "-preset", plan.preset, "-profile:v", "main", "-pix_fmt", "yuv420p",
+    ]
+    cap = ["-maxrate", f"{plan.video_kbps}k", "-bufsize", f"{plan.video_kbps * 2}k"]
+    audio = ["-c:a", "aac", "-b:a", f"{plan.audio_kbps}k"] if plan.audio_kbps else ["-an"]
+    final = ["-movflags", "+faststart", output_path]
+
+    if plan.mode == "crf":
+        return [video + ["-crf", str(ENCODE_CRF)] + cap + audio + final]
+    target = ["-b:v", f"{plan.video_kbps}k", "-passlogfile", passlog]
+    return [
+        video + target + ["-pass", "1", "-an", "-f", "null", os.devnull],
+        video + target + ["-pass", "2"] + audio + final,
+    ]
+
+
+def preview_args(input_path: str, output_path: str, height: int, video_kbps: int, audio_kbps: int) -> List[str]:
+    """Small single-pass +faststart preview."""
+    audio = ["-c:a", "aac", "-b:a", f"{audio_kbps}k"] if audio_kbps else ["-an"]
+    return [
+        "-y", "-i", input_path,
+        "-vf", f"scale=-2:{height}",
+        "-c:v", "libx264", "-preset", "veryfast", "-profile:v", "main", "-pix_fmt", "yuv420p",
+        "-b:v", f"{video_kbps}k", "-maxrate", f"{video_kbps}k", "-bufsize", f"{video_kbps * 2}k",
+        *audio, "-movflags", "+faststart", output_path,
+    ]
+
+
+def poster_args(input_path: str, output_path: str, at_seconds: float, width: int) -> List[str]:
+    """One frame at at_seconds, scaled to width (format from output_path's extension)."""
+    return [
+        "-y", "-ss", f"{at_seconds:.2f}", "-i", input_path,
+        "-frames:v", "1", "-vf", f"scale={width}:-2", "-q:v", "4",
         output_path,
     ]
-    subprocess.run(cmd, check=True)
 
-    return output_path
+
+def scaled_size(info: VideoInfo, width: Optional[int] = None, height: Optional[int] = None):
+    """(width, height) of info scaled to one side, keeping aspect and even dimensions like scale=-2."""
+    if not info.width or not info.height:
+        return width, height
+    if height is not None:
+        return int(round(info.width * height / info.height / 2)) * 2, height
+    return width, int(round(info.height * width / info.width / 2)) * 2
+
+
+def next_scale(scale: float, size_bytes: int, max_bytes: int) -> float:
+    """Bitrate scale for the next attempt after an output of size_bytes overshot max_bytes."""
+    return scale * max_bytes / size_bytes * 0.95
+
+
+def encode_to_size(input_path: str, output_path: str, max_bytes: int, mode: str = ENCODE_MODE,
+                   preset: str = ENCODE_PRESET) -> EncodeResult:
+    """Blocking: produce a +faststart MP4 of at most max_bytes at output_path."""
+    size = os.path.getsize(input_path)
+    if size <= max_bytes:
+        if not is_faststart(input_path):
+            try:
+                subprocess.run([FFMPEG_BIN, *remux_args(input_path, output_path)], check=True, capture_output=True)
+                return EncodeResult(output_path, os.path.getsize(output_path), 0)
+            except (OSError, subprocess.CalledProcessError) as e:
+                log.warning("Faststart remux of %s failed (%s); copying as is", input_path, e)
+        shutil.copy(input_path, output_path)
+        return EncodeResult(output_path, size, 0)
+
+    info = probe_video(input_path)
+    scale = 1.0
+    with tempfile.TemporaryDirectory() as tmp:
+        for attempt in range(1, ENCODE_MAX_ATTEMPTS + 1):
+            try:
+                plan = plan_encode(info, max_bytes, mode, preset, scale)
+            except EncodeError:
+                if os.path.exists(output_path):
+                    os.remove(output_path)   # the previous, oversized attempt
+                raise
+            for args in encode_args(input_path, output_path, plan, os.path.join(tmp, "pass")):
+                subprocess.run([FFMPEG_BIN, *args], check=True, capture_output=True)
+            out = os.path.getsize(output_path)
+            if out <= max_bytes:
+                return EncodeResult(output_path, out, attempt, plan)
+            log.info("Encode of %s came out at %d bytes (limit %d); retrying smaller", input_path, out, max_bytes)
+            scale = next_scale(scale, out, max_bytes)
+    os.remove(output_path)
+    raise EncodeError(f"still over {max_bytes} bytes after {ENCODE_MAX_ATTEMPTS} attempts")
+
+
+def downscale_video(input_path: str, output_path: str, max_size_mb: int = WHATSAPP_MAX_MB) -> str:
+    """
+    Downscale/compress a video to fit within WhatsApp's 16MB limit using ffmpeg.
+    Returns the path to the output file.
+    Blocking; from async code use Transcoder.downscale (app/workers/transcoder.py).
+    """
+    if not os.path.exists(input_path):
+        raise FileNotFoundError(f"Input video not found: {input_path}")
+    return encode_to_size(input_path, output_path, max_size_mb * MB).path
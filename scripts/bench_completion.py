@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# bench_completion.py
+"""
+Load-test the shared CompletionScheduler against the local MockProvider.
+Usage:
+  python scripts/bench_completion.py --jobs 5000 --latency 3 --jitter 1
+Compares provider status calls and completion lag with the old one-coroutine-per-job
+poller (fixed 1.5s interval). Pass --callbacks to complete jobs through notify() instead.
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.providers.mock import MockProvider
+from app.services.jobs import JobStore
+from app.services.video_generator import VideoGenerator
+from app.workers.completion_scheduler import CompletionScheduler
+
+
+def _summary(label, provider, lags, wall):
+    lags_ms = sorted(l * 1000 for l in lags)
+    p95 = lags_ms[int(0.95 * (len(lags_ms) - 1))] if lags_ms else 0
+    print(f"{label:<12} jobs={len(lags):<6} fetch_calls={provider.fetch_calls:<8} "
+          f"lag_avg={statistics.mean(lags_ms) if lags_ms else 0:7.0f}ms lag_p95={p95:7.0f}ms wall={wall:6.2f}s")
+
+
+async def run_scheduler(n: int, latency: float, jitter: float, callbacks: bool):
+    provider = MockProvider(latency=latency, jitter=jitter)
+    video_gen = VideoGenerator(provider, job_store=JobStore())
+    done = asyncio.Event()
+    lags = []
+
+    async def on_complete(job_id, user_number, pj):
+        lags.append(time.monotonic() - provider._ready_at[job_id])
+        if len(lags) == n:
+            done.set()
+
+    sched = CompletionScheduler(video_gen, on_complete=on_complete)
+    sched.start()
+    t0 = time.perf_counter()
+    ids = []
+    for i in range(n):
+        job = await video_gen.submit(f"bench prompt {i}", style="anime")
+        sched.track(job.job_id, f"whatsapp:+1{i:09d}")
+        ids.append(job.job_id)
+
+    if callbacks:
+        async def push():
+            pending = sorted(ids, key=provider._ready_at.get)
+            for job_id in pending:
+                await asyncio.sleep(max(0.0, provider._ready_at[job_id] - time.monotonic()))
+                sched.notify(provider.complete(job_id))
+        asyncio.create_task(push())
+
+    await done.wait()
+    wall = time.perf_counter() - t0
+    await sched.stop()
+    _summary("scheduler" + ("+cb" if callbacks else ""), provider, lags, wall)
+    print(f"             batches={sched.stats['batches']} checks={sched.stats['checks']} callbacks={sched.stats['callbacks']}")
+
+
+async def run_legacy(n: int, latency: float, jitter: float):
+    provider = MockProvider(latency=latency, jitter=jitter)
+    video_gen = VideoGenerator(provider, job_store=JobStore())
+    lags = []
+
+    async def poll(job_id):
+        for _ in range(60):
+            pj = await video_gen.fetch(job_id)
+            if pj.is_terminal:
+                lags.append(time.monotonic() - provider._ready_at[job_id])
+                return
+            await asyncio.sleep(1.5)
+
+    t0 = time.perf_counter()
+    jobs = [await video_gen.submit(f"bench prompt {i}", style="anime") for i in range(n)]
+    await asyncio.gather(*(poll(j.job_id) for j in jobs))
+    _summary("per-job", provider, lags, time.perf_counter() - t0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CompletionScheduler load test with MockProvider")
+    parser.add_argument("--jobs", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=3.0, help="mock generation seconds")
+    parser.add_argument("--jitter", type=float, default=1.0)
+    parser.add_argument("--callbacks", action="store_true", help="complete jobs via provider webhooks")
+    args = parser.parse_args()
+
+    asyncio.run(run_legacy(args.jobs, args.latency, args.jitter))
+    asyncio.run(run_scheduler(args.jobs, args.latency, args.jitter, callbacks=False))
+    if args.callbacks:
+        asyncio.run(run_scheduler(args.jobs, args.latency, args.jitter, callbacks=True))
+
+
+if __name__ == "__main__":
+    main()
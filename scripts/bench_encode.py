@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# bench_encode.py
+"""
+Encode time vs output size for the WhatsApp size-targeted encoder across x264 presets
+and rate-control modes (two-pass, CRF with a bitrate cap), next to the old fixed recipe
+(480p, 800k). Needs a real ffmpeg/ffprobe (FFMPEG_BIN / FFPROBE_BIN or --ffmpeg/--ffprobe).
+Without --input a noisy 720p test clip with audio is generated.
+Usage:
+  python scripts/bench_encode.py --seconds 40 --presets ultrafast,veryfast,medium --target-mb 16
+  python scripts/bench_encode.py --input provider_clip.mp4 --modes twopass
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+# the recipe downscale_video used before size targeting
+LEGACY_ARGS = ["-vf", "scale=-2:480", "-b:v", "800k", "-bufsize", "800k", "-maxrate", "800k",
+               "-c:a", "aac", "-b:a", "96k"]
+
+
+def make_clip(ffmpeg: str, path: str, seconds: int, kbps: int):
+    subprocess.run([
+        ffmpeg, "-v", "error", "-y",
+        "-f", "lavfi", "-i", "testsrc2=size=1280x720:rate=30,noise=alls=25:allf=t+u",
+        "-f", "lavfi", "-i", "sine=frequency=440",
+        "-t", str(seconds), "-c:v", "libx264", "-preset", "ultrafast", "-b:v", f"{kbps}k",
+        "-c:a", "aac", "-shortest", path,
+    ], check=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Encode time vs output size across presets and modes")
+    parser.add_argument("--input", help="source clip (default: generated test clip)")
+    parser.add_argument("--seconds", type=int, default=40, help="generated clip length")
+    parser.add_argument("--source-kbps", type=int, default=8000, help="generated clip bitrate")
+    parser.add_argument("--target-mb", type=float, default=16)
+    parser.add_argument("--presets", default="ultrafast,veryfast,medium")
+    parser.add_argument("--modes", default="twopass,crf")
+    parser.add_argument("--ffmpeg", help="ffmpeg binary (default FFMPEG_BIN)")
+    parser.add_argument("--ffprobe", help="ffprobe binary (default FFPROBE_BIN)")
+    args = parser.parse_args()
+
+    import app.workers.video_utils as vu
+    if args.ffmpeg:
+        vu.FFMPEG_BIN = args.ffmpeg
+    if args.ffprobe:
+        vu.FFPROBE_BIN = args.ffprobe
+
+    with tempfile.TemporaryDirectory() as tmp:
+        src = args.input
+        if not src:
+            src = os.path.join(tmp, "source.mp4")
+            make_clip(vu.FFMPEG_BIN, src, args.seconds, args.source_kbps)
+        info = vu.probe_video(src)
+        max_bytes = int(args.target_mb * vu.MB)
+        print(f"source: {os.path.getsize(src) / vu.MB:.1f} MB, {info.duration_s:.1f}s, "
+              f"{info.width}x{info.height}, target <= {args.target_mb} MB\n")
+        print(f"{'mode':<9}{'preset':<11}{'encode s':>9}{'MB':>8}{'of target':>10}{'attempts':>9}"
+              f"{'height':>7}{'kbps':>6}  faststart")
+
+        out = os.path.join(tmp, "legacy.mp4")
+        t0 = time.perf_counter()
+        subprocess.run([vu.FFMPEG_BIN, "-v", "error", "-y", "-i", src, *LEGACY_ARGS, out], check=True)
+        elapsed = time.perf_counter() - t0
+        size = os.path.getsize(out)
+        print(f"{'legacy':<9}{'medium':<11}{elapsed:>9.1f}{size / vu.MB:>8.2f}{size / max_bytes:>10.0%}{1:>9}"
+              f"{480:>7}{800:>6}  {vu.is_faststart(out)}")
+
+        for mode in args.modes.split(","):
+            for preset in args.presets.split(","):
+                out = os.path.join(tmp, f"{mode}-{preset}.mp4")
+                t0 = time.perf_counter()
+                try:
+                    r = vu.encode_to_size(src, out, max_bytes, mode=mode, preset=preset)
+                except vu.EncodeError as e:
+                    print(f"{mode:<9}{preset:<11}  failed: {e}")
+                    continue
+                elapsed = time.perf_counter() - t0
+                height = r.plan.height if r.plan else info.height
+                kbps = r.plan.video_kbps if r.plan else 0
+                print(f"{mode:<9}{preset:<11}{elapsed:>9.1f}{r.size_bytes / vu.MB:>8.2f}"
+                      f"{r.size_bytes / max_bytes:>10.0%}{r.attempts:>9}{height:>7}{kbps:>6}  {vu.is_faststart(out)}")
+
+
+if __name__ == "__main__":
+    main()
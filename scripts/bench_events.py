@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# bench_events.py
+"""
+Server cost of browsers watching jobs: every client polling /status/{job_id} every
+--interval seconds (the old index.html) vs every client holding an /events/{job_id} SSE
+stream, against the real app (mock provider) in one uvicorn process. For each mode it
+measures server CPU while --clients jobs are in flight, then finishes them all at once
+and measures how long each client takes to notice.
+Usage:
+  python scripts/bench_events.py --clients 1000 --window 10 --interval 1.5
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import socket
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+
+def serve(port: int):
+    import uvicorn
+    from fastapi import Body
+    from app import db, requests_db
+    db.init_db()
+    requests_db.init_db()
+    import app.main as m
+    from app.storage import run_db
+    from app.providers.base import VideoJob
+
+    @m.app.post("/_bench/jobs")
+    async def make_jobs(n: int):
+        ids = []
+        for i in range(n):
+            job = await m.video_gen.submit(f"watch prompt {i} {time.time()}", style="anime", use_cache=False)
+            ids.append(job.job_id)
+        return ids
+
+    @m.app.post("/_bench/complete")
+    async def complete(job_ids: list = Body(...)):
+        # what a burst of provider webhooks does, without the HTTP cost of each one (or the re-fetch)
+        await run_db(lambda: [m.video_gen._apply(j, VideoJob(j, status="succeeded")) for j in job_ids])
+        return {"completed": len(job_ids)}
+
+    uvicorn.run(m.app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def cpu_seconds(pid: int) -> float:
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+async def _read_response(reader: asyncio.StreamReader) -> dict:
+    headers = {}
+    await reader.readline()   # status line
+    while True:
+        line = (await reader.readline()).decode().strip()
+        if not line:
+            break
+        name, _, value = line.partition(":")
+        headers[name.lower()] = value.strip()
+    return json.loads(await reader.readexactly(int(headers["content-length"])))
+
+
+class Watcher:
+    def __init__(self, port: int, job_id: str):
+        self.port = port
+        self.job_id = job_id
+        self.requests = 0
+        self.ready = asyncio.Event()
+        self.done_at = None
+
+    async def poll(self, interval: float):
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.port)
+        request = f"GET /status/{self.job_id} HTTP/1.1\r\nHost: bench\r\n\r\n".encode()
+        try:
+            while True:
+                writer.write(request)
+                d = await _read_response(reader)
+                self.requests += 1
+                self.ready.set()
+                if d["status"] in ("succeeded", "failed"):
+                    self.done_at = time.perf_counter()
+                    return
+                await asyncio.sleep(interval)
+        finally:
+            writer.close()
+
+    async def push(self):
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.port)
+        writer.write(f"GET /events/{self.job_id} HTTP/1.1\r\nHost: bench\r\nAccept: text/event-stream\r\n\r\n".encode())
+        self.requests += 1
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    return
+                if line.startswith(b"data:"):
+                    d = json.loads(line[5:])
+                    self.ready.set()
+                    if d["status"] in ("succeeded", "failed"):
+                        self.done_at = time.perf_counter()
+                        return
+        finally:
+            writer.close()
+
+
+async def run(mode: str, port: int, server_pid: int, args) -> dict:
+    async def call(path: str, body=None) -> list:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        payload = json.dumps(body).encode() if body is not None else b""
+        writer.write(f"POST {path} HTTP/1.1\r\nHost: bench\r\nContent-Type: application/json\r\n"
+                     f"Content-Length: {len(payload)}\r\n\r\n".encode() + payload)
+        try:
+            return await _read_response(reader)
+        finally:
+            writer.close()
+
+    ids = await call(f"/_bench/jobs?n={args.clients}")
+    watchers = [Watcher(port, job_id) for job_id in ids]
+    tasks = []
+    for i, w in enumerate(watchers):
+        tasks.append(asyncio.create_task(w.poll(args.interval) if mode == "polling" else w.push()))
+        if i % 50 == 49:
+            await asyncio.sleep(0.05)   # don't overflow the listen backlog
+    await asyncio.gather(*(w.ready.wait() for w in watchers))
+
+    requests0 = sum(w.requests for w in watchers)
+    cpu0 = cpu_seconds(server_pid)
+    await asyncio.sleep(args.window)
+    idle_cpu = cpu_seconds(server_pid) - cpu0
+    requests = sum(w.requests for w in watchers) - requests0
+
+    cpu0 = cpu_seconds(server_pid)
+    t0 = time.perf_counter()
+    await call("/_bench/complete", ids)
+    await asyncio.wait_for(asyncio.gather(*tasks), 60)
+    finish_cpu = cpu_seconds(server_pid) - cpu0
+    lags = sorted(w.done_at - t0 for w in watchers)
+    return {"idle_cpu": idle_cpu, "requests": requests, "finish_cpu": finish_cpu, "lags": lags}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Polling /status vs SSE /events for many watching clients")
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--window", type=float, default=10.0, help="seconds of watching to measure")
+    parser.add_argument("--interval", type=float, default=1.5, help="polling interval (index.html uses 1.5 s)")
+    parser.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve)
+        return
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {**os.environ, "DB_PATH": f"{tmp}/jobs.db", "REQ_DB_PATH": f"{tmp}/requests.db",
+               "BLOB_STORE_DIR": f"{tmp}/blobs", "MOCK_LATENCY_SECONDS": "100000", "VIDEO_PROVIDER": "mock",
+               "TWILIO_TEST_TO": "", "SSE_MAX_CLIENTS": str(args.clients * 2)}
+        server = subprocess.Popen([sys.executable, __file__, "--serve", str(port)], env=env)
+        try:
+            for _ in range(100):
+                try:
+                    socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+                    break
+                except OSError:
+                    time.sleep(0.1)
+            print(f"{args.clients} clients, {args.window:g}s watching, polling every {args.interval:g}s\n")
+            print(f"{'mode':<9}{'req/s':>8}{'CPU %':>8}{'CPU ms/s per 1000':>19}"
+                  f"{'finish CPU ms':>15}{'notify p50 ms':>15}{'p95 ms':>9}")
+            for mode in ("polling", "push"):
+                r = asyncio.run(run(mode, port, server.pid, args))
+                per_s = r["idle_cpu"] / args.window
+                lags = r["lags"]
+                print(f"{mode:<9}{r['requests'] / args.window:>8.0f}{per_s * 100:>8.1f}"
+                      f"{per_s * 1000 * 1000 / args.clients:>19.1f}{r['finish_cpu'] * 1000:>15.0f}"
+                      f"{lags[len(lags) // 2] * 1000:>15.0f}{lags[int(0.95 * (len(lags) - 1))] * 1000:>9.0f}")
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
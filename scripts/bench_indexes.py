@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# bench_indexes.py
+"""
+Seed a large jobs/requests table and time the /history and dequeue queries
+before and after the versioned migrations (indexes + created_ms).
+Usage:
+  python scripts/bench_indexes.py --rows 1000000
+Works on throwaway files in a temp directory.
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.storage import SQLiteDB
+from app.migrations import JOBS_MIGRATIONS, REQUESTS_MIGRATIONS, migrate
+
+OLD_HISTORY = """
+    SELECT job_id, prompt, final_prompt, status, video_url, created_at, style
+    FROM jobs WHERE user_id = ? ORDER BY datetime(created_at) DESC LIMIT ?
+"""
+NEW_HISTORY = """
+    SELECT job_id, prompt, final_prompt, status, video_url, created_at, style
+    FROM jobs WHERE user_id = ? ORDER BY created_ms DESC LIMIT ?
+"""
+OLD_DEQUEUE = "SELECT * FROM requests WHERE status = 'queued' ORDER BY created_at ASC LIMIT 1"
+NEW_DEQUEUE = "SELECT * FROM requests WHERE status = 'queued' ORDER BY created_ms ASC, id ASC LIMIT 1"
+
+
+def seed(db: SQLiteDB, rows: int, users: int):
+    """Create the pre-migration (v2) schema and fill it."""
+    migrate(db, JOBS_MIGRATIONS[:2])
+    start = datetime(2025, 1, 1)
+    styles = ("anime", "cartoon", "cyberpunk")
+    batch = 50_000
+    with db.transaction() as conn:
+        for base in range(0, rows, batch):
+            conn.executemany(
+                "INSERT INTO jobs (user_id, job_id, prompt, final_prompt, status, video_url, created_at, style) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(f"whatsapp:+1{random.randrange(users):09d}", f"job-{i}", "a cat surfing", "a cat surfing, anime",
+                  "succeeded", f"/video/job-{i}",
+                  (start + timedelta(seconds=i * 7)).isoformat() + "Z", random.choice(styles))
+                 for i in range(base, min(rows, base + batch))],
+            )
+
+
+def seed_requests(db: SQLiteDB, rows: int, queued_every: int = 1000):
+    migrate(db, REQUESTS_MIGRATIONS[:2])
+    start = datetime(2025, 1, 1)
+    batch = 50_000
+    with db.transaction() as conn:
+        for base in range(0, rows, batch):
+            conn.executemany(
+                "INSERT INTO requests (user_id, prompt, status, created_at, style) VALUES (?, ?, ?, ?, ?)",
+                [("api-user", "a robot dancing", "queued" if i % queued_every == 0 else "done",
+                  (start + timedelta(seconds=i)).strftime("%Y-%m-%d %H:%M:%S"), "anime")
+                 for i in range(base, min(rows, base + batch))],
+            )
+
+
+def timed(db: SQLiteDB, sql: str, params_fn, n: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(n):
+        db.execute(sql, params_fn()).fetchall()
+    return (time.perf_counter() - t0) / n * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="History/dequeue latency before and after migrations")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        jobs = SQLiteDB(os.path.join(tmp, "jobs.db"))
+        reqs = SQLiteDB(os.path.join(tmp, "requests.db"))
+
+        t0 = time.perf_counter()
+        seed(jobs, args.rows, args.users)
+        seed_requests(reqs, args.rows)
+        print(f"seeded {args.rows:,} jobs + {args.rows:,} requests in {time.perf_counter() - t0:.1f}s")
+
+        user = lambda: (f"whatsapp:+1{random.randrange(args.users):09d}", 10)
+        slow_n = max(5, args.queries // 20)  # full scans are slow; fewer samples
+        before_hist = timed(jobs, OLD_HISTORY, user, slow_n)
+        before_deq = timed(reqs, OLD_DEQUEUE, lambda: (), slow_n)
+
+        t0 = time.perf_counter()
+        migrate(jobs, JOBS_MIGRATIONS)
+        migrate(reqs, REQUESTS_MIGRATIONS)
+        print(f"migrations applied in {time.perf_counter() - t0:.1f}s")
+
+        after_hist = timed(jobs, NEW_HISTORY, user, args.queries)
+        after_deq = timed(reqs, NEW_DEQUEUE, lambda: (), args.queries)
+        jobs.close_all()
+        reqs.close_all()
+
+    print(f"{'':<10}{'before ms':>12}{'after ms':>12}{'speedup':>10}")
+    print(f"{'history':<10}{before_hist:>12.3f}{after_hist:>12.3f}{before_hist / after_hist:>9.0f}x")
+    print(f"{'dequeue':<10}{before_deq:>12.3f}{after_deq:>12.3f}{before_deq / after_deq:>9.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# bench_ingest.py
+"""
+Provider-output download against the fake media server: buffering whole bodies in memory
+(requests.get(...).content, what a naive fetch does) vs the streaming Downloader, for
+several concurrent files. Reports wall time, throughput and peak Python heap; then runs
+the Downloader once more with dropped connections to show Range resumption.
+Usage:
+  python scripts/bench_ingest.py --file big.mp4 --downloads 8 --concurrency 4 --drop-after 5000000
+"""
+import os
+import sys
+import time
+import asyncio
+import hashlib
+import argparse
+import tempfile
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_media_server import FakeMediaServer  # noqa: E402
+
+
+def buffered(url: str, n: int, concurrency: int, out_dir: str) -> float:
+    import requests
+
+    def one(i: int):
+        body = requests.get(url, timeout=60).content
+        with open(os.path.join(out_dir, f"buffered-{i}.mp4"), "wb") as f:
+            f.write(body)
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(one, range(n)))
+    return time.perf_counter() - t0
+
+
+async def streamed(url: str, n: int, concurrency: int, out_dir: str, **kw):
+    from app.services.ingest import Downloader
+
+    dl = Downloader(max_concurrency=concurrency, **kw)
+    t0 = time.perf_counter()
+    results = await asyncio.gather(*(dl.download(url, os.path.join(out_dir, f"streamed-{i}.mp4")) for i in range(n)))
+    elapsed = time.perf_counter() - t0
+    snap = dl.snapshot()
+    await dl.aclose()
+    return elapsed, results, snap
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Buffered vs streaming provider downloads")
+    parser.add_argument("--file", help="file to serve (default: a generated 32 MB file)")
+    parser.add_argument("--downloads", type=int, default=8)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--drop-after", type=int, default=5_000_000, help="bytes before each cut connection")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.file
+        if not path:
+            path = os.path.join(tmp, "source.mp4")
+            with open(path, "wb") as f:
+                f.write(os.urandom(32 * 1024 * 1024))
+        server = FakeMediaServer(path).start()
+        size = len(server.data)
+        total_mb = size * args.downloads / 1e6
+        print(f"{args.downloads} x {size / 1e6:.1f} MB, concurrency {args.concurrency}\n")
+        print(f"{'mode':<10}{'seconds':>9}{'MB/s':>8}{'peak heap MB':>14}")
+
+        tracemalloc.start()
+        elapsed = buffered(server.url, args.downloads, args.concurrency, tmp)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"{'buffered':<10}{elapsed:>9.2f}{total_mb / elapsed:>8.0f}{peak / 1e6:>14.1f}")
+
+        tracemalloc.start()
+        elapsed, results, _ = asyncio.run(streamed(server.url, args.downloads, args.concurrency, tmp))
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"{'streamed':<10}{elapsed:>9.2f}{total_mb / elapsed:>8.0f}{peak / 1e6:>14.1f}")
+        assert all(r.sha256 == server.sha256 for r in results)
+
+        server.drop_after, server.drops = args.drop_after, args.downloads * 2
+        elapsed, results, snap = asyncio.run(streamed(server.url, args.downloads, args.concurrency, tmp, retries=8))
+        intact = all(r.sha256 == server.sha256 for r in results)
+        intact = intact and all(hashlib.sha256(open(r.path, "rb").read()).hexdigest() == server.sha256 for r in results)
+        print(f"\nwith {args.downloads * 2} connections cut after {args.drop_after / 1e6:.1f} MB: "
+              f"{elapsed:.2f}s, {snap['resumes']} range resumes, {server.range_requests} range requests, "
+              f"all intact: {intact}")
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# bench_jobstore_memory.py
+"""
+Memory cost of job records and of a long-running JobStore.
+Each scenario runs in a fresh subprocess so RSS numbers don't bleed into each other:
+  legacy   - the old unbounded store of plain dataclass records (meta dict per record)
+  slots    - the same unbounded dict, but with the new __slots__ JobRecord
+  bounded  - the new JobStore with its default limits (steady state)
+Usage:
+  python scripts/bench_jobstore_memory.py --jobs 1000000
+Records are put without a user_id, so nothing is written to jobs.db.
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+import tracemalloc
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+STYLES = ("anime", "cartoon", "cyberpunk")
+
+
+@dataclass
+class LegacyJobRecord:
+    """JobRecord as it was before slots/interning."""
+    job_id: str
+    status: str
+    video_path: Optional[str]
+    provider: str
+    prompt_hash: str
+    prompt: Optional[str] = None
+    final_prompt: Optional[str] = None
+    created_at: Optional[str] = None
+    user_number: Optional[str] = None
+    cached: bool = False
+    meta: Dict[str, str] = field(default_factory=dict)
+    feedback_pending: bool = False
+    feedback: Optional[bool] = None
+    awaiting_style: bool = False
+    chosen_style: Optional[str] = None
+    style: Optional[str] = None
+
+
+def rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def make_fields(i: int) -> dict:
+    style = STYLES[i % 3]
+    # statuses/styles arrive from JSON and user input as fresh string objects, not literals
+    return dict(
+        job_id=f"{1_700_000_000_000 + i}",
+        status="".join(["succ", "eeded"]),
+        video_path=f"/video/{1_700_000_000_000 + i}",
+        provider="".join(["mock", "provider"]),
+        prompt_hash=f"{i:016x}",
+        prompt=f"a cat surfing a wave number {i}",
+        final_prompt=f"a cat surfing a wave number {i}. Style: {style}.",
+        created_at="2026-01-01T00:00:00Z",
+        user_number=f"whatsapp:+1{i % 100_000:09d}",
+        style="".join(style),
+        chosen_style="".join(style),
+    )
+
+
+def run_scenario(name: str, jobs: int) -> dict:
+    from app.services.jobs import JobRecord, JobStore
+
+    base_rss = rss_bytes()
+    tracemalloc.start()
+    if name == "legacy":
+        store = {}
+        for i in range(jobs):
+            rec = LegacyJobRecord(**make_fields(i))
+            store[rec.job_id] = rec
+        kept = len(store)
+    elif name == "slots":
+        store = {}
+        for i in range(jobs):
+            rec = JobRecord(**make_fields(i))
+            store[rec.job_id] = rec
+        kept = len(store)
+    else:
+        store = JobStore()
+        for i in range(jobs):
+            store.put(JobRecord(**make_fields(i)))
+        kept = len(store)
+    traced, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "scenario": name,
+        "kept": kept,
+        "bytes_per_job": traced / max(kept, 1),
+        "traced_mb": traced / 1e6,
+        "rss_mb": (rss_bytes() - base_rss) / 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="JobStore memory per job and steady-state RSS")
+    parser.add_argument("--jobs", type=int, default=1_000_000)
+    parser.add_argument("--scenario", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.scenario:
+        print(json.dumps(run_scenario(args.scenario, args.jobs)))
+        return
+
+    print(f"{'scenario':<10}{'kept':>10}{'bytes/job':>11}{'traced MB':>11}{'RSS MB':>9}")
+    for name in ("legacy", "slots", "bounded"):
+        out = subprocess.run([sys.executable, __file__, "--jobs", str(args.jobs), "--scenario", name],
+                             capture_output=True, text=True, check=True).stdout
+        r = json.loads(out.strip().splitlines()[-1])
+        print(f"{r['scenario']:<10}{r['kept']:>10,}{r['bytes_per_job']:>11.0f}"
+              f"{r['traced_mb']:>11.1f}{r['rss_mb']:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# bench_media.py
+"""
+Load test for the /video file endpoint: concurrent random range requests (plus some
+full downloads) against the old 64 KB generator route and the new media_response route,
+both served by one uvicorn process. Reports throughput and server CPU per request.
+Usage:
+  python scripts/bench_media.py --concurrency 32 --requests 2000 --range-kb 512
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import socket
+import subprocess
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+VIDEO = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "app", "static", "placeholder.mp4"))
+
+
+def build_app():
+    from typing import Optional, Tuple
+    from fastapi import FastAPI, HTTPException, Request
+    from fastapi.responses import StreamingResponse
+    from app.services.media import StatCache, media_response
+
+    app = FastAPI()
+    cache = StatCache()
+
+    def _parse_range(range_header: Optional[str], file_size: int) -> Optional[Tuple[int, int]]:
+        if not range_header or "=" not in range_header:
+            return None
+        units, rng = range_header.split("=", 1)
+        if units.strip().lower() != "bytes":
+            return None
+        start_s, _, end_s = rng.partition("-")
+        try:
+            if start_s and end_s:
+                start, end = int(start_s), int(end_s)
+            elif start_s:
+                start, end = int(start_s), file_size - 1
+            else:
+                n = int(end_s)
+                start, end = file_size - n, file_size - 1
+            if start < 0 or end >= file_size or start > end:
+                return None
+            return (start, end)
+        except ValueError:
+            return None
+
+    @app.get("/old/{job_id}")
+    def old(job_id: str, request: Request):
+        # the route as it was: existence checks, getsize, 64 KB generator
+        compressed_path = f"app/static/compressed/{job_id}.mp4"
+        path = compressed_path if os.path.exists(compressed_path) else VIDEO
+        if not os.path.exists(path):
+            raise HTTPException(404, "Video missing")
+        file_size = os.path.getsize(path)
+        rng = _parse_range(request.headers.get("range"), file_size)
+
+        def iterfile(start: int = 0, end: int = file_size - 1, chunk_size: int = 64 * 1024):
+            with open(path, "rb") as f:
+                f.seek(start)
+                bytes_left = end - start + 1
+                while bytes_left > 0:
+                    chunk = f.read(min(chunk_size, bytes_left))
+                    if not chunk:
+                        break
+                    bytes_left -= len(chunk)
+                    yield chunk
+
+        if rng:
+            start, end = rng
+            headers = {"Content-Range": f"bytes {start}-{end}/{file_size}", "Accept-Ranges": "bytes",
+                       "Content-Length": str(end - start + 1)}
+            return StreamingResponse(iterfile(start, end), status_code=206, headers=headers, media_type="video/mp4")
+        headers = {"Accept-Ranges": "bytes", "Content-Length": str(file_size)}
+        return StreamingResponse(iterfile(), headers=headers, media_type="video/mp4")
+
+    @app.api_route("/new/{job_id}", methods=["GET", "HEAD"])
+    async def new(job_id: str, request: Request):
+        media = cache.lookup(job_id)
+        if media is None:
+            media = await asyncio.to_thread(cache.stat, VIDEO)
+            cache.store(job_id, media)
+        return media_response(media, request.headers)
+
+    return app
+
+
+def cpu_seconds(pid: int) -> float:
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+async def load(base: str, route: str, args, size: int) -> dict:
+    import httpx
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    transferred = 0
+    etag = None
+    async with httpx.AsyncClient(base_url=base, limits=limits, timeout=60) as client:
+        async def worker(n: int):
+            nonlocal transferred, etag
+            for _ in range(n):
+                roll = random.random()
+                headers = {}
+                if roll < args.full_ratio:
+                    pass
+                elif roll < args.full_ratio + args.revalidate_ratio and etag and route == "new":
+                    headers["If-None-Match"] = etag
+                else:
+                    start = random.randrange(0, size - args.range_kb * 1024)
+                    headers["Range"] = f"bytes={start}-{start + args.range_kb * 1024 - 1}"
+                r = await client.get(f"/{route}/job-{random.randrange(64)}", headers=headers)
+                transferred += len(r.content)
+                etag = r.headers.get("etag", etag)
+
+        per = args.requests // args.concurrency
+        sent = per * args.concurrency
+        t0 = time.perf_counter()
+        await asyncio.gather(*(worker(per) for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - t0
+    return {"requests": sent, "seconds": elapsed, "bytes": transferred}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Old vs new /video endpoint under concurrent range load")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--range-kb", type=int, default=512)
+    parser.add_argument("--full-ratio", type=float, default=0.05, help="share of full-file GETs")
+    parser.add_argument("--revalidate-ratio", type=float, default=0.0, help="share of If-None-Match GETs (new route only)")
+    parser.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        import uvicorn
+        uvicorn.run(build_app(), host="127.0.0.1", port=args.serve, log_level="warning")
+        return
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = subprocess.Popen([sys.executable, __file__, "--serve", str(port)])
+    base = f"http://127.0.0.1:{port}"
+    try:
+        for _ in range(100):
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+                break
+            except OSError:
+                time.sleep(0.1)
+        size = os.path.getsize(VIDEO)
+        print(f"{'route':<6}{'req/s':>9}{'MB/s':>9}{'CPU ms/req':>12}{'KB/req':>9}")
+        for route in ("old", "new"):
+            asyncio.run(load(base, route, argparse.Namespace(**{**vars(args), "requests": 64}), size))  # warm up
+            cpu0 = cpu_seconds(server.pid)
+            r = asyncio.run(load(base, route, args, size))
+            cpu = cpu_seconds(server.pid) - cpu0
+            print(f"{route:<6}{r['requests'] / r['seconds']:>9.0f}{r['bytes'] / r['seconds'] / 1e6:>9.0f}"
+                  f"{cpu / r['requests'] * 1000:>12.2f}{r['bytes'] / r['requests'] / 1024:>9.0f}")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# bench_optimizer.py
+"""
+Prompt optimizer against a local fake OpenAI server:
+  legacy    - a new sync OpenAI client per call (the old optimize_prompt), run in threads
+  pooled    - the shared AsyncOpenAI client, distinct prompts, all concurrent
+  coalesced - many concurrent requests for the same prompt
+  cached    - the same prompts again (LRU hits)
+  timeout   - server slower than the timeout budget (falls back to compose_prompt)
+Usage:
+  python scripts/bench_optimizer.py --prompts 50 --delay 0.2
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from openai import OpenAI
+
+from scripts.fake_openai_server import FakeOpenAIServer
+from app.services.prompt_optimizer import PromptOptimizer, SYSTEM_PROMPT
+
+
+def legacy_optimize(base_url: str, user_prompt: str, style: str) -> str:
+    client = OpenAI(api_key="fake", base_url=base_url)
+    response = client.chat.completions.create(
+        model="gpt-4o-mini",
+        messages=[{"role": "system", "content": SYSTEM_PROMPT},
+                  {"role": "user", "content": f"Prompt: {user_prompt}\nStyle: {style}"}],
+        max_tokens=100,
+    )
+    return response.choices[0].message.content
+
+
+async def run(args):
+    server = FakeOpenAIServer(delay=args.delay).start()
+    prompts = [f"a cat surfing wave number {i}" for i in range(args.prompts)]
+    rows = []
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(asyncio.to_thread(legacy_optimize, server.base_url, p, "anime") for p in prompts))
+    rows.append(("legacy", time.perf_counter() - t0, len(prompts)))
+
+    opt = PromptOptimizer(api_key="fake", base_url=server.base_url, timeout=args.delay * 10, persist=False)
+    before = server.requests
+    t0 = time.perf_counter()
+    await asyncio.gather(*(opt.optimize(p, "anime") for p in prompts))
+    rows.append(("pooled", time.perf_counter() - t0, server.requests - before))
+
+    before = server.requests
+    t0 = time.perf_counter()
+    await asyncio.gather(*(opt.optimize("A dragon over the city!", "cyberpunk") for _ in range(args.prompts)))
+    rows.append(("coalesced", time.perf_counter() - t0, server.requests - before))
+
+    before = server.requests
+    t0 = time.perf_counter()
+    await asyncio.gather(*(opt.optimize(p.upper(), "anime") for p in prompts))   # normalizes to the same keys
+    rows.append(("cached", time.perf_counter() - t0, server.requests - before))
+
+    slow = PromptOptimizer(api_key="fake", base_url=server.base_url, timeout=args.delay / 2, persist=False)
+    t0 = time.perf_counter()
+    out = await slow.optimize("a slow one", "anime")
+    rows.append(("timeout", time.perf_counter() - t0, slow.stats["timeouts"]))
+
+    await opt.aclose()
+    await slow.aclose()
+    server.shutdown()
+
+    print(f"{'scenario':<11}{'seconds':>9}{'upstream calls':>16}")
+    for name, secs, calls in rows:
+        print(f"{name:<11}{secs:>9.3f}{calls:>16}")
+    print(f"timeout fallback -> {out[:60]}...")
+    print(opt.snapshot())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prompt optimizer latency, coalescing and caching")
+    parser.add_argument("--prompts", type=int, default=50)
+    parser.add_argument("--delay", type=float, default=0.2, help="fake completion latency (s)")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
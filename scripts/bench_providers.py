@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# bench_providers.py
+"""
+ModelsLab provider calls against the fake ModelsLab server: the old adapter (module-level
+requests.post/get, a new connection per call, run in threads as /status did) vs the async
+ModelsLabProvider on one pooled keep-alive client. Submits --jobs jobs, then polls them
+all for --rounds rounds. --handshake adds a per-connection setup cost on the server,
+standing in for TCP+TLS to the real API. Reports time per phase, calls/s, TCP connections
+opened and event-loop lag; then takes the server down to show the circuit breaker
+failing fast.
+Usage:
+  python scripts/bench_providers.py --jobs 500 --rounds 4 --delay 0.01 --handshake 0.05
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+
+import requests
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_modelslab_server import FakeModelsLabServer  # noqa: E402
+from app.providers.client import CircuitBreaker, ProviderClient  # noqa: E402
+from app.providers.modelslab import ModelsLabProvider  # noqa: E402
+
+_mode = ""
+
+
+class LegacyModelsLab:
+    """The pre-async adapter's HTTP pattern: bare requests calls, no session or timeout."""
+
+    def __init__(self, api_url: str):
+        self.api_url = api_url
+        self.fetch_urls = {}
+
+    def submit(self, prompt: str) -> str:
+        resp = requests.post(self.api_url + "/text2video", json={"prompt": prompt},
+                             headers={"Authorization": "Bearer DEMO_KEY"})
+        resp.raise_for_status()
+        data = resp.json()
+        self.fetch_urls[str(data["id"])] = data["fetch_url"]
+        return str(data["id"])
+
+    def fetch(self, job_id: str) -> str:
+        resp = requests.get(self.fetch_urls[job_id], headers={"Authorization": "Bearer DEMO_KEY"})
+        resp.raise_for_status()
+        return resp.json()["status"]
+
+
+async def _lag_monitor(samples: list, stop: asyncio.Event):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        t0 = loop.time()
+        await asyncio.sleep(0.01)
+        samples.append(loop.time() - t0 - 0.01)
+
+
+async def run_legacy(server: FakeModelsLabServer, n: int, rounds: int, concurrency: int):
+    provider = LegacyModelsLab(server.base_url)
+    sem = asyncio.Semaphore(concurrency)   # stands in for the thread pool the calls ran on
+
+    async def call(fn, *args):
+        async with sem:
+            return await asyncio.to_thread(fn, *args)
+
+    ids = await timed("submit", server, lambda: asyncio.gather(
+        *(call(provider.submit, f"bench prompt {i}") for i in range(n))))
+
+    async def poll():
+        for _ in range(rounds):
+            await asyncio.gather(*(call(provider.fetch, job_id) for job_id in ids))
+    await timed("poll", server, poll)
+
+
+async def run_pooled(server: FakeModelsLabServer, n: int, rounds: int, concurrency: int):
+    provider = ModelsLabProvider(api_url=server.base_url, client=ProviderClient(max_connections=concurrency))
+    jobs = await timed("submit", server, lambda: asyncio.gather(
+        *(provider.submit(f"bench prompt {i}", {}) for i in range(n))))
+    ids = [j.job_id for j in jobs]
+
+    async def poll():
+        for _ in range(rounds):
+            results = await provider.fetch_many(ids)
+            assert len(results) == len(ids)
+    await timed("poll", server, poll)
+    await provider.aclose()
+
+
+async def timed(phase: str, server: FakeModelsLabServer, fn):
+    server.requests = server.connections = 0
+    lags, stop = [], asyncio.Event()
+    monitor = asyncio.create_task(_lag_monitor(lags, stop))
+    t0 = time.perf_counter()
+    result = await fn()
+    elapsed = time.perf_counter() - t0
+    stop.set()
+    await monitor
+    lags.sort()
+    p99 = lags[int(0.99 * (len(lags) - 1))] * 1000 if lags else 0.0
+    print(f"{_mode:<9}{phase:<8}{elapsed:>9.2f}{server.requests:>8}{server.requests / elapsed:>9.0f}"
+          f"{server.connections:>13}{p99:>14.1f}")
+    return result
+
+
+async def outage(server: FakeModelsLabServer, calls: int):
+    server.down = True
+    client = ProviderClient(retries=2, breaker=CircuitBreaker(failures=5, reset_after=30))
+    provider = ModelsLabProvider(api_url=server.base_url, client=client)
+    provider._jobs = {str(i): {"fetch_url": f"{server.base_url}/fetch/{i}"} for i in range(calls)}
+    server.requests = 0
+    t0 = time.perf_counter()
+    results = await provider.fetch_many(list(provider._jobs))
+    elapsed = time.perf_counter() - t0
+    snap = provider.snapshot()
+    await provider.aclose()
+    server.down = False
+    print(f"\nprovider down, {calls} polls: {elapsed:.2f}s, {server.requests} requests reached it, "
+          f"{len(results)} answered, circuit {snap['circuit']} "
+          f"(opened {snap['circuit_opened']}, {snap['circuit_rejected']} calls rejected without a request)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Legacy requests-per-call vs pooled async ModelsLab provider")
+    parser.add_argument("--jobs", type=int, default=500)
+    parser.add_argument("--rounds", type=int, default=4, help="polling rounds over every job")
+    parser.add_argument("--concurrency", type=int, default=20, help="threads (legacy) / pooled connections")
+    parser.add_argument("--delay", type=float, default=0.01, help="server latency per request")
+    parser.add_argument("--handshake", type=float, default=0.05, help="server setup cost per new connection")
+    args = parser.parse_args()
+
+    global _mode
+    # jobs never finish, so every poll reaches the server
+    server = FakeModelsLabServer(delay=args.delay, generation=1e9, handshake=args.handshake).start()
+    print(f"{args.jobs} jobs x {args.rounds} polls, {args.concurrency} concurrent calls, "
+          f"{args.delay * 1000:.0f} ms per request, {args.handshake * 1000:.0f} ms per new connection\n")
+    print(f"{'mode':<9}{'phase':<8}{'seconds':>9}{'calls':>8}{'calls/s':>9}{'connections':>13}{'loop p99 ms':>14}")
+    for _mode, run in (("legacy", run_legacy), ("pooled", run_pooled)):
+        asyncio.run(run(server, args.jobs, args.rounds, args.concurrency))
+    asyncio.run(outage(server, args.jobs))
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
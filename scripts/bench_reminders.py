@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# bench_reminders.py
+"""
+Cost of inactivity reminders at scale. "legacy" is the old reminder_worker: one asyncio
+task per user sleeping in a loop. "scheduler" is ReminderScheduler: one heap, a dict of
+live entries and batched write-behind to the reminders table. Measures schedule and
+cancel cost per user and memory at --users users (the legacy side at --legacy-users, as
+a million tasks would not fit comfortably), the batched flush and the startup reload of
+every due time, then dispatch: due reminders claimed, composed and handed to a fake
+sender, unthrottled and at --send-rate.
+Usage:
+  python scripts/bench_reminders.py --users 1000000 --legacy-users 100000
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+
+def rss_mb() -> float:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+async def legacy(n: int):
+    # the old schedule_reminder/cancel_reminder, minus the send
+    tasks = {}
+
+    async def loop(user_number: str):
+        while True:
+            await asyncio.sleep(3600)
+
+    users = [f"whatsapp:+1{i:010d}" for i in range(n)]
+    rss0 = rss_mb()
+    t0 = time.perf_counter()
+    for u in users:
+        old = tasks.pop(u, None)
+        if old:
+            old.cancel()
+        tasks[u] = asyncio.create_task(loop(u))
+    await asyncio.sleep(0)   # let every task start and park in its sleep
+    schedule = (time.perf_counter() - t0) / n * 1e6
+    mem = (rss_mb() - rss0) * 1024 * 1024 / n
+    t0 = time.perf_counter()
+    for u in users:
+        tasks.pop(u).cancel()
+    await asyncio.sleep(0)   # let the cancellations run
+    cancel = (time.perf_counter() - t0) / n * 1e6
+    return schedule, cancel, mem
+
+
+async def scheduler(n: int, job_store):
+    from app.workers.reminder_worker import ReminderScheduler
+    r = ReminderScheduler(job_store, interval=3600)
+    users = [f"whatsapp:+1{i:010d}" for i in range(n)]
+    rss0 = rss_mb()
+    t0 = time.perf_counter()
+    for u in users:
+        r.schedule(u)
+    schedule = (time.perf_counter() - t0) / n * 1e6
+    mem = (rss_mb() - rss0) * 1024 * 1024 / n
+
+    t0 = time.perf_counter()
+    r._flush(r._take_dirty())
+    flush = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    for u in users:   # everyone finishes another video: superseded entries pile up and get compacted
+        r.schedule(u)
+    reschedule = (time.perf_counter() - t0) / n * 1e6
+    r._flush(r._take_dirty())
+
+    fresh = ReminderScheduler(job_store, interval=3600)
+    t0 = time.perf_counter()
+    await fresh._load()
+    load = time.perf_counter() - t0
+    del fresh
+
+    t0 = time.perf_counter()
+    for u in users:
+        r.cancel(u)
+    cancel = (time.perf_counter() - t0) / n * 1e6
+    t0 = time.perf_counter()
+    r._flush(r._take_dirty())
+    flush_cancel = time.perf_counter() - t0
+    return {"schedule": schedule, "reschedule": reschedule, "cancel": cancel, "mem": mem, "flush": flush,
+            "flush_cancel": flush_cancel, "load": load, "compactions": r.stats["compactions"]}
+
+
+async def dispatch(n: int, send_rate: float, job_store) -> dict:
+    from app.workers.reminder_worker import ReminderScheduler
+    sent = []
+    done = asyncio.Event()
+
+    async def fake_send(user_number: str, text: str):
+        sent.append(time.perf_counter())
+        if len(sent) == n:
+            done.set()
+
+    r = ReminderScheduler(job_store, send=fake_send, interval=0, max_per_user=1, send_rate=send_rate)
+    for i in range(n):
+        r.schedule(f"whatsapp:+2{send_rate:g}{i:09d}")
+    t0 = time.perf_counter()
+    r.start()
+    await asyncio.wait_for(done.wait(), 600)
+    elapsed = time.perf_counter() - t0
+    await r.stop()
+    steady = sent[int(send_rate):] if send_rate else sent   # after the bucket's one-second burst
+    rate = (len(steady) - 1) / (steady[-1] - steady[0]) if len(steady) > 1 and steady[-1] > steady[0] else float("inf")
+    return {"elapsed": elapsed, "rate": rate}
+
+
+async def main_async(args):
+    from app import db
+    from app.services.jobs import JobStore
+    db.init_db()
+    job_store = JobStore()
+
+    print(f"{'':<12}{'users':>10}{'schedule µs':>13}{'cancel µs':>11}{'bytes/user':>12}")
+    if args.legacy_users:
+        s, c, mem = await legacy(args.legacy_users)
+        print(f"{'legacy':<12}{args.legacy_users:>10}{s:>13.2f}{c:>11.2f}{mem:>12.0f}")
+    r = await scheduler(args.users, job_store)
+    print(f"{'scheduler':<12}{args.users:>10}{r['schedule']:>13.2f}{r['cancel']:>11.2f}{r['mem']:>12.0f}")
+    print(f"\nscheduler: reschedule everyone {r['reschedule']:.2f} µs/user ({r['compactions']} heap compactions); "
+          f"write-behind of {args.users} due times {r['flush']:.2f} s, of {args.users} cancels "
+          f"{r['flush_cancel']:.2f} s; reload at startup {r['load']:.2f} s")
+
+    print(f"\ndispatch of {args.due} due reminders (claim + compose + send):")
+    d = await dispatch(args.due, 0, job_store)
+    print(f"  unthrottled        {d['elapsed']:.2f} s, {args.due / d['elapsed']:.0f} reminders/s")
+    n = min(args.due, int(args.send_rate * 3) + 1)
+    d = await dispatch(n, args.send_rate, job_store)
+    print(f"  limit {args.send_rate:g}/s      {n} sent in {d['elapsed']:.2f} s, {d['rate']:.1f}/s after the first second's burst")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reminder scheduling/cancel cost: task per user vs one heap scheduler")
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--legacy-users", type=int, default=100_000, help="0 to skip the task-per-user run")
+    parser.add_argument("--due", type=int, default=20_000, help="reminders made due at once for dispatch")
+    parser.add_argument("--send-rate", type=float, default=200.0, help="REMINDER_SEND_RATE for the throttled run")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.environ.update({"DB_PATH": f"{tmp}/jobs.db", "REQ_DB_PATH": f"{tmp}/requests.db",
+                       "TWILIO_ACCOUNT_SID": "", "TWILIO_AUTH_TOKEN": ""})
+    import logging
+    logging.disable(logging.INFO)
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# bench_sqlite.py
+"""
+Micro-benchmark: job inserts/updates per second, connect-per-call (old app/db.py
+pattern) vs the pooled WAL connections in app/storage.py.
+Usage:
+  python scripts/bench_sqlite.py --ops 5000
+Runs against throwaway files in a temp directory; jobs.db is never touched.
+"""
+import os
+import sys
+import time
+import sqlite3
+import argparse
+import tempfile
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.storage import SQLiteDB
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT, job_id TEXT UNIQUE, prompt TEXT, final_prompt TEXT,
+    status TEXT, video_url TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, style TEXT
+)
+"""
+INSERT = """
+    INSERT OR IGNORE INTO jobs (user_id, job_id, prompt, final_prompt, status, video_url, created_at, style)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
+UPDATE = "UPDATE jobs SET status = ?, video_url = ? WHERE job_id = ?"
+
+
+def _rec(i):
+    return SimpleNamespace(job_id=f"job-{i}", prompt="a cat surfing", final_prompt="a cat surfing, anime",
+                           status="processing", video_path=None, created_at="2025-09-06T10:00:00Z", style="anime")
+
+
+def _params(i):
+    r = _rec(i)
+    return ("whatsapp:+15550001", r.job_id, r.prompt, r.final_prompt, r.status, r.video_path, r.created_at, r.style)
+
+
+def bench_connect_per_call(path: str, n: int):
+    def execute(sql, params):
+        conn = sqlite3.connect(path)
+        conn.execute(sql, params)
+        conn.commit()
+        conn.close()
+
+    execute(SCHEMA, ())
+    t0 = time.perf_counter()
+    for i in range(n):
+        execute(INSERT, _params(i))
+    t1 = time.perf_counter()
+    for i in range(n):
+        execute(UPDATE, ("succeeded", f"/video/job-{i}", f"job-{i}"))
+    t2 = time.perf_counter()
+    return n / (t1 - t0), n / (t2 - t1)
+
+
+def bench_pooled(path: str, n: int):
+    db = SQLiteDB(path)
+    db.execute(SCHEMA)
+    t0 = time.perf_counter()
+    for i in range(n):
+        db.execute(INSERT, _params(i))
+    t1 = time.perf_counter()
+    for i in range(n):
+        db.execute(UPDATE, ("succeeded", f"/video/job-{i}", f"job-{i}"))
+    t2 = time.perf_counter()
+    db.close_all()
+    return n / (t1 - t0), n / (t2 - t1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SQLite insert/update throughput: before vs after pooling")
+    parser.add_argument("--ops", type=int, default=3000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        before = bench_connect_per_call(os.path.join(tmp, "before.db"), args.ops)
+        after = bench_pooled(os.path.join(tmp, "after.db"), args.ops)
+
+    print(f"{'':<18}{'inserts/s':>12}{'updates/s':>12}")
+    print(f"{'connect-per-call':<18}{before[0]:>12.0f}{before[1]:>12.0f}")
+    print(f"{'pooled WAL':<18}{after[0]:>12.0f}{after[1]:>12.0f}")
+    print(f"{'speedup':<18}{after[0] / before[0]:>11.1f}x{after[1] / before[1]:>11.1f}x")
+
+
+if __name__ == "__main__":
+    main()
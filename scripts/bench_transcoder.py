@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# bench_transcoder.py
+"""
+Event-loop responsiveness while videos are being encoded: the old path (a blocking
+subprocess.run called from async code, as downscale_video was) vs the Transcoder (async child processes, bounded
+pool, priority queue). A heartbeat task measures how late the loop runs it; a burst of
+background encodes is queued ahead of one user-facing encode to show its queue wait.
+Without --ffmpeg a stub binary is generated that prints ffmpeg-style progress and
+copies the input after --encode-seconds.
+Usage:
+  python scripts/bench_transcoder.py --jobs 16 --workers 4 --encode-seconds 0.5
+  python scripts/bench_transcoder.py --ffmpeg /usr/bin/ffmpeg --input clip.mp4
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+STUB = '''#!{python}
+import os, sys, time, shutil
+args = sys.argv[1:]
+src, dst = args[args.index("-i") + 1], args[-1]
+total = float(os.environ.get("STUB_ENCODE_SECONDS", "0.5"))
+report = "-progress" in args
+if report:
+    sys.stderr.write("Input #0, mov,mp4, from '%s':\\n  Duration: 00:00:05.00, start: 0.000000\\n" % src)
+steps = 10
+for i in range(1, steps + 1):
+    time.sleep(total / steps)
+    if report:
+        sys.stdout.write("out_time_us=%d\\nprogress=%s\\n" % (i * 500000, "end" if i == steps else "continue"))
+        sys.stdout.flush()
+if os.environ.get("STUB_FAIL"):
+    sys.stderr.write("Conversion failed!\\n")
+    sys.exit(1)
+shutil.copyfile(src, dst)
+'''
+
+
+def make_stub(directory: str) -> str:
+    path = os.path.join(directory, "ffmpeg")
+    with open(path, "w") as f:
+        f.write(STUB.format(python=sys.executable))
+    os.chmod(path, 0o755)
+    return path
+
+
+async def heartbeat(lags: list, stop: asyncio.Event, interval: float = 0.01):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        t = loop.time()
+        await asyncio.sleep(interval)
+        lags.append(loop.time() - t - interval)
+
+
+def summarize(label: str, elapsed: float, lags: list):
+    lags = sorted(lags) or [0.0]
+    print(f"{label:<12}{elapsed:>9.2f}{lags[len(lags) // 2] * 1000:>11.1f}"
+          f"{lags[int(len(lags) * 0.99)] * 1000:>11.1f}{lags[-1] * 1000:>11.1f}")
+
+
+async def run_old(args, inputs, out_dir):
+    import subprocess
+    from app.workers.video_utils import remux_args
+
+    lags, stop = [], asyncio.Event()
+    hb = asyncio.create_task(heartbeat(lags, stop))
+    await asyncio.sleep(0.05)
+    t0 = time.perf_counter()
+
+    async def one(i):
+        # what process_whatsapp_job used to do: a blocking call on the event loop
+        out = os.path.join(out_dir, f"old-{i}.mp4")
+        subprocess.run([args.ffmpeg, *remux_args(inputs[i % len(inputs)], out)], check=True, capture_output=True)
+
+    await asyncio.gather(*(one(i) for i in range(args.jobs)))
+    elapsed = time.perf_counter() - t0
+    stop.set()
+    await hb
+    summarize("sync", elapsed, lags)
+
+
+async def run_new(args, inputs, out_dir):
+    from app.workers.transcoder import PRIORITY_BACKGROUND, PRIORITY_USER, Transcoder
+    from app.workers.video_utils import remux_args
+
+    tc = Transcoder(workers=args.workers, ffmpeg=args.ffmpeg)
+    tc.start()
+    lags, stop = [], asyncio.Event()
+    hb = asyncio.create_task(heartbeat(lags, stop))
+    await asyncio.sleep(0.05)
+    t0 = time.perf_counter()
+
+    async def one(i, priority):
+        out = os.path.join(out_dir, f"new-{i}.mp4")
+        await tc.run(remux_args(inputs[i % len(inputs)], out), f"job-{i}", priority)
+
+    background = [asyncio.create_task(one(i, PRIORITY_BACKGROUND)) for i in range(args.jobs - 1)]
+    await asyncio.sleep(0)
+    t_user = time.perf_counter()
+    await one(args.jobs - 1, PRIORITY_USER)
+    user_latency = time.perf_counter() - t_user
+    await asyncio.gather(*background)
+    elapsed = time.perf_counter() - t0
+    stop.set()
+    await hb
+    summarize("transcoder", elapsed, lags)
+    snap = tc.snapshot()
+    await tc.stop()
+    print(f"\nuser-facing encode queued behind {args.jobs - 1} background jobs finished in {user_latency:.2f}s "
+          f"(one encode alone: ~{args.encode_seconds:.2f}s)")
+    print(f"completed={snap['completed']} failed={snap['failed']} "
+          f"queue_wait_ms={snap['queue_wait_ms']} run_ms={snap['run_ms']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sync subprocess.run vs async Transcoder: loop lag and priority")
+    parser.add_argument("--jobs", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--encode-seconds", type=float, default=0.5, help="stub encode time")
+    parser.add_argument("--ffmpeg", help="real ffmpeg binary (default: generated stub)")
+    parser.add_argument("--input", action="append", help="input clip(s) (default: app/static/placeholder.mp4)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if not args.ffmpeg:
+            args.ffmpeg = make_stub(tmp)
+            os.environ["STUB_ENCODE_SECONDS"] = str(args.encode_seconds)
+        inputs = args.input or [os.path.join(os.path.dirname(__file__), "..", "app", "static", "placeholder.mp4")]
+        print(f"{args.jobs} encodes, {args.workers} workers, ffmpeg={args.ffmpeg}\n")
+        print(f"{'path':<12}{'total s':>9}{'lag p50ms':>11}{'lag p99ms':>11}{'lag maxms':>11}")
+        asyncio.run(run_old(args, inputs, tmp))
+        asyncio.run(run_new(args, inputs, tmp))
+
+
+if __name__ == "__main__":
+    main()
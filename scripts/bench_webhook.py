@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+# bench_webhook.py
+"""
+Latency of the WhatsApp webhook's style-selection reply under concurrent load, against
+the real app in one uvicorn process with fake LLM and ModelsLab servers. "inline" is the
+old handler: optimize, submit and persist before answering Twilio. "fast-ack" is
+/webhook/whatsapp: record the request and answer, with the dispatcher doing the rest.
+Each of --users users first sends a prompt (not measured), then they choose a style at
+--rate replies per second (0 = all at once). Reports reply latency, replies over
+Twilio's 15 s timeout, and how long it takes until every job has been submitted to the
+provider.
+Usage:
+  python scripts/bench_webhook.py --users 400 --rate 80 --llm-delay 0.4 --provider-delay 0.3
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import socket
+import logging
+import tempfile
+import subprocess
+
+import httpx
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+TWILIO_TIMEOUT_SECONDS = 15.0
+
+
+def serve(port: int):
+    import uvicorn
+    from datetime import datetime, timezone
+    from fastapi import Request
+    from fastapi.responses import Response
+    from app import db, requests_db
+    db.init_db()
+    requests_db.init_db()
+    import app.main as m
+    from app.services.jobs import JobRecord
+    from app.integrations.twilio import ack_twiml, parse_incoming
+    logging.disable(logging.WARNING)   # follow-ups fail without Twilio credentials; that's fine here
+
+    submitted = {"inline": 0}
+
+    @m.app.post("/_bench/webhook_inline")
+    async def webhook_inline(request: Request):
+        # the style-selection branch as it was: everything before the reply
+        data = await parse_incoming(request)
+        user_number, chosen = data["from"], m.STYLE_ALIASES[data["body"]]
+        pending = await m.run_db(m.sessions.take, user_number, "style")
+        h = m.prompt_hash(pending.prompt, chosen)
+        cached = await m.run_db(m.result_cache.lookup, pending.prompt, chosen)
+        if cached and cached.video_path:
+            return Response(ack_twiml("✅ Video fetched from cache!"), media_type="application/xml")
+        try:
+            final_prompt = await m.optimize_prompt_async(pending.prompt, chosen)
+        except Exception:
+            final_prompt = pending.prompt
+        job = await m.video_gen.submit(final_prompt, style=chosen, cache_key=h, use_cache=False)
+        rec = JobRecord(job_id=job.job_id, status=job.status, video_path=None, provider=m.PROVIDER_NAME,
+                        prompt_hash=h, prompt=pending.prompt, final_prompt=final_prompt,
+                        created_at=datetime.now(timezone.utc).isoformat().replace("+00:00", "Z"),
+                        style=chosen, chosen_style=chosen)
+        await m.run_db(m.job_store.put, rec, user_id=user_number)
+        m.job_store.store_user_job(user_number, job.job_id)
+        m.completion.track(job.job_id, user_number)
+        submitted["inline"] += 1
+        return Response(ack_twiml(f"✅ Got it! Generating a video for: {final_prompt}"),
+                        media_type="application/xml")
+
+    @m.app.get("/_bench/submitted")
+    async def bench_submitted():
+        return {"inline": submitted["inline"], "fast-ack": m.dispatcher.stats["succeeded"]}
+
+    uvicorn.run(m.app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def cpu_seconds(pid: int) -> float:
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+async def run(mode: str, base: str, users: int, rate: float) -> dict:
+    path = "/_bench/webhook_inline" if mode == "inline" else "/webhook/whatsapp"
+    limits = httpx.Limits(max_connections=users, max_keepalive_connections=users)
+    async with httpx.AsyncClient(base_url=base, limits=limits, timeout=120) as client:
+        numbers = [f"whatsapp:+1{mode == 'inline':d}55{i:07d}" for i in range(users)]
+        before = (await client.get("/_bench/submitted")).json()[mode]
+        for i, number in enumerate(numbers):
+            await client.post("/webhook/whatsapp", data={
+                "From": number, "Body": f"a {mode} bench prompt number {i} about a lighthouse in a storm",
+                "MessageSid": f"SM{mode}{i}"})
+
+        async def choose(i: int, number: str) -> float:
+            if rate:
+                await asyncio.sleep(i / rate)
+            t0 = time.perf_counter()
+            r = await client.post(path, data={"From": number, "Body": "anime", "MessageSid": f"SM{number}s"})
+            r.raise_for_status()
+            return time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        latencies = sorted(await asyncio.gather(*(choose(i, n) for i, n in enumerate(numbers))))
+        while (await client.get("/_bench/submitted")).json()[mode] - before < users:
+            await asyncio.sleep(0.05)
+        return {"latencies": latencies, "all_submitted": time.perf_counter() - t0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="WhatsApp webhook reply latency: inline pipeline vs fast-ack")
+    parser.add_argument("--users", type=int, default=400)
+    parser.add_argument("--rate", type=float, default=80.0, help="style choices per second (0 = all at once)")
+    parser.add_argument("--llm-delay", type=float, default=0.4, help="fake prompt-optimizer LLM latency")
+    parser.add_argument("--provider-delay", type=float, default=0.3, help="fake ModelsLab latency per call")
+    parser.add_argument("--pipeline-concurrency", type=int, default=20, help="DISPATCH_CONCURRENCY")
+    parser.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve)
+        return
+
+    from fake_openai_server import FakeOpenAIServer
+    from fake_modelslab_server import FakeModelsLabServer
+    llm = FakeOpenAIServer(delay=args.llm_delay).start()
+    provider = FakeModelsLabServer(delay=args.provider_delay, generation=1e9).start()
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {**os.environ, "DB_PATH": f"{tmp}/jobs.db", "REQ_DB_PATH": f"{tmp}/requests.db",
+               "BLOB_STORE_DIR": f"{tmp}/blobs", "VIDEO_PROVIDER": "modelslab",
+               "MODELSLAB_API_URL": provider.base_url, "OPENAI_BASE_URL": llm.base_url, "OPENAI_API_KEY": "bench",
+               "TWILIO_ACCOUNT_SID": "", "TWILIO_AUTH_TOKEN": "", "TWILIO_TEST_TO": "",
+               "DISPATCH_CONCURRENCY": str(args.pipeline_concurrency), "WEBHOOK_ACK_BUDGET_MS": "100000"}
+        server = subprocess.Popen([sys.executable, __file__, "--serve", str(port)], env=env)
+        try:
+            for _ in range(100):
+                try:
+                    socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+                    break
+                except OSError:
+                    time.sleep(0.1)
+            arrival = f"{args.rate:g}/s" if args.rate else "once"
+            print(f"{args.users} users choose a style at {arrival}; LLM {args.llm_delay * 1000:.0f} ms, "
+                  f"provider {args.provider_delay * 1000:.0f} ms per call\n")
+            print(f"{'mode':<10}{'reply p50 ms':>14}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}"
+                  f"{'> 15 s':>8}{'all submitted s':>17}{'server CPU s':>14}")
+            for mode in ("inline", "fast-ack"):
+                cpu0 = cpu_seconds(server.pid)
+                r = asyncio.run(run(mode, f"http://127.0.0.1:{port}", args.users, args.rate))
+                lat = r["latencies"]
+                pct = lambda p: lat[int(p * (len(lat) - 1))] * 1000  # noqa: E731
+                late = sum(1 for x in lat if x > TWILIO_TIMEOUT_SECONDS)
+                print(f"{mode:<10}{pct(0.50):>14.1f}{pct(0.95):>9.1f}{pct(0.99):>9.1f}{lat[-1] * 1000:>9.1f}"
+                      f"{late:>8}{r['all_submitted']:>17.2f}{cpu_seconds(server.pid) - cpu0:>14.2f}")
+        finally:
+            server.terminate()
+            server.wait()
+            provider.shutdown()
+            llm.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# bench_webhook_overhead.py
+"""
+Per-request overhead of the WhatsApp webhook before any real work, with signature
+validation on. "legacy" is the old sequence: validate_request and parse_incoming each
+awaiting request.form() and building their own {k: str(v)} dict, a new RequestValidator
+per call, then a chain of `if msg in (...)` checks. "current" is read_inbound (one
+decode, cached validator, a __slots__ InboundMessage) and the WHATSAPP_COMMANDS /
+FEEDBACK_REACTIONS dict lookups. Finishes with a full POST /webhook/whatsapp through the
+ASGI app for scale.
+Usage:
+  python scripts/bench_webhook_overhead.py --requests 20000
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+from urllib.parse import urlencode
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+URL = "http://testserver/webhook/whatsapp"
+MESSAGES = ["a red fox running through fresh snow at dawn", "/status", "anime", "👍🏽", "history more", "help"]
+
+
+def _legacy_route(text: str) -> str:
+    msg = text.lower().strip()
+    if msg in ("/help", "help", "/guide", "guide"):
+        return "guide"
+    if msg in ("/status", "status"):
+        return "status"
+    if msg in ("/history", "history", "/history more", "history more"):
+        return "history"
+    if msg in ("👍", "👍🏻", "👍🏼", "👍🏽", "👍🏾", "👍🏿"):
+        return "liked"
+    elif msg in ("👎", "👎🏻", "👎🏼", "👎🏽", "👎🏾", "👎🏿"):
+        return "disliked"
+    return "prompt"
+
+
+async def main_async(args):
+    from starlette.requests import Request
+    from twilio.request_validator import RequestValidator
+    import app.integrations.twilio as tw
+    from app.main import STYLE_ALIASES, WHATSAPP_COMMANDS, FEEDBACK_REACTIONS
+
+    def request_for(i: int) -> Request:
+        params = {"From": "whatsapp:+15550001", "Body": MESSAGES[i % len(MESSAGES)],
+                  "MessageSid": f"SM{i:032d}", "WaId": "15550001", "NumMedia": "0", "AccountSid": "AC" + "0" * 32}
+        body = urlencode(params).encode()
+        signature = RequestValidator(tw.TWILIO_AUTH_TOKEN).compute_signature(URL, params)
+
+        async def receive():
+            return {"type": "http.request", "body": body, "more_body": False}
+        scope = {"type": "http", "method": "POST", "path": "/webhook/whatsapp", "scheme": "http",
+                 "server": ("testserver", 80), "query_string": b"", "root_path": "",
+                 "headers": [(b"host", b"testserver"), (b"content-type", b"application/x-www-form-urlencoded"),
+                             (b"x-twilio-signature", signature.encode())]}
+        return Request(scope, receive)
+
+    async def legacy(request: Request) -> str:
+        # validate_request + parse_incoming as they were
+        form = await request.form()
+        params = {k: str(v) for k, v in form.items()}
+        validator = RequestValidator(tw.TWILIO_AUTH_TOKEN)
+        assert validator.validate(str(request.url), params, request.headers.get("X-Twilio-Signature", ""))
+        form = await request.form()
+        data = {k: str(v) for k, v in form.items()}
+        body = (data.get("Body") or "").strip()
+        msg = body.lower().strip()
+        return STYLE_ALIASES.get(msg) or _legacy_route(body)
+
+    async def current(request: Request) -> str:
+        msg = await tw.read_inbound(request)
+        assert msg.valid
+        command = WHATSAPP_COMMANDS.get(msg.command)
+        if command is not None:
+            return command.__name__
+        liked = FEEDBACK_REACTIONS.get(msg.command)
+        return STYLE_ALIASES.get(msg.command) or ("prompt" if liked is None else str(liked))
+
+    print(f"{args.requests} requests, signature validation on\n")
+    print(f"{'stage':<28}{'legacy µs':>11}{'current µs':>12}")
+    results = {}
+    for name, fn in (("legacy", legacy), ("current", current)):
+        requests = [request_for(i) for i in range(args.requests)]   # form() is cached per request
+        t0 = time.perf_counter()
+        for r in requests:
+            await fn(r)
+        results[name] = (time.perf_counter() - t0) / args.requests * 1e6
+    print(f"{'decode + validate + route':<28}{results['legacy']:>11.1f}{results['current']:>12.1f}")
+
+    texts = [MESSAGES[i % len(MESSAGES)].lower() for i in range(args.requests)]
+    t0 = time.perf_counter()
+    for text in texts:
+        _legacy_route(text)
+    chain = (time.perf_counter() - t0) / args.requests * 1e6
+    t0 = time.perf_counter()
+    for text in texts:
+        WHATSAPP_COMMANDS.get(text) or FEEDBACK_REACTIONS.get(text)
+    table = (time.perf_counter() - t0) / args.requests * 1e6
+    print(f"{'  of which routing':<28}{chain:>11.2f}{table:>12.2f}")
+
+    params = requests[0].state.twilio_params
+    t0 = time.perf_counter()
+    for _ in range(args.requests):
+        tw.InboundMessage(params)
+    print(f"{'  InboundMessage()':<28}{'':>11}{(time.perf_counter() - t0) / args.requests * 1e6:>12.2f}")
+    print(f"\nInboundMessage: {sys.getsizeof(tw.InboundMessage({}))} bytes, no __dict__ "
+          f"({not hasattr(tw.InboundMessage({}), '__dict__')})")
+
+
+def full_app(n: int):
+    from app import db, requests_db
+    db.init_db()
+    requests_db.init_db()
+    import app.main as m
+    from fastapi.testclient import TestClient
+    from twilio.request_validator import RequestValidator
+    import app.integrations.twilio as tw
+
+    with TestClient(m.app) as client:
+        t0 = time.perf_counter()
+        for i in range(n):
+            params = {"From": f"whatsapp:+1555{i:07d}", "Body": "/guide", "MessageSid": f"SMfull{i}"}
+            sig = RequestValidator(tw.TWILIO_AUTH_TOKEN).compute_signature(URL, params)
+            client.post("/webhook/whatsapp", data=params, headers={"X-Twilio-Signature": sig})
+        per = (time.perf_counter() - t0) / n * 1e6
+    print(f"full POST /webhook/whatsapp (/guide, TestClient): {per:.0f} µs per request")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-request WhatsApp webhook decoding and routing overhead")
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--full", type=int, default=1000, help="requests through the whole app (0 to skip)")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.environ.update({"TWILIO_AUTH_TOKEN": "bench-token", "TWILIO_ACCOUNT_SID": "", "TWILIO_TEST_TO": "",
+                       "DB_PATH": f"{tmp}/jobs.db", "REQ_DB_PATH": f"{tmp}/requests.db",
+                       "BLOB_STORE_DIR": f"{tmp}/blobs", "VIDEO_PROVIDER": "mock"})
+    import logging
+    logging.disable(logging.INFO)
+    asyncio.run(main_async(args))
+    if args.full:
+        full_app(args.full)
+
+
+if __name__ == "__main__":
+    main()
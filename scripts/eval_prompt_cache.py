@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# eval_prompt_cache.py
+"""
+Replay the jobs.db history in submission order and report how many generations the
+result cache would have served with each keying strategy: raw prompt hashes (old
+behaviour), normalized hashes, and normalized + near-duplicate matching at a few
+similarity thresholds. Only jobs that succeeded populate the simulated cache.
+Usage:
+  python scripts/eval_prompt_cache.py --db jobs.db --thresholds 0.95 0.9 0.85 0.8
+Opens the database read-only.
+"""
+import os
+import sys
+import hashlib
+import argparse
+import sqlite3
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.services.prompts import prompt_hash
+from app.services.prompt_index import MinHashIndex
+
+
+def raw_hash(user_prompt: str, style: str) -> str:
+    """The cache key used before normalization."""
+    return hashlib.sha256(f"{user_prompt}|{style}".encode()).hexdigest()[:16]
+
+
+def load_history(path: str):
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    rows = conn.execute(
+        "SELECT prompt, COALESCE(style, 'cinematic'), status FROM jobs WHERE prompt IS NOT NULL ORDER BY id"
+    ).fetchall()
+    conn.close()
+    return rows
+
+
+def replay_exact(rows, key_fn) -> int:
+    seen, hits = set(), 0
+    for prompt, style, status in rows:
+        key = key_fn(prompt, style)
+        if key in seen:
+            hits += 1
+        elif status == "succeeded":
+            seen.add(key)
+    return hits
+
+
+def replay_near_dup(rows, threshold: float) -> int:
+    index = MinHashIndex(threshold)
+    seen, hits = set(), 0
+    for prompt, style, status in rows:
+        key = prompt_hash(prompt, style)
+        if key in seen or index.query(prompt, style) is not None:
+            hits += 1
+        elif status == "succeeded":
+            seen.add(key)
+            index.add(key, prompt, style)
+    return hits
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Result-cache hit rate by keying strategy")
+    parser.add_argument("--db", default=os.getenv("DB_PATH", "jobs.db"))
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.95, 0.9, 0.85, 0.8])
+    args = parser.parse_args()
+
+    rows = load_history(args.db)
+    if not rows:
+        print(f"no jobs with prompts in {args.db}")
+        return
+    total = len(rows)
+    results = [
+        ("raw hash", replay_exact(rows, raw_hash)),
+        ("normalized", replay_exact(rows, prompt_hash)),
+    ]
+    results += [(f"near-dup >= {t:.2f}", replay_near_dup(rows, t)) for t in args.thresholds]
+
+    base = results[0][1]
+    print(f"{total:,} jobs replayed from {args.db}")
+    print(f"{'strategy':<18}{'hits':>8}{'hit rate':>10}{'vs raw':>9}")
+    for name, hits in results:
+        print(f"{name:<18}{hits:>8}{hits / total:>10.1%}{hits - base:>+9}")
+
+
+if __name__ == "__main__":
+    main()
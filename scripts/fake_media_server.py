@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# fake_media_server.py
+"""
+Stand-in for a provider's output CDN: serves one file with Range/If-Range, an ETag and a
+Repr-Digest (sha-256), plus fault injection to exercise the ingest stage (dropped
+connections, ignored ranges, corrupted bytes, 503s, throttling).
+Usage:
+  python scripts/fake_media_server.py --file app/static/placeholder.mp4 --port 8090 --drop-after 1000000
+  VIDEO_URL=http://127.0.0.1:8090/video.mp4
+"""
+import os
+import time
+import base64
+import hashlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+
+class FakeMediaServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, path: str, port: int = 0, drop_after: Optional[int] = None, drops: int = 1,
+                 ignore_range: bool = False, corrupt: bool = False, unavailable: int = 0,
+                 rate: Optional[float] = None):
+        super().__init__(("127.0.0.1", port), _Handler)
+        with open(path, "rb") as f:
+            self.data = f.read()
+        digest = hashlib.sha256(self.data).digest()
+        self.sha256 = digest.hex()
+        self.repr_digest = f"sha-256=:{base64.b64encode(digest).decode()}:"
+        self.etag = f'"{self.sha256[:16]}"'
+        self.drop_after = drop_after      # bytes into a response before hanging up
+        self.drops = drops                # how many responses get cut
+        self.ignore_range = ignore_range
+        self.corrupt = corrupt            # flip a byte in the body (digest no longer matches)
+        self.unavailable = unavailable    # answer this many requests with 503 first
+        self.rate = rate                  # bytes per second per response
+        self.requests = 0
+        self.range_requests = 0
+        self._lock = threading.Lock()
+
+    def handle_error(self, request, client_address):
+        pass   # dropped connections are the point
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/video.mp4"
+
+    def start(self) -> "FakeMediaServer":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        srv: FakeMediaServer = self.server
+        with srv._lock:
+            srv.requests += 1
+            if srv.unavailable > 0:
+                srv.unavailable -= 1
+                self.send_response(503)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            drop = srv.drop_after if srv.drops > 0 else None
+            if drop is not None:
+                srv.drops -= 1
+
+        data = srv.data
+        size = len(data)
+        start, end, status = 0, size - 1, 200
+        rng = self.headers.get("Range")
+        if_range = self.headers.get("If-Range")
+        if rng and not srv.ignore_range and (if_range is None or if_range == srv.etag):
+            spec = rng.split("=", 1)[1]
+            first, _, last = spec.partition("-")
+            start = int(first)
+            end = int(last) if last else size - 1
+            if start >= size:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            status = 206
+            with srv._lock:
+                srv.range_requests += 1
+
+        body = data[start:end + 1]
+        if srv.corrupt and body:
+            body = bytes([body[0] ^ 0xFF]) + body[1:]
+        self.send_response(status)
+        self.send_header("Content-Type", "video/mp4")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", srv.etag)
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Repr-Digest", srv.repr_digest)
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.end_headers()
+
+        limit = len(body) if drop is None else min(drop, len(body))
+        step = 64 * 1024
+        for offset in range(0, limit, step):
+            piece = body[offset:min(offset + step, limit)]
+            self.wfile.write(piece)
+            if srv.rate:
+                time.sleep(len(piece) / srv.rate)
+        if drop is not None:
+            self.wfile.flush()
+            self.close_connection = True
+            self.connection.shutdown(2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake provider media server with fault injection")
+    parser.add_argument("--file", default=os.path.join(os.path.dirname(__file__), "..", "app", "static", "placeholder.mp4"))
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--drop-after", type=int, help="hang up after this many body bytes")
+    parser.add_argument("--drops", type=int, default=1, help="responses to cut short")
+    parser.add_argument("--ignore-range", action="store_true")
+    parser.add_argument("--corrupt", action="store_true")
+    parser.add_argument("--unavailable", type=int, default=0, help="503 the first N requests")
+    parser.add_argument("--rate", type=float, help="bytes/s per response")
+    args = parser.parse_args()
+    server = FakeMediaServer(args.file, args.port, args.drop_after, args.drops, args.ignore_range,
+                             args.corrupt, args.unavailable, args.rate)
+    print(f"serving {server.url} ({len(server.data)} bytes, sha256 {server.sha256})")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# fake_modelslab_server.py
+"""
+Stand-in for the ModelsLab text2video API: POST /text2video returns a job with a
+fetch_url, polls report "processing" until the job's generation time has passed, then
+"success" with an output_url. Counts requests and TCP connections (to show keep-alive
+reuse) and can add per-request latency, a per-connection setup cost (standing in for the
+TCP+TLS handshake to the real API), random 503s or a full outage.
+Point the app at it with VIDEO_PROVIDER=modelslab MODELSLAB_API_URL=http://127.0.0.1:8091/v1/video
+Usage:
+  python scripts/fake_modelslab_server.py --port 8091 --delay 0.02 --generation 5
+"""
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeModelsLabServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, port: int = 0, delay: float = 0.0, generation: float = 1.0,
+                 error_rate: float = 0.0, down: bool = False, handshake: float = 0.0):
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.delay = delay                # seconds added to every response
+        self.generation = generation      # seconds from submit to success
+        self.error_rate = error_rate      # fraction of requests answered with 503
+        self.down = down                  # 503 everything
+        self.handshake = handshake        # seconds before a new connection's first response
+        self.requests = 0
+        self.connections = 0
+        self._ready_at = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def handle_error(self, request, client_address):
+        pass   # clients that time out hang up mid-response
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/v1/video"
+
+    def start(self) -> "FakeModelsLabServer":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # keep-alive, so connection reuse is visible
+
+    def log_message(self, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        with self.server._lock:
+            self.server.connections += 1
+        if self.server.handshake:
+            time.sleep(self.server.handshake)
+
+    def _reply(self, status: int, payload: dict):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _unavailable(self) -> bool:
+        srv: FakeModelsLabServer = self.server
+        with srv._lock:
+            srv.requests += 1
+        if srv.delay:
+            time.sleep(srv.delay)
+        if srv.down or (srv.error_rate and random.random() < srv.error_rate):
+            self._reply(503, {"status": "error", "message": "service unavailable"})
+            return True
+        return False
+
+    def do_POST(self):
+        srv: FakeModelsLabServer = self.server
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if self._unavailable():
+            return
+        if not self.path.endswith("/text2video"):
+            self._reply(404, {"status": "error", "message": "not found"})
+            return
+        if not body.get("prompt"):
+            self._reply(200, {"status": "error", "message": "prompt is required"})
+            return
+        with srv._lock:
+            srv._next_id += 1
+            job_id = srv._next_id
+            srv._ready_at[job_id] = time.monotonic() + srv.generation
+        base = f"http://127.0.0.1:{srv.server_address[1]}/v1/video"
+        self._reply(200, {"status": "processing", "id": job_id, "fetch_url": f"{base}/fetch/{job_id}",
+                          "eta": srv.generation})
+
+    def do_GET(self):
+        srv: FakeModelsLabServer = self.server
+        if self._unavailable():
+            return
+        _, _, tail = self.path.rpartition("/fetch/")
+        ready_at = srv._ready_at.get(int(tail)) if tail.isdigit() else None
+        if ready_at is None:
+            self._reply(404, {"status": "error", "message": "unknown job"})
+        elif time.monotonic() < ready_at:
+            self._reply(200, {"status": "processing", "id": int(tail)})
+        else:
+            self._reply(200, {"status": "success", "id": int(tail),
+                              "output_url": f"http://127.0.0.1:{srv.server_address[1]}/out/{tail}.mp4"})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake ModelsLab text2video API")
+    parser.add_argument("--port", type=int, default=8091)
+    parser.add_argument("--delay", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--generation", type=float, default=5.0, help="seconds until a job succeeds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered 503")
+    parser.add_argument("--handshake", type=float, default=0.0, help="seconds of setup per new connection")
+    args = parser.parse_args()
+    server = FakeModelsLabServer(args.port, args.delay, args.generation, args.error_rate,
+                                 handshake=args.handshake)
+    print(f"serving {server.base_url}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# fake_openai_server.py
+"""
+Minimal OpenAI-compatible chat completions server for local testing.
+Point the app at it with OPENAI_BASE_URL=http://127.0.0.1:8089/v1 (any OPENAI_API_KEY).
+Usage:
+  python scripts/fake_openai_server.py --port 8089 --delay 0.4
+"""
+import json
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port: int = 0, delay: float = 0.0):
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.delay = delay
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def handle_error(self, request, client_address):
+        pass   # clients that time out hang up mid-response; that's expected here
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+    def start(self) -> "FakeOpenAIServer":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # keep-alive, so connection reuse is visible
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if not self.path.endswith("/chat/completions"):
+            self.send_error(404)
+            return
+        with self.server._lock:
+            self.server.requests += 1
+        time.sleep(self.server.delay)
+        user = next((m["content"] for m in body.get("messages", []) if m.get("role") == "user"), "")
+        prompt = user.split("\n", 1)[0].removeprefix("Prompt: ")
+        payload = json.dumps({
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "fake"),
+            "choices": [{
+                "index": 0,
+                "finish_reason": "stop",
+                "message": {"role": "assistant", "content": f"Cinematic, detailed shot of {prompt}, smooth motion"},
+            }],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 10, "total_tokens": 20},
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake OpenAI chat completions server")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--delay", type=float, default=0.4, help="seconds per completion")
+    args = parser.parse_args()
+    server = FakeOpenAIServer(args.port, args.delay)
+    print(f"serving {server.base_url} (delay {args.delay}s)")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()